@@ -2,5 +2,9 @@ from deduce.deduce import (
     annotate_text,
     deidentify_annotations,
     annotate_text_structured,
+    iter_annotations,
+    iter_dates,
+    reannotate,
 )
+from .dates import date_shift_days
 from .__version__ import __version__
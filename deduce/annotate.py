@@ -1,23 +1,149 @@
 """ The annotate module contains the code for annotating text"""
 
-from nltk.metrics import edit_distance
-
+from .language import ALL_LANGUAGES
+from .lexicon import deletions
+from .lexicon import within_one_edit
 from .lookup_lists import *
 from .tokenizer import join_tokens
+from .utility import TokenContext
 from .utility import context
+from .utility import fold
 from .utility import is_initial
+from .utility import sub_at_word_starts
+from .utility import sub_outside_tags
+
+# The month names and age units that the rules match, per language
+MONTHS = {
+    "nl": "januari|februari|maart|april|mei|juni|juli|augustus|september|oktober|november|december",
+    "fr": "janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre",
+}
+AGE_UNITS = {"nl": "jarige|jarig|jaar", "fr": "ans"}
+
+
+def language_words(words, language=None):
+    """Join the words of a language, or of all languages if it is None, into an alternation"""
+
+    if language is not None:
+        return words[language]
+
+    return "|".join(words[language] for language in ALL_LANGUAGES)
+
+
+# Patterns for a cheap scan of the text, used to skip annotators that cannot match anything
+DIGIT_PATTERN = re.compile(r"\d")
+MONTH_PATTERN = re.compile(
+    "janvier|février|Mars|Avril|Mai|Juin|Juillet|Août|Septembre|Octobre|Novembre|Décembre",
+    flags=re.IGNORECASE,
+)
+STREET_SUFFIX_PATTERN = re.compile(
+    "straat|laan|hof|plein|plantsoen|gracht|kade|weg|steeg|pad|dijk|baan|dam|dreef|markt|park|singel|bolwerk"
+)
+STREET_PREFIX_PATTERN = re.compile(
+    "rue|avenue|chaussée|chemin|allée|enclos|route|cité|quai|square|boulevard|drève|quartier|colline|"
+    "impasse|promenade|rempart",
+    flags=re.IGNORECASE,
+)
+
+
+def scan_features(text, language=None):
+    """
+    Scan a text once for the characters and keywords that the annotators need in order to match.
+    Annotators are only skipped when these features are absent, so the output never changes.
+    Only the keywords of the rules of the language are scanned for, or of both if it is None.
+    """
+
+    has_digits = DIGIT_PATTERN.search(text) is not None
+    has_french_months = language != "nl" and MONTH_PATTERN.search(text) is not None
+
+    return {
+        "digits": has_digits,
+        "capitals": not text.islower() and any(map(str.isupper, text)),
+        "email": "@" in text,
+        "url": "." in text or "://" in text,
+        "date": has_digits or has_french_months,
+        "age": has_digits
+        and (
+            (language != "fr" and ("jaar" in text or "jarig" in text))
+            or (language != "nl" and "ans" in text)
+        ),
+        "address": (language != "fr" and STREET_SUFFIX_PATTERN.search(text) is not None)
+        or (language != "nl" and STREET_PREFIX_PATTERN.search(text) is not None),
+    }
+
+
+def has_patient_names(patient_first_names, patient_initial, patient_surname, patient_given_name):
+    """Check if any of the patient names is long enough to be used by annotate_names"""
+    return (
+        len(patient_first_names) > 1
+        or len(patient_initial) > 0
+        or len(patient_surname) > 1
+        or len(patient_given_name) > 1
+    )
+
+
+def is_sentence_start(tokens, token_index):
+    """
+    Check if a token starts a sentence: it follows the start of the text, a line break, or a
+    period, question mark, exclamation mark or colon
+    """
+
+    index = token_index - 1
+
+    while index >= 0 and tokens[index].isspace() and "\n" not in tokens[index]:
+        index -= 1
+
+    return index < 0 or "\n" in tokens[index] or tokens[index][-1] in ".!?:"
+
+
+# The letters of folded words, to generate the words within one edit of a token
+FOLDED_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def is_near_whitelisted(folded_token):
+    """
+    Check if a folded token is on the whitelist, or within one insertion, deletion,
+    substitution or transposition of a word on it, such as tabel (tafel)
+    """
+
+    splits = [(folded_token[:i], folded_token[i:]) for i in range(len(folded_token) + 1)]
+    variants = [folded_token, *deletions(folded_token)]
+    variants += [left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1]
+    variants += [
+        left + letter + right[1:] for left, right in splits if right for letter in FOLDED_LETTERS
+    ]
+    variants += [left + letter + right for left, right in splits for letter in FOLDED_LETTERS]
+
+    return any(variant in WHITELIST for variant in variants)
 
 
 def annotate_names(
-    text, patient_first_names, patient_initial, patient_surname, patient_given_name
+    text,
+    patient_first_names,
+    patient_initial,
+    patient_surname,
+    patient_given_name,
+    fuzzy_names=False,
 ):
-    """This function annotates person names, based on several rules."""
+    """
+    This function annotates person names, based on several rules. With fuzzy_names, capitalized
+    tokens that are within edit distance 1 of a name on the lookup lists are annotated as well.
+    """
 
-    # Tokenize the text
+    # Tokenize the text, and fold the tokens (used for matching)
     tokens = tokenize_split(text + " ")
+    tokens_folded = [fold(x) for x in tokens]
+    tokens_context = TokenContext(tokens)
     tokens_deid = []
     token_index = -1
 
+    # Fold the patient names once
+    first_names = str(patient_first_names).split(" ")
+    first_names_folded = [fold(x) for x in first_names]
+
+    # Surname can consist of multiple tokens, so we will match for that
+    surname_pattern = tokenize_split(patient_surname)
+    surname_pattern_folded = [fold(x) for x in surname_pattern]
+
     # Iterate over all tokens
     while token_index < len(tokens) - 1:
         # Current position
@@ -25,10 +151,11 @@ def annotate_names(
 
         # Current token, and number of tokens already deidentified (used to detect changes)
         token = tokens[token_index]
+        folded_token = tokens_folded[token_index]
         num_tokens_deid = len(tokens_deid)
 
         # The context of this token
-        (_, _, next_token, next_token_index) = context(tokens, token_index)
+        (_, _, next_token, next_token_index) = tokens_context(token_index)
 
         ### Prefix based detection
         # Check if the token is a prefix, and the next token starts with a capital
@@ -56,7 +183,7 @@ def annotate_names(
             and next_token != ""
             and len(next_token) > 2
             and next_token in INTERFIX_SURNAMES
-            and next_token.lower() not in WHITELIST
+            and tokens_folded[next_token_index] not in WHITELIST
         )
 
         # If condition is met, tag the tokens and continue to the new position
@@ -76,7 +203,7 @@ def annotate_names(
             found = False
 
             # Voornamen
-            for patient_first_name in str(patient_first_names).split(" "):
+            for patient_first_name, folded_first_name in zip(first_names, first_names_folded):
                 # Check if the initials match
                 if token == patient_first_name[0]:
                     # If followed by a period, also annotate the period
@@ -88,6 +215,7 @@ def annotate_names(
                             token_index += 1
                         else:
                             tokens[token_index + 1] = tokens[token_index + 1][1:]
+                            tokens_folded[token_index + 1] = fold(tokens[token_index + 1])
 
                     # Else, annotate the token itself
                     else:
@@ -99,10 +227,8 @@ def annotate_names(
 
                 # Check that either an exact match exists, or a fuzzy match
                 # if the token has more than 3 characters
-                first_name_condition = token.lower() == patient_first_name.lower() or (
-                    len(token) > 3
-                    and edit_distance(token.lower(), patient_first_name.lower(), transpositions=True)
-                    <= 1
+                first_name_condition = folded_token == folded_first_name or (
+                    len(token) > 3 and within_one_edit(folded_token, folded_first_name)
                 )
 
                 # If the condition is met, tag the token and move on
@@ -124,16 +250,13 @@ def annotate_names(
         ### Surname
         if len(patient_surname) > 1:
 
-            # Surname can consist of multiple tokens, so we will match for that
-            surname_pattern = tokenize_split(patient_surname)
-
             # Iterate over all tokens in the pattern
             counter = 0
             match = False
 
             # See if there is a fuzzy match, and if there are enough tokens left
             # to match the rest of the pattern
-            if edit_distance(token.lower(), surname_pattern[0].lower(), transpositions=True) <= 1 and (
+            if within_one_edit(folded_token, surname_pattern_folded[0]) and (
                 token_index + len(surname_pattern)
             ) < len(tokens):
                 # Found a match
@@ -143,13 +266,8 @@ def annotate_names(
                 while counter < len(surname_pattern):
 
                     # If the distance is too big, disgregard the match
-                    if (
-                        edit_distance(
-                            tokens[token_index + counter].lower(),
-                            surname_pattern[counter].lower(),
-                            transpositions=True,
-                        )
-                        > 1
+                    if not within_one_edit(
+                        tokens_folded[token_index + counter], surname_pattern_folded[counter]
                     ):
 
                         match = False
@@ -170,11 +288,7 @@ def annotate_names(
         # or fuzzily when more than 3 characters long
         given_name_condition = len(patient_given_name) > 1 and (
             token == patient_given_name
-            or (
-                len(token) > 3
-                and edit_distance(token, str(patient_given_name), transpositions=True)
-                <= 1
-            )
+            or (len(token) > 3 and within_one_edit(token, str(patient_given_name)))
         )
 
         # If match, tag the token and continue
@@ -183,16 +297,39 @@ def annotate_names(
             continue
 
         ### Unknown first and last names
-        # For both first and last names, check if the token
-        # is on the lookup list and not on the whitelist
-        if token in FIRST_NAMES and token.lower() not in WHITELIST:
+        # For both first and last names, check if the token starts with a capital,
+        # is on the lookup list and not on the whitelist. A first name in capitals
+        # is usually an abbreviation, such as CHU
+        name_condition = token[0].isupper() and folded_token not in WHITELIST
+
+        if name_condition and not token.isupper() and folded_token in FIRST_NAMES:
             tokens_deid.append(f"<FORNAMEUNKNOWN {token}>")
             continue
 
-        if token[0].isupper() and token.lower() in SURNAMES and token.lower() not in WHITELIST:
+        if name_condition and folded_token in SURNAMES:
             tokens_deid.append(f"<SURNAMEUNKNOWN {token}>")
             continue
 
+        ### Misspelled first and last names
+        # Optionally, match capitalized tokens of more than 3 characters that are
+        # within edit distance 1 of a name on the lookup lists. Capitalized words at
+        # the start of a sentence and misspelled common words are not names.
+        if fuzzy_names and len(token) > 3 and name_condition:
+            fuzzy_tag = None
+
+            if not token.isupper() and FIRST_NAMES.has_near(folded_token):
+                fuzzy_tag = "FORNAMEUNKNOWN"
+            elif SURNAMES.has_near(folded_token):
+                fuzzy_tag = "SURNAMEUNKNOWN"
+
+            if (
+                fuzzy_tag is not None
+                and not is_sentence_start(tokens, token_index)
+                and not is_near_whitelisted(folded_token)
+            ):
+                tokens_deid.append(f"<{fuzzy_tag} {token}>")
+                continue
+
         ### Wrap up
         # Nothing has been added (ie no deidentification tag) to tokens_deid,
         # so we can safely add the token itself
@@ -208,6 +345,7 @@ def annotate_names_context(text):
 
     # Tokenize text and initiate a list of deidentified tokens
     tokens = tokenize_split(text + " ")
+    tokens_context = TokenContext(tokens)
     tokens_deid = []
     token_index = -1
 
@@ -224,15 +362,15 @@ def annotate_names_context(text):
         numtokens_deid = len(tokens_deid)
 
         # Context of the token
-        (previous_token, previous_token_index, next_token, next_token_index) = context(
-            tokens, token_index
+        (previous_token, previous_token_index, next_token, next_token_index) = tokens_context(
+            token_index
         )
 
         ### Initial or unknown capitalized word, detected by a name or surname that is behind it
         # If the token is an initial, or starts with a capital
         initial_condition = (
             is_initial(token)
-            or (token != "" and token[0].isupper() and token.lower() not in WHITELIST)
+            or (token != "" and token[0].isupper() and fold(token) not in WHITELIST)
         ) and (
             # And the token is followed by either a
             # found surname, interfix or initial
@@ -257,7 +395,7 @@ def annotate_names_context(text):
                 and next_token != ""
                 and len(next_token) > 2
                 and next_token in INTERFIX_SURNAMES
-                and next_token.lower() not in WHITELIST
+                and fold(next_token) not in WHITELIST
         )
 
         # If the condition is met, tag the tokens and continue
@@ -267,7 +405,7 @@ def annotate_names_context(text):
                 tokens_deid, len(tokens_deid)
             )
             deid_tokens_to_keep = tokens_deid[previous_token_index_deid:]
-            tokens_deid = tokens_deid[:previous_token_index_deid]
+            del tokens_deid[previous_token_index_deid:]
             tokens_deid.append(
                 "<INTERFIXSURNAME {}>".format(
                     join_tokens(deid_tokens_to_keep + tokens[token_index:next_token_index + 1])
@@ -288,14 +426,18 @@ def annotate_names_context(text):
             )
             and len(next_token) > 3
             and next_token[0].isupper()
-            and next_token.lower() not in WHITELIST
-            and (next_token in SURNAMES
-                 or next_token in FIRST_NAMES
-                 or next_token in INTERFIX_SURNAMES
-                 )
-
         )
 
+        # And the next token is a known name that is not on the whitelist (folded once, and
+        # only for the few tokens that get this far)
+        if initial_name_condition:
+            folded_next_token = fold(next_token)
+            initial_name_condition = folded_next_token not in WHITELIST and (
+                folded_next_token in SURNAMES
+                or folded_next_token in FIRST_NAMES
+                or next_token in INTERFIX_SURNAMES
+            )
+
         # If a match is found, tag and continue
         if initial_name_condition:
             tokens_deid.append(
@@ -320,7 +462,7 @@ def annotate_names_context(text):
             (previous_token_deid, previous_token_index_deid, _, _) = context(
                 tokens_deid, len(tokens_deid)
             )
-            tokens_deid = tokens_deid[:previous_token_index_deid]
+            del tokens_deid[previous_token_index_deid:]
             tokens_deid.append(
                 f"<MULTIPLEPERSON {join_tokens([previous_token_deid] + tokens[previous_token_index + 1 : next_token_index + 1])}>"
             )
@@ -352,8 +494,9 @@ def annotate_names_context(text):
 def annotate_residence(text):
     """Annotate residences"""
 
-    # Tokenize text
+    # Tokenize text, and fold the tokens (used for matching)
     tokens = tokenize_split(text)
+    tokens_folded = [fold(x) for x in tokens]
     tokens_deid = []
     token_index = -1
 
@@ -364,8 +507,13 @@ def annotate_residence(text):
         token_index = token_index + 1
         token = tokens[token_index]
 
-        # Find all tokens that are prefixes of the remainder of the text
-        prefix_matches = RESIDENCES_TRIE.find_all_prefixes(tokens[token_index:])
+        # Find all tokens that are prefixes of the remainder of the folded text, of which a
+        # token starts with a capital, as residences are names
+        prefix_matches = [
+            match
+            for match in RESIDENCES_TRIE.find_all_prefixes(tokens_folded, token_index)
+            if any(x[:1].isupper() for x in tokens[token_index : token_index + len(match)])
+        ]
 
         # If none, just append the current token and move to the next
         if len(prefix_matches) == 0:
@@ -374,7 +522,9 @@ def annotate_residence(text):
 
         # Else annotate the longest sequence as residence
         max_list = max(prefix_matches, key=len)
-        tokens_deid.append(f"<LOCATION {join_tokens(max_list)}>")
+        tokens_deid.append(
+            f"<LOCATION {join_tokens(tokens[token_index : token_index + len(max_list)])}>"
+        )
         token_index += len(max_list) - 1
 
     # Return the de-identified text
@@ -408,9 +558,10 @@ def replace_altrecht_text(match: re.Match) -> str:
 def annotate_institution(text):
     """Annotate institutions"""
 
-    # Tokenize, and make a list of non-capitalized tokens (used for matching)
+    # Tokenize, and make lists of folded and normalized tokens (used for matching)
     tokens = tokenize_split(text)
-    tokens_lower = [x.lower() for x in tokens]
+    tokens_folded = [fold(x) for x in tokens]
+    tokens_normalized = [normalize_institution_token(x) for x in tokens_folded]
     tokens_deid = []
     token_index = -1
 
@@ -424,8 +575,15 @@ def annotate_institution(text):
         if token_index < 0 or (tokens[token_index-1] + " " + token).lower() != "examen clinique" \
                 or (token + " " + tokens[token_index + 1]).lower() != "examen clinique":
 
-            # Find all tokens that are prefixes of the remainder of the lowercasetext
-            prefix_matches = INSTITUTION_TRIE.find_all_prefixes(tokens_lower[token_index:])
+            # Find all tokens that are prefixes of the remainder of the normalized text
+            prefix_matches = INSTITUTION_TRIE.find_all_prefixes(tokens_normalized, token_index)
+
+            # Discard matches that are on the whitelist in the form they appear in the text
+            prefix_matches = [
+                match
+                for match in prefix_matches
+                if join_tokens(tokens_folded[token_index : token_index + len(match)]) not in WHITELIST
+            ]
 
             # If none, just append the current token and move to the next
             if len(prefix_matches) == 0:
@@ -453,7 +611,7 @@ def annotate_institution(text):
                   flags=re.IGNORECASE)
 
     # Detect the pattern <INSTITUTION ... > <PERSON st name> and convert to <INSTITUTION Saint-Name>
-    text = re.sub('<INSTITUTION (\w* ?)*> <PERSON (saint|sint|st|st.)',
+    text = re.sub('<INSTITUTION [\w ]*> <PERSON (saint|sint|st|st.)',
                   lambda pattern: "".join(pattern.group().split("> <PERSON")),
                   text,
                   flags=re.IGNORECASE)
@@ -469,22 +627,30 @@ def get_date_replacement_(date_match: re.Match, punctuation_name: str) -> str:
 
 ### Other annotation is done using a selection of finely crafted
 ### (but alas less finely documented) regular expressions.
-def annotate_date(text):
+def annotate_date(text, language=None):
+    """Annotate dates, with the month names of the language, or of both if it is None"""
+
     # Name the punctuation mark that comes after a date, for replacement purposes
     punctuation_name = 'n'
 
-    text = re.sub("""(?ix) (0?[1-9]|[12]\d|3[01])\s?[\/]\s?[012]\d(\s?[\/]\s?(19|20)?\d{2})?|
-    (0?[1-9]|[12]\d|3[01])\s?\.\s?\d{2}(\s?\.\s?\d{2,4})|
+    pattern = r"""(?ix) (0?[1-9]|[12]\d|3[01])\s?[\/]\s?[012]\d(\s?[\/]\s?(19|20)?\d{2})?|
+    (0?[1-9]|[12]\d|3[01])\s?\.\s?\d{2}(\s?\.\s?\d{2,4})"""
+
+    # The dates with French day and month names
+    if language != "nl":
+        pattern += r"""|
     (((Lundi|Mardi|Mercredi|Jeudi|Vendredi|Samedi|Dimanche))?
     (\d{1,2}\s)?(janvier|février|Mars|Avril|Mai|Juin|Juillet|Août|Septembre|Octobre|Novembre|Décembre)
-    [\s\n\r\.,](\d{2,4})?)""",
+    [\s\n\r\.,](\d{2,4})?)"""
+
+    text = re.sub(pattern,
                   lambda date_match: '<DATE ' + date_match.group() + '>',
                   text)
 
-    text = re.sub("(\d{1,2}[^\w]{,2}(januari|februari|maart|april|mei|juni|juli|augustus|september|oktober|november|december|janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre)([- /.]{,2}(\d{4}|\d{2})){,1})(?P<" +
-                  punctuation_name + ">\D)(?![^<]*>)",
-                  lambda date_match: get_date_replacement_(date_match, punctuation_name),
-                  text)
+    text = sub_outside_tags("(\d{1,2}[^\w]{,2}(" + language_words(MONTHS, language) + ")([- /.]{,2}(\d{4}|\d{2})){,1})(?P<" +
+                            punctuation_name + ">\D)",
+                            lambda date_match: get_date_replacement_(date_match, punctuation_name),
+                            text)
 
     text = re.sub("(19|20)\d{2}",
                   lambda date_match: '<DATE ' + date_match.group() + '>',
@@ -499,10 +665,10 @@ def annotate_date(text):
     return text
 
 
-def annotate_age(text):
-    """Annotate ages"""
-    text = re.sub(
-        "(\d{1,3})([ -](jarige|jarig|jaar|ans))(?![^<]*>)", "<AGE \\1>\\2", text
+def annotate_age(text, language=None):
+    """Annotate ages, with the units of the language, or of both if it is None"""
+    text = sub_outside_tags(
+        "(\d{1,3})([ -](" + language_words(AGE_UNITS, language) + "))", "<AGE \\1>\\2", text
     )
     return text
 
@@ -517,19 +683,19 @@ def annotate_phonenumber(text):
     )
 
     # Dutch phone number
-    text = re.sub(
-        "(((0)[1-9]{2}[0-9][-]?[1-9][0-9]{5})|((\\+31|0|0031)[1-9][0-9][-]?[1-9][0-9]{6}))(?![^<]*>)",
+    text = sub_outside_tags(
+        "(((0)[1-9]{2}[0-9][-]?[1-9][0-9]{5})|((\\+31|0|0031)[1-9][0-9][-]?[1-9][0-9]{6}))",
         lambda phone_match: '<PHONENUMBER ' + phone_match.group() + '>',
         text,
     )
-    text = re.sub(
-        "(((\\+31|0|0031)6){1}[-]?[1-9]{1}[0-9]{7})(?![^<]*>)",
+    text = sub_outside_tags(
+        "(((\\+31|0|0031)6){1}[-]?[1-9]{1}[0-9]{7})",
         lambda phone_match: '<PHONENUMBER ' + phone_match.group() + '>',
         text,
     )
 
-    text = re.sub(
-        "((\(\d{3}\)|\d{3})\s?\d{3}\s?\d{2}\s?\d{2})(?![^<]*>)",
+    text = sub_outside_tags(
+        "((\(\d{3}\)|\d{3})\s?\d{3}\s?\d{2}\s?\d{2})",
         lambda phone_match: '<PHONENUMBER ' + phone_match.group() + '>',
         text,
     )
@@ -543,25 +709,58 @@ def annotate_patientnumber(text, patient_id):
     if len(patient_id) >= 4:
         text = re.sub(patient_id, lambda patient_num : "<PATIENTNUMBER " + patient_num.group() + ">", text, re.IGNORECASE)
 
-    text = re.sub("(\d{7,9})(?![^<]*>)", "<PATIENTNUMBER \\1>", text)
+    text = sub_outside_tags("(\d{7,9})", "<PATIENTNUMBER \\1>", text)
     return text
 
 
-def annotate_postalcode(text):
-    """Annotate postal codes"""
-    text = re.sub(
-        "(((\d{4} [A-Z]{2})|(\d{4}[a-zA-Z]{2})))(?P<n>\W)(?![^<]*>)",
-        lambda post_code: "<LOCATION " + post_code.group() + ">",
-        text,
-    )
+# A postal code: four digits that are not part of a number, followed by two capitals for a
+# Dutch postal code (see postcodes.split_postcode())
+POSTCODE_PATTERN = r"(?<![\w.,/-])[1-9]\d{3}(?: ?[A-Z]{2})?(?!\w|[.,]\d)"
 
-    # Belgium postcode
-    text = re.sub(
-        "(?:(?:[1-9])(?:\d{3}))(?!\.?\d?(\s?(m|mc|µ|c)(l|g)))",
-        lambda post_code: "<LOCATION " + post_code.group() + ">",
-        text,
-    )
-    text = re.sub("<LOCATION\s(\d{4}mg)>", "\\1", text)
+# A dosage unit after a number, such as 1600 mg, which is not a postal code
+DOSAGE_UNIT_PATTERN = re.compile(r"\s?(?:m|mc|µ|c)?[lg]\b")
+
+# An annotated residence right after a postal code (1000 Brussel), or right before it, but
+# then not across a comma (Brussel 1000, but not Gent, 2500 patiënten)
+RESIDENCE_AFTER_PATTERN = re.compile(r"[ ,]*<LOCATION ([^<>]+)>")
+RESIDENCE_BEFORE_PATTERN = re.compile(r"<LOCATION ([^<>]+)> ?\Z")
+
+
+def get_neighboring_residence(text, start, end):
+    """The annotated residence right after or right before a span of a text, or None"""
+
+    match = RESIDENCE_AFTER_PATTERN.match(text, end)
+
+    if match is None:
+        match = RESIDENCE_BEFORE_PATTERN.search(text[max(0, start - 100) : start])
+
+    return match.group(1) if match else None
+
+
+def annotate_postalcode(text, require_residence=False):
+    """
+    Annotate the numbers with the structure of a Belgian or Dutch postal code. Only when the
+    postal code index (lookup_lists.POSTCODES) is not empty, which needs the optional
+    postcodes.lst, are they checked to exist. With require_residence, only the postal codes
+    next to an annotated residence (such as 1000 <LOCATION Brussel>) are annotated, and with a
+    non-empty index only if the residence is a municipality of the code.
+    """
+
+    def get_replacement(match):
+        code = match.group(0)
+
+        if not POSTCODES.is_valid(code) or DOSAGE_UNIT_PATTERN.match(match.string, match.end()):
+            return code
+
+        if require_residence:
+            residence = get_neighboring_residence(match.string, match.start(), match.end())
+
+            if residence is None or not POSTCODES.matches_municipality(code, residence):
+                return code
+
+        return f"<LOCATION {code}>"
+
+    text = sub_outside_tags(POSTCODE_PATTERN, get_replacement, text)
     text = re.sub("([Pp]ostbus\s\d{5})", "<LOCATION \\1>", text)
     return text
 
@@ -575,23 +774,133 @@ def get_address_match_replacement(match: re.Match) -> str:
     return f"<LOCATION {stripped}>{' ' * (len(text) - len(stripped))}"
 
 
-def annotate_address(text):
-    """Annotate addresses"""
-    text = re.sub(
-        r"([A-Z]\w+(straat|laan|hof|plein|plantsoen|gracht|kade|weg|steeg|steeg|pad|dijk|baan|dam|dreef|"
-        r"kade|markt|park|plantsoen|singel|bolwerk)[\s\n\r]((\d+){1,6}(\w{0,2})?|(\d+){0,6}))",
-        get_address_match_replacement,
-        text,
-    )
+# The Dutch addresses, such as Kerkstraat 12a, where a street suffix ends the first word
+DUTCH_ADDRESS_PATTERN = re.compile(
+    r"([A-Z]\w+(straat|laan|hof|plein|plantsoen|gracht|kade|weg|steeg|steeg|pad|dijk|baan|dam|dreef|"
+    r"kade|markt|park|plantsoen|singel|bolwerk)[\s\n\r]((\d+)(\w{0,2})?|(\d*)))"
+)
+
+# The French addresses, such as 12 rue de la Loi, where a street prefix precedes the name
+FRENCH_ADDRESS_PATTERN = re.compile(
+    r"(((\d+)(\w{0,2})?|(\d*)))\s?(rue|avenue|chaussée|chemin|allée|enclos|route|cité|quai|"
+    r"square|boulevard|drève|quartier|colline|impasse|promenade|rempart)"
+    r"(\s(d'|de|du|des|l'|le|la|les))*\s*,?\s*[A-Z]\w+\s*,?\s*(((\d+)(\w{0,2})?|(\d*)))",
+    flags=re.IGNORECASE,
+)
+
+# The street suffixes at the end of a word, and the positions of all street prefixes, which
+# may overlap
+STREET_SUFFIX_END_PATTERN = re.compile(f"(?:{STREET_SUFFIX_PATTERN.pattern})(?=\\s)")
+STREET_PREFIX_START_PATTERN = re.compile(
+    f"(?=(?:{STREET_PREFIX_PATTERN.pattern}))", flags=re.IGNORECASE
+)
+
+
+def is_word_character(character):
+    """Check if a character matches \\w"""
+    return character.isalnum() or character == "_"
+
+
+def find_dutch_addresses(text):
+    """
+    Find the Dutch addresses in a text, with the same result as DUTCH_ADDRESS_PATTERN.finditer()
+    but only matching the pattern at the words that end in a street suffix, from the first
+    capital in the word that leaves a character before the suffix.
+    """
+
+    last_end = 0
+
+    for suffix in STREET_SUFFIX_END_PATTERN.finditer(text):
+
+        suffix_start = suffix.start()
+
+        if suffix_start < last_end:
+            continue
+
+        # The start of the word, or of the part of it after the previous address
+        word_start = suffix_start
+
+        while word_start > last_end and is_word_character(text[word_start - 1]):
+            word_start -= 1
+
+        for start in range(word_start, suffix.end() - 2):
+            if "A" <= text[start] <= "Z":
+                match = DUTCH_ADDRESS_PATTERN.match(text, start)
+
+                if match:
+                    yield match
+                    last_end = match.end()
+                    break
+
+
+def find_french_addresses(text):
+    """
+    Find the French addresses in a text, with the same result as
+    FRENCH_ADDRESS_PATTERN.finditer() but only matching the pattern just before the street
+    prefixes. An address can start with a house number (digits, two more word characters and
+    a whitespace character) before the prefix, so the pattern is matched from the start of
+    that number, at most once per position. Within a run of digits, only its first position
+    is matched, since the pattern cannot match from a later digit if it did not match there.
+    """
+
+    last_end = 0
+    next_start = 0
+
+    for prefix in STREET_PREFIX_START_PATTERN.finditer(text):
+
+        prefix_start = prefix.start()
+
+        if prefix_start < last_end:
+            continue
+
+        # The earliest start of a house number before the prefix
+        first_start = max(prefix_start - 3, last_end)
+
+        while first_start > last_end and text[first_start - 1].isdecimal():
+            first_start -= 1
+
+        for start in range(max(first_start, next_start), prefix_start + 1):
+            if start > first_start and text[start - 1].isdecimal():
+                continue
+
+            match = FRENCH_ADDRESS_PATTERN.match(text, start)
+
+            if match:
+                yield match
+                last_end = match.end()
+                break
+
+        next_start = max(prefix_start + 1, last_end)
+
+
+def replace_matches(text, matches, get_replacement):
+    """Replace non-overlapping matches in a text, in order, like re.sub()"""
+
+    parts = []
+    last_end = 0
+
+    for match in matches:
+        parts.append(text[last_end : match.start()])
+        parts.append(get_replacement(match))
+        last_end = match.end()
+
+    if not parts:
+        return text
+
+    parts.append(text[last_end:])
+
+    return "".join(parts)
+
+
+def annotate_address(text, language=None):
+    """Annotate addresses, with the street patterns of the language, or of both if it is None"""
+
+    if language != "fr":
+        text = replace_matches(text, find_dutch_addresses(text), get_address_match_replacement)
+
+    if language != "nl":
+        text = replace_matches(text, find_french_addresses(text), get_address_match_replacement)
 
-    text = re.sub(
-        r"(((\d+){1,6}(\w{0,2})?|(\d+){0,6}))\s?(rue|avenue|chaussée|chemin|allée|enclos|route|cité|quai|"
-        r"square|boulevard|drève|quartier|colline|impasse|promenade|rempart)"
-        r"(\s(d'|de|du|des|l'|le|la|les))*\s*,?\s*[A-Z]\w+\s*,?\s*(((\d+){1,6}(\w{0,2})?|(\d+){0,6}))",
-        get_address_match_replacement,
-        text,
-        flags=re.IGNORECASE,
-    )
     return text
 
 
@@ -609,17 +918,19 @@ def annotate_email(text):
         text
     )
 
-    text = re.sub(
+    text = sub_at_word_starts(
         "[\w\d!#$%&'*+-/=?^_`{|}~]*<URL ",
         merge_mail,
         text,
+        word_start=r"(?<![\w\d!#$%&'*+-/=?^_`{|}~])",
     )
 
-    text = re.sub(
-        "(([\w-]+(?:\.[\w-]+)*)@((?:[\w-]+\.)*\w[\w-]{0,66})\.([a-z]{2,6}(?:\.[a-z]{2})?))(?![^<]*>)",
+    text = sub_outside_tags(
+        "(([\w-]+(?:\.[\w-]+)*)@((?:[\w-]+\.)*\w[\w-]{0,66})\.([a-z]{2,6}(?:\.[a-z]{2})?))",
         "<URL \\1>",
         text,
         flags=re.IGNORECASE,
+        word_start=r"(?<![\w-])(?<![\w-]\.)",
     )
 
     return text
@@ -627,14 +938,17 @@ def annotate_email(text):
 
 def annotate_url(text):
     """Annotate urls"""
-    text = re.sub(
-        "((?!mailto:)(?:(?:http|https|ftp)://)(?:\\S+(?::\\S*)?@)?(?:(?:(?:[1-9]\\d?|1\\d\\d|2[01]\\d|22[0-3])(?:\\.(?:1?\\d{1,2}|2[0-4]\\d|25[0-5])){2}(?:\\.(?:[0-9]\\d?|1\\d\\d|2[0-4]\\d|25[0-4]))|(?:(?:[a-z\\u00a1-\\uffff0-9]+-?)*[a-z\\u00a1-\\uffff0-9]+)(?:\\.(?:[a-z\\u00a1-\\uffff0-9]+-?)*[a-z\\u00a1-\\uffff0-9]+)*(?:\\.(?:[a-z\\u00a1-\\uffff]{2,})))|localhost)(?::\\d{2,5})?(?:(/|\\?|#)[^\\s]*)?)(?![^<]*>)",
+    text = sub_outside_tags(
+        "((?!mailto:)(?:(?:http|https|ftp)://)(?:\\S+@)?(?:(?:(?:[1-9]\\d?|1\\d\\d|2[01]\\d|22[0-3])(?:\\.(?:1?\\d{1,2}|2[0-4]\\d|25[0-5])){2}(?:\\.(?:[0-9]\\d?|1\\d\\d|2[0-4]\\d|25[0-4]))|(?:[a-z\\u00a1-\\uffff0-9]+(?:-[a-z\\u00a1-\\uffff0-9]+)*)(?:\\.[a-z\\u00a1-\\uffff0-9]+(?:-[a-z\\u00a1-\\uffff0-9]+)*)*(?:\\.(?:[a-z\\u00a1-\\uffff]{2,})))|localhost)(?::\\d{2,5})?(?:(/|\\?|#)[^\\s]*)?)",
         "<URL \\1>",
         text,
     )
 
-    text = re.sub(
-        "([\w\d\.-]{3,}(\.)(nl|com|net|be)(/[^\s]+){,1})(?![^<]*>)", "<URL \\1>", text
+    text = sub_outside_tags(
+        "([\w\d\.-]{3,}(\.)(nl|com|net|be)(/[^\s]+){,1})",
+        "<URL \\1>",
+        text,
+        word_start=r"(?<![\w\d\.-])",
     )
 
     return text
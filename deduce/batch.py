@@ -0,0 +1,257 @@
+"""
+The batch module annotates the texts in a pandas DataFrame or pyarrow Table, with optional
+columns of patient metadata, in parallel, in worker processes or in worker threads that share
+the lexicons. pandas and pyarrow are only imported when a table
+of that type is passed in, so neither is required to use the rest of deduce.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import lookup_lists, utility
+from .deduce import annotate_text, deidentify_annotations, has_nested_tags
+
+# The arguments of annotate_text() that are read from the table, if it has these columns
+PATIENT_COLUMNS = (
+    "patient_first_names",
+    "patient_initials",
+    "patient_surname",
+    "patient_given_name",
+    "patient_id",
+)
+
+# The columns of the table of spans
+SPAN_COLUMNS = ("row", "tag", "start", "end", "text")
+
+
+def get_spans(text, annotated_text):
+    """
+    Get the (tag, start, end, text) of all tags in the annotated text, with offsets pointing to
+    the original text. Like annotate_text_structured(), this does not handle nested tags, so
+    none are returned for a text with nested tags.
+    """
+
+    tags = utility.find_tags(annotated_text)
+
+    if not tags or has_nested_tags(annotated_text):
+        return []
+
+    annotations = utility.get_annotations(
+        annotated_text, tags, utility.get_first_non_whitespace(text)
+    )
+
+    return [
+        (annotation.tag, annotation.start_ix, annotation.end_ix, annotation.text_)
+        for annotation in annotations
+    ]
+
+
+def _is_missing(value):
+    """Check if a value is missing: None, NaN, or pandas.NA or NaT"""
+
+    if value is None:
+        return True
+
+    try:
+        return bool(value != value)
+    except TypeError:
+        # The truth value of pandas.NA is ambiguous
+        return True
+
+
+def as_patient_value(value):
+    """
+    Convert a value of patient metadata to the string that annotate_text() expects. Missing
+    values are empty strings, and other values, such as a patient id stored as a number, are
+    converted to strings (a float without a fraction, as in a pandas column with NaN, as an int).
+    """
+
+    if isinstance(value, str):
+        return value
+
+    if _is_missing(value):
+        return ""
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return str(value)
+
+
+def _as_scope(value):
+    """Scopes can be ids of any type, missing values (None or NaN) share the empty scope"""
+    return "" if _is_missing(value) else str(value)
+
+
+@lookup_lists.reads_lexicons
+def annotate_rows(texts, patients, row_offset=0, pseudonym_store=None, scopes=None, **kwargs):
+    """
+    Annotate and deidentify a list of texts, with a dict of patient metadata lists. Returns
+    the annotated texts, the deidentified texts, and a dict of span columns. Texts that are not
+    strings (None or NaN) are returned as None. With a pseudonym store, the texts are
+    deidentified with the ids in the store, in the scope of the same row in scopes. The lexicons
+    are not updated while the texts are annotated.
+    """
+
+    annotated_texts = []
+    deidentified_texts = []
+    spans = {column: [] for column in SPAN_COLUMNS}
+
+    for index, text in enumerate(texts):
+
+        if not isinstance(text, str):
+            annotated_texts.append(None)
+            deidentified_texts.append(None)
+            continue
+
+        patient = {key: as_patient_value(values[index]) for key, values in patients.items()}
+        annotated_text = annotate_text(text, **patient, **kwargs)
+
+        scope = _as_scope(scopes[index]) if scopes is not None else ""
+
+        annotated_texts.append(annotated_text)
+        deidentified_texts.append(
+            deidentify_annotations(annotated_text, pseudonym_store, scope)
+        )
+
+        for tag, start, end, span_text in get_spans(text, annotated_text):
+            spans["row"].append(row_offset + index)
+            spans["tag"].append(tag)
+            spans["start"].append(start)
+            spans["end"].append(end)
+            spans["text"].append(span_text)
+
+    return annotated_texts, deidentified_texts, spans
+
+
+def _annotate_chunk(arguments):
+    """Unpack the arguments of a chunk, for use with Executor.map()"""
+    texts, patients, row_offset, pseudonym_store, scopes, kwargs = arguments
+    return annotate_rows(texts, patients, row_offset, pseudonym_store, scopes, **kwargs)
+
+
+def _is_arrow_table(table):
+    return type(table).__module__.startswith("pyarrow")
+
+
+def annotate_table(
+    table,
+    text_column="text",
+    patient_columns=None,
+    processes=None,
+    chunk_size=1000,
+    pseudonym_store=None,
+    scope_column=None,
+    threads=None,
+    **kwargs,
+):
+    """
+    Annotate the texts in a pandas DataFrame or pyarrow Table.
+
+    :param table: a pandas DataFrame or pyarrow Table
+    :param text_column: the name of the column with texts
+    :param patient_columns: a dict from annotate_text() arguments (such as patient_surname) to
+    column names. By default, the columns named after these arguments are used, if present
+    :param processes: the number of worker processes, by default the number of CPUs. With 1,
+    the texts are annotated in the current process
+    :param chunk_size: the number of rows that is sent to a worker at once
+    :param pseudonym_store: a PseudonymStore with a path, to give the values in tags the same
+    ids across rows (and across calls), or None to number them per text
+    :param scope_column: the name of the column with the scope of the ids in the pseudonym
+    store, such as a patient or dataset id. By default, all rows share one scope
+    :param threads: the number of worker threads, used instead of worker processes. The threads
+    share one copy of the lexicons and the pseudonym store (which then needs no path), but
+    only annotate in parallel on a free-threaded Python build
+    :param kwargs: other arguments for annotate_text(), such as dates=False
+    :return: a table with the columns annotated and deidentified (in the same row order, and
+    for pandas with the same index), and a table of spans with the columns row, tag, start, end
+    and text. For pandas, row is the index label of the row, otherwise its position.
+    """
+
+    arrow = _is_arrow_table(table)
+    column_names = table.column_names if arrow else table.columns
+
+    if patient_columns is None:
+        patient_columns = {name: name for name in PATIENT_COLUMNS if name in column_names}
+
+    # Convert the columns to lists once, instead of accessing the table per row
+    def to_list(column_name):
+        column = table.column(column_name) if arrow else table[column_name]
+        return column.to_pylist() if arrow else column.tolist()
+
+    texts = to_list(text_column)
+    patients = {key: to_list(name) for key, name in patient_columns.items()}
+    scopes = to_list(scope_column) if scope_column is not None else None
+
+    chunks = [
+        (
+            texts[start : start + chunk_size],
+            {key: values[start : start + chunk_size] for key, values in patients.items()},
+            start,
+            pseudonym_store,
+            scopes[start : start + chunk_size] if scopes is not None else None,
+            kwargs,
+        )
+        for start in range(0, len(texts), chunk_size)
+    ]
+
+    if threads is not None:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return _build_tables(table, arrow, executor.map(_annotate_chunk, chunks))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes == 1 or len(chunks) <= 1:
+        results = map(_annotate_chunk, chunks)
+        return _build_tables(table, arrow, results)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return _build_tables(table, arrow, executor.map(_annotate_chunk, chunks))
+
+
+def _build_tables(table, arrow, results):
+    """Concatenate the results of all chunks into a table of texts and a table of spans"""
+
+    annotated_texts = []
+    deidentified_texts = []
+    spans = {column: [] for column in SPAN_COLUMNS}
+
+    for chunk_annotated, chunk_deidentified, chunk_spans in results:
+        annotated_texts.extend(chunk_annotated)
+        deidentified_texts.extend(chunk_deidentified)
+
+        for column in SPAN_COLUMNS:
+            spans[column].extend(chunk_spans[column])
+
+    if arrow:
+        import pyarrow
+
+        texts_table = pyarrow.table(
+            {
+                "annotated": pyarrow.array(annotated_texts, type=pyarrow.string()),
+                "deidentified": pyarrow.array(deidentified_texts, type=pyarrow.string()),
+            }
+        )
+        spans_table = pyarrow.table(
+            {
+                "row": pyarrow.array(spans["row"], type=pyarrow.int64()),
+                "tag": pyarrow.array(spans["tag"], type=pyarrow.string()),
+                "start": pyarrow.array(spans["start"], type=pyarrow.int64()),
+                "end": pyarrow.array(spans["end"], type=pyarrow.int64()),
+                "text": pyarrow.array(spans["text"], type=pyarrow.string()),
+            }
+        )
+        return texts_table, spans_table
+
+    import pandas
+
+    texts_table = pandas.DataFrame(
+        {"annotated": annotated_texts, "deidentified": deidentified_texts},
+        index=table.index,
+    )
+
+    spans["row"] = table.index[spans["row"]]
+    spans_table = pandas.DataFrame(spans, columns=list(SPAN_COLUMNS))
+
+    return texts_table, spans_table
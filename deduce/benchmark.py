@@ -0,0 +1,281 @@
+"""
+The benchmark module measures the throughput and memory of annotate_table() with worker
+threads and with worker processes, on generated notes. Each configuration runs in a new Python
+process, so that its peak memory is measured separately. The total memory is the peak of the
+summed proportional set size (PSS) of the process and its workers, in which the pages that
+workers share after fork(), such as the lexicons, are only counted once. It is sampled from
+/proc, so only on Linux. The peak resident set size (RSS) of the process and of the largest
+worker are reported separately. Run it with the interpreter to compare, for example a
+free-threaded build:
+
+    python -m deduce.benchmark --texts 2000 --workers 1 2 4
+
+Threads only annotate in parallel when the interpreter runs without the GIL, which is printed
+with the results. pandas is needed, see pip install deduce[batch].
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+# The notes are generated from these templates and names, with a fixed seed
+TEMPLATES = [
+    "Dhr. {first} {last} (geb. {day}/{month}/19{year}) werd op {day} maart gezien in het UZA, "
+    "Wilrijkstraat {number}, 2650 Edegem. Tel 03 821 {number} 00.",
+    "Mme {first} {last}, âgée de {number} ans, a été vue le {day} mars à la Clinique "
+    "Saint-Jean de Bruxelles par le Dr. {last}.",
+    "Patient {number}{year} wordt verder opgevolgd door huisarts {initial}. {last} en "
+    "{first} Claes, e-mail {first}.{last}@example.be.",
+]
+FIRST_NAMES = ["Jan", "Marie", "Pieter", "Anna", "Jean", "Sofie", "Luc", "Els"]
+SURNAMES = ["Peeters", "Dubois", "Janssens", "Dupont", "Maes", "Lambert", "Claes", "Wouters"]
+
+
+def make_notes(num_texts, paragraphs=5, seed=0):
+    """Generate notes of a few paragraphs, with patient first names for half of them"""
+
+    rng = random.Random(seed)
+    texts = []
+    first_names = []
+
+    for _ in range(num_texts):
+        first = rng.choice(FIRST_NAMES)
+        values = {
+            "first": first,
+            "last": rng.choice(SURNAMES),
+            "initial": first[0],
+            "day": rng.randint(1, 28),
+            "month": rng.randint(1, 12),
+            "year": rng.randint(10, 99),
+            "number": rng.randint(10, 99),
+        }
+        texts.append(
+            "\n\n".join(rng.choice(TEMPLATES).format(**values) for _ in range(paragraphs))
+        )
+        first_names.append(first if rng.random() < 0.5 else None)
+
+    return texts, first_names
+
+
+def is_gil_enabled():
+    """Whether the interpreter runs with the GIL, which is always the case before Python 3.13"""
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+def _read_pss_kb(pid):
+    """
+    The proportional set size of a process in kB, in which each page that is shared with other
+    processes counts for a fraction, or None if it is unknown (outside of Linux)
+    """
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+    return None
+
+
+def _get_child_pids():
+    """The ids of the child processes of this process, from the parent ids in /proc"""
+
+    pid = os.getpid()
+    child_pids = []
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8", errors="replace") as file:
+                stat = file.read()
+        except OSError:
+            continue
+
+        # The parent id is the second field after the command, which may contain spaces
+        if int(stat.rpartition(")")[2].split()[1]) == pid:
+            child_pids.append(int(entry))
+
+    return child_pids
+
+
+class MemorySampler:
+    """
+    A context manager that samples the summed PSS of this process and its child processes in a
+    thread, and keeps the peak in MB (None where PSS is unknown)
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_pss_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        pss = _read_pss_kb(os.getpid())
+
+        if pss is None:
+            return
+
+        pss += sum(_read_pss_kb(child_pid) or 0 for child_pid in _get_child_pids())
+        self.peak_pss_mb = max(self.peak_pss_mb or 0, round(pss / 1024, 1))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _get_peak_rss_mb():
+    """
+    The peak RSS in MB of this process, and of the largest child process that has exited, or
+    None without the resource module (Windows). The RSS of a worker includes the pages it
+    shares with this process, so the two must not be added up.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None, None
+
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    unit = 1024**2 if sys.platform == "darwin" else 1024
+    parent = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return round(parent / unit, 1), round(child / unit, 1) if child else None
+
+
+def run_configuration(mode, workers, num_texts, chunk_size):
+    """
+    Annotate the generated notes with annotate_table() in the current process
+    :param mode: "threads" or "processes"
+    :return: a dict with the mode, the number of workers, the time, the texts per second, the
+    peak summed PSS of this process and its workers, and the peak RSS of this process and of the
+    largest worker process
+    """
+
+    import pandas
+
+    from .batch import annotate_table
+
+    texts, first_names = make_notes(num_texts)
+    table = pandas.DataFrame({"text": texts, "patient_first_names": first_names})
+
+    if mode == "threads":
+        options = {"threads": workers}
+    elif mode == "processes":
+        options = {"processes": workers}
+    else:
+        raise ValueError(f"Unknown mode {mode}, choose from threads, processes")
+
+    with MemorySampler() as sampler:
+        start = time.perf_counter()
+        annotate_table(table, chunk_size=chunk_size, **options)
+        seconds = time.perf_counter() - start
+
+    parent_rss, worker_rss = _get_peak_rss_mb()
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "texts_per_second": round(num_texts / seconds, 1),
+        "peak_pss_mb": sampler.peak_pss_mb,
+        "parent_peak_rss_mb": parent_rss,
+        "worker_peak_rss_mb": worker_rss,
+    }
+
+
+def run_benchmark(num_texts=1000, workers=(1, 2, 4), chunk_size=50, modes=("threads", "processes")):
+    """
+    Run every combination of mode and number of workers in a new Python process
+    :return: a list of the results of run_configuration(), with the speedup over one worker
+    of the same mode
+    """
+
+    results = []
+
+    for mode in modes:
+        for num_workers in workers:
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "deduce.benchmark",
+                    "--run",
+                    mode,
+                    "--texts",
+                    str(num_texts),
+                    "--workers",
+                    str(num_workers),
+                    "--chunk-size",
+                    str(chunk_size),
+                ],
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+            results.append(json.loads(output))
+
+    for result in results:
+        baseline = next(
+            other["seconds"]
+            for other in results
+            if other["mode"] == result["mode"] and other["workers"] == min(workers)
+        )
+        result["speedup"] = round(baseline / result["seconds"], 2)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0].strip())
+    parser.add_argument("--texts", type=int, default=1000, help="the number of notes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=["threads", "processes"])
+    parser.add_argument("--run", choices=["threads", "processes"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Run a single configuration, for run_benchmark()
+    if args.run:
+        print(json.dumps(run_configuration(args.run, args.workers[0], args.texts, args.chunk_size)))
+        return
+
+    print(
+        f"Python {sys.version.split()[0]}, GIL {'enabled' if is_gil_enabled() else 'disabled'}, "
+        f"{os.cpu_count()} CPUs, {args.texts} notes"
+    )
+    print(
+        f"{'mode':<10} {'workers':>7} {'seconds':>8} {'texts/s':>8} {'speedup':>7} "
+        f"{'total PSS MB':>12} {'parent RSS MB':>13} {'worker RSS MB':>13}"
+    )
+
+    for result in run_benchmark(args.texts, args.workers, args.chunk_size, args.modes):
+        print(
+            f"{result['mode']:<10} {result['workers']:>7} {result['seconds']:>8} "
+            f"{result['texts_per_second']:>8} {result['speedup']:>7} "
+            f"{result['peak_pss_mb']!s:>12} {result['parent_peak_rss_mb']!s:>13} "
+            f"{result['worker_peak_rss_mb']!s:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+""" This module contains the caches for annotated texts and paragraphs """
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .utility import split_paragraphs
+
+
+def make_key(*parts):
+    """
+    Compute a content-addressed key from the text and all other arguments that
+    influence the annotation (patient metadata, enabled categories, lexicon version)
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    for part in parts:
+        digest.update(str(part).encode("utf-8", errors="surrogatepass"))
+
+        # Separate the parts, so that ("ab", "c") and ("a", "bc") do not collide
+        digest.update(b"\x1f")
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    This class contains a cache for the results of annotate_text. It consists of an
+    in-memory LRU tier, and optionally an on-disk sqlite tier with size-based eviction.
+    Both tiers are keyed by make_key(), so a duplicate document only costs a hash.
+    """
+
+    def __init__(self, max_entries=10000, path=None, max_disk_bytes=256 * 1024 * 1024):
+        """
+        Initiate the cache
+        :param max_entries: the maximum number of results in the in-memory tier
+        :param path: the path of the sqlite database of the on-disk tier, or None
+        :param max_disk_bytes: the maximum total size of the results in the on-disk tier
+        """
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_bytes = 0
+
+        if path is not None:
+            self._open_disk(path)
+
+    make_key = staticmethod(make_key)
+
+    def _open_disk(self, path):
+        """Open (or create) the on-disk tier"""
+        self._disk = sqlite3.connect(path, check_same_thread=False)
+        self._disk.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)"
+        )
+        self._disk.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+        )
+        self._disk.commit()
+        self._disk_bytes = self._disk.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    def get(self, key):
+        """Return the cached result for the key, or None if it is not cached"""
+
+        with self._lock:
+
+            # First check the in-memory tier
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            # Then the on-disk tier, promoting a hit to the in-memory tier
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value FROM results WHERE key = ?", (key,)
+                ).fetchone()
+
+                if row is not None:
+                    self._disk.execute(
+                        "UPDATE results SET accessed = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    self._disk.commit()
+                    self._put_memory(key, row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a result in the cache"""
+
+        with self._lock:
+            self._put_memory(key, value)
+
+            if self._disk is not None:
+                self._put_disk(key, value)
+
+    def _put_memory(self, key, value):
+        """Store a result in the in-memory tier, evicting the least recently used one"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _put_disk(self, key, value):
+        """Store a result in the on-disk tier, evicting the least recently used ones"""
+        size = len(value.encode("utf-8", errors="surrogatepass"))
+
+        # Do not store results that would never fit
+        if size > self.max_disk_bytes:
+            return
+
+        row = self._disk.execute(
+            "SELECT size FROM results WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None:
+            self._disk_bytes -= row[0]
+
+        self._disk.execute(
+            "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self._disk_bytes += size
+
+        # Evict the least recently accessed results until the tier fits again
+        while self._disk_bytes > self.max_disk_bytes:
+            evict_key, evict_size = self._disk.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 1"
+            ).fetchone()
+            self._disk.execute("DELETE FROM results WHERE key = ?", (evict_key,))
+            self._disk_bytes -= evict_size
+
+        self._disk.commit()
+
+    def clear(self):
+        """Remove all results from both tiers"""
+
+        with self._lock:
+            self._memory.clear()
+
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM results")
+                self._disk.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        """Close the on-disk tier"""
+
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def __len__(self):
+        return len(self._memory)
+
+
+class SegmentCache:
+    """
+    This class contains a cache for the output of single annotators on the paragraphs of a text.
+    Headers, addresses and footers that occur in many documents are then only annotated once.
+    It should only be used for annotators that do not depend on patient metadata, and its
+    annotations never extend across a paragraph break.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        Initiate the cache
+        :param max_entries: the maximum number of annotated paragraphs that are kept
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def annotate(self, annotator, text, *parts):
+        """
+        Annotate a text paragraph by paragraph, reusing the cached output for known paragraphs
+        :param annotator: a function that takes a text and returns the annotated text
+        :param text: the text to be annotated
+        :param parts: anything else that influences the output of the annotator, such as the lexicon version
+        :return: the annotated text
+        """
+        annotated_segments = []
+
+        for segment in split_paragraphs(text):
+            key = (annotator.__name__, parts, segment)
+
+            with self._lock:
+                annotated_segment = self._segments.get(key)
+
+                if annotated_segment is not None:
+                    self._segments.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+            # Run the annotator outside of the lock, so that other threads can continue
+            if annotated_segment is None:
+                annotated_segment = annotator(segment)
+
+                with self._lock:
+                    self._segments[key] = annotated_segment
+
+                    while len(self._segments) > self.max_entries:
+                        self._segments.popitem(last=False)
+
+            annotated_segments.append(annotated_segment)
+
+        return "".join(annotated_segments)
+
+    def clear(self):
+        """Remove all annotated paragraphs"""
+
+        with self._lock:
+            self._segments.clear()
+
+    def __len__(self):
+        return len(self._segments)
@@ -0,0 +1,226 @@
+"""
+The corpus module reads large corpus files with one document per line (or per separator) by
+memory-mapping them, so documents are only decoded one at a time, and annotates them with
+offsets that point into the document as well as into the file
+"""
+
+import mmap
+from array import array
+
+from .deduce import iter_annotations
+
+
+class CorpusAnnotation:
+    """
+    An annotation in a document of a corpus. start_ix and end_ix are character offsets in the
+    document, global_start_ix and global_end_ix are character offsets in the decoded file, and
+    start_byte and end_byte are byte offsets in the file.
+    """
+
+    def __init__(
+        self,
+        document: int,
+        tag: str,
+        text: str,
+        start_ix: int,
+        end_ix: int,
+        global_start_ix: int,
+        global_end_ix: int,
+        start_byte: int,
+        end_byte: int,
+    ):
+        self.document = document
+        self.tag = tag
+        self.text_ = text
+        self.start_ix = start_ix
+        self.end_ix = end_ix
+        self.global_start_ix = global_start_ix
+        self.global_end_ix = global_end_ix
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+
+    def __eq__(self, other):
+        return isinstance(other, CorpusAnnotation) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"{self.tag}[{self.document}:{self.start_ix}:{self.end_ix}]"
+
+
+class CorpusReader:
+    """
+    This class reads the documents of a corpus file lazily by index. The file is memory-mapped,
+    and an index of the byte offsets of the documents is built with one scan on first use. The
+    character offsets of the documents in the file are computed as the documents are decoded.
+    """
+
+    def __init__(self, path, separator="\n", encoding="utf-8"):
+        """
+        Open a corpus file
+        :param path: the path of the file
+        :param separator: the string between documents. A separator at the end of the file does
+        not start another document
+        :param encoding: the encoding of the file, which must be ASCII-compatible (such as
+        utf-8 or latin-1), so that the separator is found in the bytes
+        """
+        self.path = path
+        self.separator = separator
+        self.encoding = encoding
+
+        self._encoded_separator = separator.encode(encoding)
+
+        with open(path, "rb") as file:
+
+            # An empty file cannot be memory-mapped
+            try:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self._data = b""
+
+        self._starts = None
+        self._last_end = None
+        self._char_starts = array("Q", [0])
+
+    def _build_index(self):
+        """Find the byte offset of the start of each document"""
+
+        data = self._data
+        step = len(self._encoded_separator)
+        starts = array("Q")
+        start = 0
+        end = len(data)
+
+        while start < len(data):
+            starts.append(start)
+            end = data.find(self._encoded_separator, start)
+
+            if end == -1:
+                end = len(data)
+                break
+
+            start = end + step
+
+        self._starts = starts
+        self._last_end = end
+
+    def __len__(self):
+        if self._starts is None:
+            self._build_index()
+
+        return len(self._starts)
+
+    def bounds(self, index):
+        """The byte offsets of the start and end of a document in the file"""
+
+        num_documents = len(self)
+
+        if index < 0:
+            index += num_documents
+
+        if not 0 <= index < num_documents:
+            raise IndexError("document index out of range")
+
+        start = self._starts[index]
+
+        if index + 1 < num_documents:
+            end = self._starts[index + 1] - len(self._encoded_separator)
+        else:
+            end = self._last_end
+
+        return start, end
+
+    def __getitem__(self, index):
+        """Decode a document"""
+
+        if index < 0:
+            index += len(self)
+
+        start, end = self.bounds(index)
+        text = self._data[start:end].decode(self.encoding)
+
+        # Documents are mostly read in order, so the character offset of the next document
+        # comes for free
+        if len(self._char_starts) == index + 1:
+            self._char_starts.append(self._char_starts[index] + len(text) + len(self.separator))
+
+        return text
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def char_offset(self, index):
+        """The character offset of the start of a document in the decoded file"""
+
+        if index < 0:
+            index += len(self)
+
+        # Decode the documents in between, which are not read yet
+        while len(self._char_starts) <= index:
+            self[len(self._char_starts) - 1]
+
+        return self._char_starts[index]
+
+    def iter_annotations(self, start=0, stop=None, **kwargs):
+        """
+        Annotate the documents from start up to stop, one at a time, see
+        deduce.iter_annotations()
+        :param kwargs: The patient names and flags, as in annotate_text()
+        :return: A generator of CorpusAnnotation objects, in file order
+        """
+
+        stop = len(self) if stop is None else min(stop, len(self))
+
+        for index in range(start, stop):
+            text = self[index]
+            start_byte = self.bounds(index)[0]
+            start_char = self.char_offset(index)
+
+            # The byte offset of the last annotation, to encode each part of the text once
+            char_position = 0
+            byte_position = start_byte
+
+            for annotation in iter_annotations(text, **kwargs):
+                byte_position += len(text[char_position : annotation.start_ix].encode(self.encoding))
+                annotation_bytes = len(
+                    text[annotation.start_ix : annotation.end_ix].encode(self.encoding)
+                )
+
+                yield CorpusAnnotation(
+                    document=index,
+                    tag=annotation.tag,
+                    text=annotation.text_,
+                    start_ix=annotation.start_ix,
+                    end_ix=annotation.end_ix,
+                    global_start_ix=start_char + annotation.start_ix,
+                    global_end_ix=start_char + annotation.end_ix,
+                    start_byte=byte_position,
+                    end_byte=byte_position + annotation_bytes,
+                )
+
+                char_position = annotation.end_ix
+                byte_position += annotation_bytes
+
+    def write_standoff(self, file, **kwargs):
+        """
+        Write the annotations of all documents to a file object, as tab-separated lines with
+        the document index, the tag, the byte offsets and the character offsets in the file
+        :param kwargs: The patient names and flags, as in annotate_text()
+        """
+
+        file.write("document\ttag\tstart_byte\tend_byte\tstart\tend\n")
+
+        for annotation in self.iter_annotations(**kwargs):
+            file.write(
+                f"{annotation.document}\t{annotation.tag}\t{annotation.start_byte}\t"
+                f"{annotation.end_byte}\t{annotation.global_start_ix}\t{annotation.global_end_ix}\n"
+            )
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,301 @@
+"""
+The dates module parses the values of date tags into years, months and days, for the numeric
+formats and the Dutch and French month names that annotate_date() recognizes. Parsed dates
+can be shifted by a number of days in their original format, which deidentify_annotations()
+uses to replace the dates of a patient by consistently shifted dates.
+"""
+
+import datetime
+import hashlib
+import hmac
+import re
+
+from .annotate import MONTHS
+from .utility import Annotation
+
+# The month names per language, in order, and the language and number of each month name
+MONTH_NAMES = {language: names.split("|") for language, names in MONTHS.items()}
+MONTH_NUMBERS = {
+    name: (language, number)
+    for language, names in MONTH_NAMES.items()
+    for number, name in enumerate(names, 1)
+}
+
+# The weekday names per language, from Monday
+WEEKDAY_NAMES = {
+    "nl": ["maandag", "dinsdag", "woensdag", "donderdag", "vrijdag", "zaterdag", "zondag"],
+    "fr": ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"],
+}
+WEEKDAY_LANGUAGES = {
+    name: language for language, names in WEEKDAY_NAMES.items() for name in names
+}
+
+# The dates within the value of a date tag: a day, month name and year, where only the month
+# name is required, or a numeric day, month and year (with / or . as separators), or a year
+DATE_PATTERN = re.compile(
+    rf"""(?ix)
+    (?:(?P<weekday>{"|".join(WEEKDAY_LANGUAGES)})(?P<weekday_separator>[\s,]*))?
+    (?:(?P<day>\d{{1,2}})(?P<day_separator>[^\w<>]{{0,2}}))?
+    (?P<month_name>{"|".join(MONTH_NUMBERS)})
+    (?:(?P<year_separator>[^\w<>]{{0,2}})(?P<year>\d{{4}}|\d{{2}})(?!\d))?
+    |
+    (?<!\d)(?P<numeric_day>\d{{1,2}})(?P<numeric_day_separator>\s?[/.]\s?)
+    (?P<numeric_month>\d{{1,2}})
+    (?:(?P<numeric_year_separator>\s?[/.]\s?)(?P<numeric_year>\d{{4}}|\d{{2}}))?(?!\d)
+    |
+    (?<!\d)(?P<year_only>(?:19|20)\d{{2}})(?!\d)
+    """
+)
+
+# The text between the dates in a value, such as the dash in a range of dates
+DATE_SEPARATOR_PATTERN = re.compile(r"[^\w<>]*")
+
+# The year of the dates without a year, which is a leap year so that 29 February exists
+DEFAULT_YEAR = 2000
+
+
+def _match_case(name, example):
+    """Write a name in the case of an example: lowercase, capitalized or uppercase"""
+
+    if example.isupper():
+        return name.upper()
+
+    if example[0].isupper():
+        return name.capitalize()
+
+    return name
+
+
+def _format_number(number, example):
+    """Format a day or month number like an example, with a leading zero if it has one"""
+    return f"{number:02d}" if example.startswith("0") else str(number)
+
+
+def _format_year(year, example):
+    """Format a year with as many digits as an example, with leading zeros"""
+    return f"{year % 100:02d}" if len(example) == 2 else f"{year:0{len(example)}d}"
+
+
+def _parse_year(year):
+    """A year of 2 digits is in this century up to 49, and in the previous one from 50"""
+
+    if len(year) == 2:
+        return int(year) + (2000 if int(year) < 50 else 1900)
+
+    return int(year)
+
+
+class ParsedDate:
+    """
+    A date within the value of a date tag, with start and end indices in the value. The year,
+    month and day are None when the date does not contain them.
+    """
+
+    def __init__(self, match: re.Match):
+        self.start = match.start()
+        self.end = match.end()
+        self._match = match
+
+        if match["month_name"]:
+            self.language, self.month = MONTH_NUMBERS[match["month_name"].lower()]
+            self.day = int(match["day"]) if match["day"] else None
+            self.year = _parse_year(match["year"]) if match["year"] else None
+        elif match["numeric_month"]:
+            self.language = None
+            self.day = int(match["numeric_day"])
+            self.month = int(match["numeric_month"])
+            self.year = _parse_year(match["numeric_year"]) if match["numeric_year"] else None
+        else:
+            self.language = None
+            self.day = self.month = None
+            self.year = int(match["year_only"])
+
+        # Raise a ValueError for dates that do not exist, such as 31/02
+        self._get_date()
+
+    def _get_date(self):
+        """
+        The date as a datetime.date, in DEFAULT_YEAR if the date has no year, on the 15th if
+        it has no day, and on 1 July if it only has a year
+        """
+
+        return datetime.date(
+            self.year if self.year is not None else DEFAULT_YEAR,
+            self.month if self.month is not None else 7,
+            self.day if self.day is not None else (15 if self.month is not None else 1),
+        )
+
+    def shift(self, days):
+        """
+        The text of the date after shifting it by a number of days, in the same format. A
+        weekday is only kept for a date with a year, as it is unknown otherwise. A date
+        without a day or year is shifted from the date of _get_date().
+        """
+
+        match = self._match
+        date = self._get_date() + datetime.timedelta(days=days)
+
+        if self.month is None:
+            return str(date.year)
+
+        if match["numeric_month"]:
+            parts = [
+                _format_number(date.day, match["numeric_day"]),
+                match["numeric_day_separator"],
+                _format_number(date.month, match["numeric_month"]),
+            ]
+
+            if match["numeric_year"]:
+                parts += [
+                    match["numeric_year_separator"],
+                    _format_year(date.year, match["numeric_year"]),
+                ]
+
+            return "".join(parts)
+
+        parts = []
+
+        if match["weekday"] and self.year is not None:
+            weekday_language = WEEKDAY_LANGUAGES[match["weekday"].lower()]
+            weekday = WEEKDAY_NAMES[weekday_language][date.weekday()]
+            parts += [_match_case(weekday, match["weekday"]), match["weekday_separator"]]
+
+        if match["day"]:
+            parts += [_format_number(date.day, match["day"]), match["day_separator"]]
+
+        month_name = MONTH_NAMES[self.language][date.month - 1]
+        parts.append(_match_case(month_name, match["month_name"]))
+
+        if match["year"]:
+            parts += [match["year_separator"], _format_year(date.year, match["year"])]
+
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"ParsedDate({self.year}, {self.month}, {self.day})"
+
+
+def parse_dates(value):
+    """
+    Parse the dates in the value of a date tag, such as "3 maart 2020", "12/03/20" or a range
+    of dates that were merged into one tag
+    :return: a list of ParsedDate objects, or None if the value contains anything else than
+    dates and punctuation, or a date that does not exist
+    """
+
+    dates = []
+    position = 0
+
+    for match in DATE_PATTERN.finditer(value):
+
+        if not DATE_SEPARATOR_PATTERN.fullmatch(value, position, match.start()):
+            return None
+
+        try:
+            dates.append(ParsedDate(match))
+        except ValueError:
+            return None
+
+        position = match.end()
+
+    if not dates or not DATE_SEPARATOR_PATTERN.fullmatch(value, position):
+        return None
+
+    return dates
+
+
+def shift_dates(value, days):
+    """
+    Shift the dates in the value of a date tag by a number of days, keeping their format. Only
+    the value is shifted, so a weekday or the first day of a range in the text before the tag
+    (as in "maandag <DATE 3 maart>" or "10-<DATE 12 oktober>") keeps its original value. A
+    year without a month is shifted from 1 July, so it only changes with a shift of more than
+    about half a year. A range within one date, such as "10-12 oktober", cannot be parsed.
+    :return: the shifted value, or None if the value could not be parsed (see parse_dates()) or
+    a date would be shifted out of the years 1 to 9999
+    """
+
+    dates = parse_dates(value)
+
+    if dates is None:
+        return None
+
+    parts = []
+    position = 0
+
+    for date in dates:
+        try:
+            shifted_date = date.shift(days)
+        except OverflowError:
+            return None
+
+        parts += [value[position : date.start], shifted_date]
+        position = date.end
+
+    parts.append(value[position:])
+
+    return "".join(parts)
+
+
+def date_shift_days(key, secret, max_days=365):
+    """
+    The number of days by which to shift the dates of a patient, derived from a key (such as a
+    patient id) with an HMAC, so that it is the same in every run but cannot be recovered
+    without the secret
+    :param key: the key, such as a patient id
+    :param secret: the secret key of the HMAC, as a string or bytes
+    :param max_days: the maximum number of days, in either direction
+    :return: a number of days between -max_days and max_days, other than 0
+    """
+
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+
+    digest = hmac.new(secret, str(key).encode("utf-8"), hashlib.sha256).digest()
+    number = int.from_bytes(digest[:8], "big") % (2 * max_days)
+
+    return number - max_days if number < max_days else number - max_days + 1
+
+
+class DateAnnotation(Annotation):
+    """An annotation of a date, with its parsed year, month and day (None if unknown)"""
+
+    def __init__(self, start_ix, end_ix, text, year=None, month=None, day=None):
+        super().__init__(start_ix, end_ix, "DATE", text)
+        self.year = year
+        self.month = month
+        self.day = day
+
+    def __eq__(self, other):
+        return (
+            super().__eq__(other)
+            and isinstance(other, DateAnnotation)
+            and (self.year, self.month, self.day) == (other.year, other.month, other.day)
+        )
+
+    def __repr__(self):
+        return f"DATE[{self.start_ix}:{self.end_ix}]({self.year}, {self.month}, {self.day})"
+
+
+def get_date_annotations(annotation):
+    """
+    Split an annotation of a date tag into the dates in it, with their parsed values, or
+    return a single DateAnnotation without values if it could not be parsed
+    """
+
+    dates = parse_dates(annotation.text_)
+
+    if dates is None:
+        return [DateAnnotation(annotation.start_ix, annotation.end_ix, annotation.text_)]
+
+    return [
+        DateAnnotation(
+            annotation.start_ix + date.start,
+            annotation.start_ix + date.end,
+            annotation.text_[date.start : date.end],
+            date.year,
+            date.month,
+            date.day,
+        )
+        for date in dates
+    ]
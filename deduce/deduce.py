@@ -3,9 +3,17 @@ Deduce is the main module, from which the annotate and
 deidentify_annotations() methods can be imported
 """
 
-from deduce import utility
+import bisect
+import functools
+import time
+
+from deduce import lookup_lists, utility
 from .annotate import *
-from .utility import flatten_text, flatten_text_all_phi
+from .dates import get_date_annotations, shift_dates
+from .language import resolve_language
+from .pipeline import Stage, run_stages
+from .pseudonyms import assign_ids
+from .utility import Annotation, flatten_text, flatten_text_all_phi
 
 
 class NestedTagsError(Exception):
@@ -13,6 +21,7 @@ class NestedTagsError(Exception):
         super().__init__(str)
 
 
+@lookup_lists.reads_lexicons
 def annotate_text(
     # The text to be annotated
     text,
@@ -44,6 +53,20 @@ def annotate_text(
     urls=True,
     # Debug option
     flatten=True,
+    # Optional deduce.cache.ResultCache, to skip recomputing duplicate documents
+    cache=None,
+    # Optional deduce.cache.SegmentCache, to skip recomputing boilerplate paragraphs
+    segment_cache=None,
+    # Also annotate capitalized words within edit distance 1 of a name on the lookup lists
+    fuzzy_names=False,
+    # Optional deduce.metrics.MetricsRegistry, to record the latency and the annotations
+    metrics=None,
+    # The language of the rules: "nl", "fr", "auto" to detect it, or None for both languages
+    language=None,
+    # Belgian and Dutch postal codes
+    postal_codes=False,
+    # Only annotate the postal codes next to a residence, such as 1000 Brussel
+    postal_codes_near_residences=True,
 ):
 
     """
@@ -54,59 +77,85 @@ def annotate_text(
     if not text:
         return text
 
-    # Replace < and > symbols
-    text = text.replace("<", "(")
-    text = text.replace(">", ")")
+    if metrics is not None:
+        start_time = time.perf_counter()
+        num_characters = len(text)
 
-    # Deidentify names
-    if names:
+        for cache_name, tracked_cache in [("result", cache), ("segment", segment_cache)]:
+            if tracked_cache is not None:
+                metrics.track_cache(cache_name, tracked_cache)
 
-        # First, based on the rules and lookup lists
-        text = annotate_names(
+    # Return the result of an earlier call with exactly the same input, if any
+    if cache is not None:
+        cache_key = cache.make_key(
             text,
             patient_first_names,
             patient_initials,
             patient_surname,
             patient_given_name,
+            patient_id,
+            names,
+            locations,
+            institutions,
+            dates,
+            ages,
+            patient_numbers,
+            phone_numbers,
+            urls,
+            flatten,
+            segment_cache is not None,
+            fuzzy_names,
+            language,
+            postal_codes,
+            postal_codes_near_residences,
+            lookup_lists.LEXICON_VERSION,
         )
+        cached_text = cache.get(cache_key)
 
-        # Then, based on the context
-        text = annotate_names_context(text)
-
-        # Flatten possible nested tags
-        if flatten:
-            text = flatten_text(text)
-
-    # Patient numbers
-    if patient_numbers:
-        text = annotate_patientnumber(text, patient_id)
-
-    # Institutions
-    if institutions:
-        text = annotate_institution(text)
-
-    # Phone numbers
-    if phone_numbers:
-        text = annotate_phonenumber(text)
+        if cached_text is not None:
+            if metrics is not None:
+                metrics.observe_document(
+                    num_characters, cached_text, time.perf_counter() - start_time
+                )
+            return cached_text
 
-    # Dates
-    if dates:
-        text = annotate_date(text)
+    # The language of the rules to run, or None to run the rules of both languages. The cache
+    # is keyed by the requested language, so a duplicate text is not detected again.
+    language = resolve_language(text, language)
 
-    # Geographical locations
-    if locations:
-        text = annotate_residence(text)
-        text = annotate_address(text)
-        #text = annotate_postalcode(text)
+    # Replace < and > symbols
+    text = text.replace("<", "(")
+    text = text.replace(">", ")")
 
-    # Ages
-    if ages:
-        text = annotate_age(text)
-
-    # Urls
-    if urls:
-        text = annotate_email(text)
-        text = annotate_url(text)
+    # Scan the text once, to skip annotators that cannot match anything
+    features = scan_features(text, language)
+
+    # The arguments of the stages
+    options = {
+        "patient_first_names": patient_first_names,
+        "patient_initials": patient_initials,
+        "patient_surname": patient_surname,
+        "patient_given_name": patient_given_name,
+        "patient_id": patient_id,
+        "names": names,
+        "locations": locations,
+        "institutions": institutions,
+        "dates": dates,
+        "ages": ages,
+        "patient_numbers": patient_numbers,
+        "phone_numbers": phone_numbers,
+        "urls": urls,
+        "flatten": flatten,
+        "segment_cache": segment_cache,
+        "fuzzy_names": fuzzy_names,
+        "features": features,
+        "language": language,
+        "postal_codes": postal_codes,
+        "postal_codes_near_residences": postal_codes_near_residences,
+    }
+
+    # Run the annotators
+    text = run_stages(text, STAGES, options, metrics)
 
     # Merge adjacent tags
     text = merge_adjacent_tags(text)
@@ -115,10 +164,213 @@ def annotate_text(
     if flatten and has_nested_tags(text):
         text = flatten_text_all_phi(text)
 
+    # Store the result for duplicate documents
+    if cache is not None:
+        cache.put(cache_key, text)
+
+    if metrics is not None:
+        metrics.observe_document(num_characters, text, time.perf_counter() - start_time)
+
     # Return text
     return text
 
 
+def annotate_names_stage(text, options):
+    """Annotate person names, first based on the rules and lookup lists, then on the context"""
+
+    # Without capitals or patient names, the name annotators can only strip the text
+    if not (
+        options["features"]["capitals"]
+        or has_patient_names(
+            options["patient_first_names"],
+            options["patient_initials"],
+            options["patient_surname"],
+            options["patient_given_name"],
+        )
+    ):
+        return text.strip()
+
+    # First, based on the rules and lookup lists
+    text = annotate_names(
+        text,
+        options["patient_first_names"],
+        options["patient_initials"],
+        options["patient_surname"],
+        options["patient_given_name"],
+        fuzzy_names=options["fuzzy_names"],
+    )
+
+    # Then, based on the context
+    text = annotate_names_context(text)
+
+    # Flatten possible nested tags
+    if options["flatten"]:
+        text = flatten_text(text)
+
+    return text
+
+
+def annotate_patientnumber_stage(text, options):
+    """Annotate patient numbers"""
+
+    if len(options["patient_id"]) >= 4 or options["features"]["digits"]:
+        text = annotate_patientnumber(text, options["patient_id"])
+
+    return text
+
+
+def annotate_institution_stage(text, options):
+    """Annotate institutions"""
+    return annotate_segments(annotate_institution, text, options["segment_cache"])
+
+
+def annotate_phonenumber_stage(text, options):
+    """Annotate phone numbers"""
+
+    if options["features"]["digits"]:
+        text = annotate_segments(annotate_phonenumber, text, options["segment_cache"])
+
+    return text
+
+
+def annotate_date_stage(text, options):
+    """Annotate dates"""
+
+    if options["features"]["date"]:
+        text = annotate_date(text, options["language"])
+
+    return text
+
+
+def annotate_residence_stage(text, options):
+    """Annotate residences"""
+    return annotate_segments(annotate_residence, text, options["segment_cache"])
+
+
+def annotate_postalcode_stage(text, options):
+    """Annotate postal codes"""
+
+    if options["features"]["digits"]:
+        text = annotate_postalcode(text, options["postal_codes_near_residences"])
+
+    return text
+
+
+def annotate_address_stage(text, options):
+    """Annotate addresses"""
+
+    if options["features"]["address"]:
+        text = annotate_segments(
+            annotate_address, text, options["segment_cache"], options["language"]
+        )
+
+    return text
+
+
+def annotate_age_stage(text, options):
+    """Annotate ages"""
+
+    if options["features"]["age"]:
+        text = annotate_age(text, options["language"])
+
+    return text
+
+
+def annotate_email_stage(text, options):
+    """Annotate e-mail addresses"""
+
+    if options["features"]["email"]:
+        text = annotate_email(text)
+
+    return text
+
+
+def annotate_url_stage(text, options):
+    """Annotate urls"""
+
+    if options["features"]["url"]:
+        text = annotate_url(text)
+
+    return text
+
+
+# The annotators, in the order in which they run one after the other. The inputs of a stage
+# are the tag categories it must see, because its patterns avoid or extend these tags, or
+# could otherwise match the same text with a different result. All stages see the names,
+# since the names stage strips the text.
+STAGES = [
+    Stage("names", annotate_names_stage, "names", outputs=["PATIENT", "PERSON"]),
+    Stage(
+        "patient_numbers",
+        annotate_patientnumber_stage,
+        "patient_numbers",
+        inputs=["PERSON"],
+        outputs=["PATIENTNUMBER"],
+    ),
+    Stage(
+        "institutions",
+        annotate_institution_stage,
+        "institutions",
+        inputs=["PERSON"],
+        outputs=["INSTITUTION"],
+    ),
+    Stage(
+        "phone_numbers",
+        annotate_phonenumber_stage,
+        "phone_numbers",
+        inputs=["PATIENTNUMBER"],
+        outputs=["PHONENUMBER"],
+    ),
+    Stage("dates", annotate_date_stage, "dates", inputs=["PHONENUMBER"], outputs=["DATE"]),
+    Stage(
+        "residences",
+        annotate_residence_stage,
+        "locations",
+        inputs=["INSTITUTION", "DATE"],
+        outputs=["LOCATION"],
+    ),
+    Stage(
+        "addresses",
+        annotate_address_stage,
+        "locations",
+        inputs=["LOCATION"],
+        outputs=["LOCATION"],
+    ),
+    Stage(
+        "postal_codes",
+        annotate_postalcode_stage,
+        "postal_codes",
+        inputs=["PHONENUMBER", "DATE", "LOCATION"],
+        outputs=["LOCATION"],
+    ),
+    Stage("ages", annotate_age_stage, "ages", inputs=["DATE", "LOCATION"], outputs=["AGE"]),
+    Stage("emails", annotate_email_stage, "urls", inputs=["LOCATION"], outputs=["URL"]),
+    Stage(
+        "urls",
+        annotate_url_stage,
+        "urls",
+        inputs=["INSTITUTION", "LOCATION", "URL"],
+        outputs=["URL"],
+    ),
+]
+
+
+def annotate_segments(annotator, text, segment_cache=None, language=None):
+    """
+    Run an annotator that does not depend on patient metadata, reusing the output for
+    paragraphs that are in the segment cache (if any). If a language is given, it is passed
+    to the annotator.
+    """
+
+    if language is not None:
+        annotator = functools.wraps(annotator)(functools.partial(annotator, language=language))
+
+    if segment_cache is None:
+        return annotator(text)
+
+    return segment_cache.annotate(annotator, text, lookup_lists.LEXICON_VERSION, language)
+
+
 def get_adjacent_tags_replacement(match: re.Match) -> str:
     text = match.group(0)
     tag = match.group(1)
@@ -215,29 +467,149 @@ def annotate_text_structured(
     return annotations
 
 
-def has_nested_tags(text):
-    open_brackets = 0
-    for _, ch in enumerate(text):
+def iter_annotations(text: str, **kwargs):
+    """
+    Yield the structured annotations of a text in document order, annotating one paragraph at
+    a time, so that a consumer can stop early and memory stays bounded by the paragraph size.
+    Unlike annotate_text_structured(), annotations never extend across a blank line. Each
+    paragraph sees the lexicons either before or after an update, but the lexicon lock is not
+    held while the generator is suspended, so a generator that is kept alive does not block
+    updates, and later paragraphs can see an update that earlier ones did not.
+    :param text: The text to be annotated
+    :param kwargs: The patient names and flags, as in annotate_text()
+    :return: A generator of annotations, with indices pointing to the text
+    """
+
+    for start, end in utility.iter_paragraph_bounds(text, skip_tags=False):
+        yield from annotate_paragraph(text[start:end], start, **kwargs)
+
+
+def iter_dates(text: str, **kwargs):
+    """
+    Yield the dates of a text in document order, as DateAnnotation objects with the parsed
+    year, month and day. A date tag that contains several dates, such as a range, is split
+    into its dates. The year, month and day are None if they are not part of the date, or if
+    the date could not be parsed.
+    :param text: The text to be annotated
+    :param kwargs: The patient names and flags, as in annotate_text()
+    :return: A generator of DateAnnotation objects, with indices pointing to the text
+    """
+
+    for annotation in iter_annotations(text, **kwargs):
+        if annotation.tag == "DATE":
+            yield from get_date_annotations(annotation)
+
+
+@lookup_lists.reads_lexicons
+def reannotate(old_text: str, old_annotations: list, new_text: str, **kwargs) -> list:
+    """
+    Update the structured annotations of a text after it has been amended. Only the paragraphs
+    that changed are annotated again, the annotations of the other paragraphs are reused (and
+    shifted, if they come after the change). As paragraphs are annotated independently, the
+    result is the same as list(iter_annotations(new_text, **kwargs)).
+    :param old_text: The text before the amendment
+    :param old_annotations: The annotations of old_text, from iter_annotations() or reannotate()
+    with the same arguments
+    :param new_text: The text after the amendment
+    :param kwargs: The patient names and flags, as in annotate_text()
+    :return: The annotations of new_text
+    """
+
+    # The text before and after the change is the same in both versions
+    prefix_length = utility.common_prefix_length(old_text, new_text)
+    suffix_length = min(
+        utility.common_suffix_length(old_text, new_text),
+        min(len(old_text), len(new_text)) - prefix_length,
+    )
+    suffix_start = len(new_text) - suffix_length
+    shift = len(new_text) - len(old_text)
+
+    old_paragraphs = set(utility.iter_paragraph_bounds(old_text, skip_tags=False))
+    old_starts = [annotation.start_ix for annotation in old_annotations]
 
-        if ch == "<":
-            open_brackets += 1
+    def old_annotations_between(start, end):
+        index = bisect.bisect_left(old_starts, start)
 
-        if ch == ">":
-            open_brackets -= 1
+        while index < len(old_annotations) and old_annotations[index].end_ix <= end:
+            yield old_annotations[index]
+            index += 1
 
-        if open_brackets == 2:
-            return True
+    annotations = []
 
-        if open_brackets not in (0, 1):
-            raise ValueError("Incorrectly formatted string")
+    for start, end in utility.iter_paragraph_bounds(new_text, skip_tags=False):
 
-    return False
+        # A paragraph before the change, which was also a paragraph in the old text
+        if end <= prefix_length and (start, end) in old_paragraphs:
+            annotations.extend(old_annotations_between(start, end))
 
+        # A paragraph after the change, which was also a paragraph in the old text
+        elif start >= suffix_start and (start - shift, end - shift) in old_paragraphs:
+            annotations.extend(
+                Annotation(
+                    annotation.start_ix + shift,
+                    annotation.end_ix + shift,
+                    annotation.tag,
+                    annotation.text_,
+                )
+                for annotation in old_annotations_between(start - shift, end - shift)
+            )
 
-def deidentify_annotations(text):
+        else:
+            annotations.extend(annotate_paragraph(new_text[start:end], start, **kwargs))
+
+    return annotations
+
+
+def annotate_paragraph(paragraph: str, offset: int, **kwargs) -> list:
+    """
+    Annotate one paragraph of a text, and return its structured annotations with the offset of
+    the paragraph in the text added to their indices
+    """
+
+    annotated_paragraph = annotate_text(paragraph, **kwargs)
+    tags = utility.find_tags(annotated_paragraph)
+
+    if not tags:
+        return []
+
+    if has_nested_tags(annotated_paragraph):
+        raise NestedTagsError("Text has nested tags")
+
+    return utility.get_annotations(
+        annotated_paragraph, tags, offset + utility.get_first_non_whitespace(paragraph)
+    )
+
+
+def has_nested_tags(text):
+    """
+    Check if a text has a tag within a tag, raising a ValueError if a ">" closes more tags
+    than were opened before a tag within a tag
+    """
+
+    _, depths = utility.bracket_depths(text)
+
+    # The depth changes by one at each bracket, so the first depth of 2 or -1 decides
+    first_nested = depths.index(2) if 2 in depths else len(depths)
+    first_unopened = depths.index(-1) if -1 in depths else len(depths)
+
+    if first_unopened < first_nested:
+        raise ValueError("Incorrectly formatted string")
+
+    return first_nested < len(depths)
+
+
+def deidentify_annotations(text, pseudonym_store=None, scope="", date_shift=None):
     """
     Deidentify the annotated tags - only makes sense if annotate() is used first -
     otherwise the normal text is simply returned
+
+    :param pseudonym_store: a PseudonymStore, to give the values in tags the same ids across
+    documents, or None to number them per document
+    :param scope: the scope of the ids in the pseudonym store, such as a dataset or patient
+    :param date_shift: a number of days by which to shift the dates, such as the
+    date_shift_days() of the patient, instead of replacing them by numbered tags. Dates that
+    cannot be parsed are still replaced by numbered tags. Only the values of the tags are
+    shifted, see shift_dates() for the limits.
     """
 
     if not text:
@@ -246,6 +618,13 @@ def deidentify_annotations(text):
     # Patient tags are always simply deidentified (because there is only one patient
     text = re.sub("<PATIENT\s([^>]+)>", "<PATIENT>", text)
 
+    if date_shift is not None:
+        text = re.sub(
+            "<DATE ([^>]+)>",
+            lambda match: shift_dates(match.group(1), date_shift) or match.group(0),
+            text,
+        )
+
     # For al the other types of tags
     for tagname in [
         "PERSON",
@@ -260,43 +639,28 @@ def deidentify_annotations(text):
 
         # Find all values that occur within this type of tag
         phi_values = re.findall("<" + tagname + r"\s([^>]+)>", text)
-        next_phi_values = []
-
-        # Count unique occurrences (fuzzy) of all values in tags
-        dispenser = 1
-
-        # Iterate over all the values in tags
-        while len(phi_values) > 0:
-
-            # Compute which other values have edit distance <=1 (fuzzy matching)
-            # compared to this value
-            thisval = phi_values[0]
-            dist = [
-                edit_distance(x, thisval, transpositions=True) <= 1
-                for x in phi_values[1:]
-            ]
-
-            # Replace this occurence with the appropriate number from dispenser
-            text = text.replace(f"<{tagname} {thisval}>", f"<{tagname}-{dispenser}>")
-
-            # For all other values
-            for index, value in enumerate(dist):
-
-                # If the value matches, replace it as well
-                if dist[index]:
-                    text = text.replace(
-                        f"<{tagname} {phi_values[index + 1]}>",
-                        f"<{tagname}-{str(dispenser)}>",
-                    )
-
-                # Otherwise, carry it to the next iteration
-                else:
-                    next_phi_values.append(phi_values[index + 1])
-
-            # This is for the next iteration
-            phi_values = next_phi_values
-            next_phi_values = []
-            dispenser += 1
+
+        if not phi_values:
+            continue
+
+        # Values within edit distance 1 of each other (fuzzy matching) get the same number
+        if pseudonym_store is None:
+            ids = assign_ids(phi_values)
+        else:
+            ids = pseudonym_store.get_ids(scope, tagname, dict.fromkeys(phi_values))
+
+        # A value that contains another tag can be changed by replacing another value, so
+        # then the values are replaced one by one, grouped by number
+        if any("<" in value for value in ids):
+            for value in sorted(ids, key=ids.get):
+                text = text.replace(f"<{tagname} {value}>", f"<{tagname}-{ids[value]}>")
+            continue
+
+        text = re.sub(
+            f"<{tagname} ([^>]+)>",
+            lambda match: f"<{tagname}-{ids[match.group(1)]}>",
+            text,
+        )
 
     # Return text
     return text
@@ -0,0 +1,222 @@
+"""
+The export module writes annotations as standoff spans instead of inline tags: as JSON lines,
+as BRAT .ann files or as tokens with BIO labels (CoNLL). The writers take the annotations of a
+document as an iterable, such as iter_annotations(), and write to a file object directly, one
+document at a time, so the output of a corpus is never built up in memory.
+"""
+
+import json
+import os
+import re
+
+from .batch import PATIENT_COLUMNS, as_patient_value
+from .deduce import iter_annotations
+from .pseudonyms import assign_ids
+
+# The tokens of the CoNLL format: words and single punctuation characters
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def deidentify_spans(text, annotations, pseudonym_store=None, scope=""):
+    """
+    Deidentify a text from its annotations, with the numbered tags that
+    deidentify_annotations() gives, but keeping the rest of the text as it is (annotate_text()
+    strips the text)
+    :param annotations: the annotations of the text, in document order
+    :param pseudonym_store: a PseudonymStore, or None to number the values per document
+    :param scope: the scope of the ids in the pseudonym store
+    """
+
+    annotations = list(annotations)
+    values_per_tag = {}
+
+    for annotation in annotations:
+        if annotation.tag != "PATIENT":
+            values_per_tag.setdefault(annotation.tag, []).append(annotation.text_)
+
+    ids_per_tag = {
+        tag: assign_ids(values)
+        if pseudonym_store is None
+        else pseudonym_store.get_ids(scope, tag, dict.fromkeys(values))
+        for tag, values in values_per_tag.items()
+    }
+
+    parts = []
+    position = 0
+
+    for annotation in annotations:
+        parts.append(text[position : annotation.start_ix])
+
+        if annotation.tag == "PATIENT":
+            parts.append("<PATIENT>")
+        else:
+            parts.append(f"<{annotation.tag}-{ids_per_tag[annotation.tag][annotation.text_]}>")
+
+        position = annotation.end_ix
+
+    parts.append(text[position:])
+
+    return "".join(parts)
+
+
+def write_jsonl(file, text, annotations, document_id=None, deidentified=False):
+    """
+    Write a document as a line of JSON, with its id (if any), its spans as objects with a tag,
+    start, end and text, and optionally its deidentified text
+    """
+
+    annotations = list(annotations)
+    record = {} if document_id is None else {"id": document_id}
+    record["spans"] = [
+        {
+            "tag": annotation.tag,
+            "start": annotation.start_ix,
+            "end": annotation.end_ix,
+            "text": annotation.text_,
+        }
+        for annotation in annotations
+    ]
+
+    if deidentified:
+        record["deidentified"] = deidentify_spans(text, annotations)
+
+    json.dump(record, file, ensure_ascii=False)
+    file.write("\n")
+
+
+def _brat_fragments(text, start, end):
+    """The (start, end) of the lines of a span, as BRAT does not allow newlines in a span"""
+
+    fragments = []
+
+    for match in re.finditer(r"[^\n]+", text[start:end]):
+        if not match.group().isspace():
+            fragments.append((start + match.start(), start + match.end()))
+
+    return fragments
+
+
+def write_brat(file, text, annotations, first_id=1):
+    """
+    Write the annotations of a document in the BRAT standoff format, as text-bound
+    annotations T1, T2, ... A span across lines is written as one fragment per line.
+    :return: the number of the next annotation
+    """
+
+    annotation_id = first_id
+
+    for annotation in annotations:
+        fragments = _brat_fragments(text, annotation.start_ix, annotation.end_ix)
+
+        if not fragments:
+            continue
+
+        offsets = ";".join(f"{start} {end}" for start, end in fragments)
+        fragment_text = " ".join(text[start:end] for start, end in fragments)
+        file.write(f"T{annotation_id}\t{annotation.tag} {offsets}\t{fragment_text}\n")
+        annotation_id += 1
+
+    return annotation_id
+
+
+def write_conll(file, text, annotations):
+    """
+    Write a document as tokens with BIO labels, one token and label per line separated by a
+    tab, followed by an empty line. A token is labelled with the annotation it starts in.
+    """
+
+    annotations = iter(annotations)
+    annotation = next(annotations, None)
+    previous_annotation = None
+
+    for match in TOKEN_PATTERN.finditer(text):
+
+        # Skip the annotations that end before this token
+        while annotation is not None and annotation.end_ix <= match.start():
+            annotation = next(annotations, None)
+
+        if annotation is None or match.start() < annotation.start_ix:
+            label = "O"
+        elif annotation is previous_annotation:
+            label = f"I-{annotation.tag}"
+        else:
+            label = f"B-{annotation.tag}"
+            previous_annotation = annotation
+
+        file.write(f"{match.group()}\t{label}\n")
+
+    file.write("\n")
+
+
+def _iter_documents(records, **kwargs):
+    """
+    Yield the id, text and annotations of each record with a text, where a record is a dict
+    with a text, optionally an id and the patient metadata (as in runner.run_shards()). The
+    patient metadata is converted as in the batch functions, so a numeric patient id is kept.
+    """
+
+    for index, record in enumerate(records):
+        text = record.get("text")
+
+        if not isinstance(text, str):
+            continue
+
+        patient = {key: as_patient_value(record.get(key)) for key in PATIENT_COLUMNS}
+        yield record.get("id", index), text, iter_annotations(text, **patient, **kwargs)
+
+
+def export_documents(records, file, format="jsonl", deidentified=False, **kwargs):
+    """
+    Annotate records and write them one by one to a file object, as JSON lines ("jsonl") or
+    as tokens with BIO labels ("conll")
+    :param records: an iterable of dicts with a text, optionally an id (by default the index
+    of the record) and the patient metadata, under the names of the annotate_text() arguments
+    :param file: a file object opened for writing text
+    :param deidentified: whether to add the deidentified text to the JSON lines
+    :param kwargs: other arguments for annotate_text(), such as dates=False
+    """
+
+    if format not in ("jsonl", "conll"):
+        raise ValueError(f"Unknown format {format}, choose from jsonl, conll")
+
+    for document_id, text, annotations in _iter_documents(records, **kwargs):
+        if format == "jsonl":
+            write_jsonl(file, text, annotations, document_id, deidentified)
+        else:
+            write_conll(file, text, annotations)
+
+
+def _get_brat_name(document_id):
+    """
+    The file name of a document in a BRAT directory, which is its id. Ids that are not a plain
+    file name, such as sub/x or .., would write outside of the directory, and raise a ValueError.
+    """
+
+    name = str(document_id)
+
+    if name in ("", ".", "..") or "/" in name or "\\" in name or "\0" in name:
+        raise ValueError(f"Document id {name!r} cannot be used as a file name")
+
+    return name
+
+
+def export_brat(records, directory, **kwargs):
+    """
+    Annotate records and write each to a .txt and a .ann file in a directory, named after the
+    id of the record, as BRAT expects
+    :param records: an iterable of dicts, see export_documents(). The ids must be valid file
+    names, without path separators
+    :param kwargs: other arguments for annotate_text(), such as dates=False
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    for document_id, text, annotations in _iter_documents(records, **kwargs):
+        path = os.path.join(directory, _get_brat_name(document_id))
+
+        # BRAT counts offsets in characters, so newlines are written as they are
+        with open(path + ".txt", "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+
+        with open(path + ".ann", "w", encoding="utf-8", newline="") as file:
+            write_brat(file, text, annotations)
@@ -0,0 +1,121 @@
+"""
+The language module detects whether a text is in Dutch or French, by counting the words in it
+that are stop words of only one of the languages. The lookup lists and the rules of the
+annotators are grouped per language, see LANGUAGES.
+"""
+
+import os
+import re
+
+from .utility import read_list
+
+# The languages of the lookup lists and the rules
+ALL_LANGUAGES = ("nl", "fr")
+
+
+def get_languages():
+    """
+    The languages to load, from the comma-separated DEDUCE_LANGUAGES environment variable, or
+    all languages if it is not set
+    """
+
+    value = os.environ.get("DEDUCE_LANGUAGES", "")
+    languages = tuple(language.strip() for language in value.split(",") if language.strip())
+
+    if not languages:
+        return ALL_LANGUAGES
+
+    for language in languages:
+        if language not in ALL_LANGUAGES:
+            raise ValueError(
+                f"Unknown language {language} in DEDUCE_LANGUAGES, choose from "
+                f"{', '.join(ALL_LANGUAGES)}"
+            )
+
+    # In the order of ALL_LANGUAGES, so that the order in the variable does not matter
+    return tuple(language for language in ALL_LANGUAGES if language in languages)
+
+
+# The languages of which the lookup lists are loaded
+LANGUAGES = get_languages()
+
+
+def _read_markers(stopwords, other_words):
+    """The stop words of a language, without short words and words of the other language"""
+    return {word for word in stopwords if len(word) >= 2}.difference(other_words)
+
+
+_STOPWORDS_NL = read_list("stopwoord.lst", lower=True)
+_STOPWORDS_FR = read_list("stopwords_fr.lst", lower=True)
+
+# The words that mark a text as Dutch or French. A stop word of one language does not count
+# when it is a stop word or a common word of the other language, such as "de", "en" or "onze".
+MARKERS = {
+    "nl": _read_markers(
+        _STOPWORDS_NL, _STOPWORDS_FR + read_list("top1000_fr.lst", encoding="latin-1", lower=True)
+    ),
+    "fr": _read_markers(
+        _STOPWORDS_FR, _STOPWORDS_NL + read_list("top1000_du.lst", encoding="latin-1", lower=True)
+    ),
+}
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+
+def count_markers(text, max_characters=5000):
+    """
+    Count the words that mark a text as Dutch or French, in the first max_characters
+    characters of the text
+    :return: a dict with the number of markers per language
+    """
+
+    counts = dict.fromkeys(ALL_LANGUAGES, 0)
+
+    for word in WORD_PATTERN.findall(text[:max_characters].lower()):
+        for language in ALL_LANGUAGES:
+            if word in MARKERS[language]:
+                counts[language] += 1
+
+    return counts
+
+
+def detect_language(text, min_markers=2, min_ratio=2.0, max_characters=5000):
+    """
+    Detect whether a text is in Dutch or French
+    :param text: the text
+    :param min_markers: the minimum number of markers of the detected language
+    :param min_ratio: the minimum ratio of the markers of the detected language to the markers
+    of the other language
+    :param max_characters: only the markers in this many first characters are counted
+    :return: "nl" or "fr", or None if the text is too short or mixes both languages
+    """
+
+    counts = count_markers(text, max_characters)
+    language, other_language = sorted(ALL_LANGUAGES, key=counts.get, reverse=True)
+
+    if counts[language] >= min_markers and counts[language] >= min_ratio * counts[other_language]:
+        return language
+
+    return None
+
+
+def resolve_language(text, language=None):
+    """
+    The language of the rules to run on a text: the language if it is "nl" or "fr", the
+    detected language if it is "auto", and otherwise the only loaded language (see LANGUAGES),
+    if only one is loaded. None means that the rules of both languages run.
+    """
+
+    if language == "auto":
+        language = detect_language(text)
+
+        # A text in a language of which the lookup lists are not loaded runs all rules
+        return language if language in LANGUAGES else None
+
+    if language is None:
+        return LANGUAGES[0] if len(LANGUAGES) == 1 else None
+
+    if language not in ALL_LANGUAGES:
+        raise ValueError(f"Unknown language {language}, choose from auto, {', '.join(ALL_LANGUAGES)}")
+
+    return language
@@ -0,0 +1,342 @@
+""" This module contains the PackedLexicon class, a compact and memory-mappable set of strings """
+
+import bisect
+import heapq
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from itertools import accumulate
+
+# Identifies files written by PackedLexicon.save()
+_MAGIC = b"DDLEX001"
+_BYTEORDER = {"little": b"L", "big": b"B"}[sys.byteorder]
+_HEADER_SIZE = len(_MAGIC) + 1 + 3 + 4 + 4
+
+# Makes sure that a fuzzy index is built once, when threads look up near strings concurrently
+_FUZZY_INDEX_LOCK = threading.Lock()
+
+
+class PackedLexicon:
+    """
+    This class contains a set of strings, stored as one sorted UTF-8 blob with an array of
+    offsets and an open addressing hash table of indices, instead of one Python object per
+    string. It supports membership and prefix queries, and can be saved to a file that is
+    loaded by mmap, so that worker processes share a single copy of the lexicon. The packed
+    strings are read-only, strings that are added or removed at runtime are kept in two
+    small sets on top of them.
+    """
+
+    # The symmetric-delete index for fuzzy lookups, built on first use
+    _fuzzy_index = None
+
+    def __init__(self, words=()):
+        """Initiate a PackedLexicon from an iterable of strings"""
+
+        encoded = sorted(set(word.encode("utf-8") for word in words))
+
+        self._blob = b"".join(encoded)
+        self._base = 0
+        self._offsets = array("I", [0])
+        self._offsets.extend(accumulate(map(len, encoded)))
+        self._table = self._build_table(encoded)
+        self._added = set()
+        self._removed = set()
+
+    @staticmethod
+    def _build_table(encoded):
+        """Build the hash table, which maps the crc32 of a string to its index plus one"""
+
+        # Use a power of two of at least twice the number of strings, to keep probing short
+        table_size = 2
+        while table_size < 2 * len(encoded):
+            table_size *= 2
+
+        table = array("I", bytes(4 * table_size))
+        mask = table_size - 1
+
+        for index, word in enumerate(encoded):
+            slot = zlib.crc32(word) & mask
+
+            while table[slot]:
+                slot = (slot + 1) & mask
+
+            table[slot] = index + 1
+
+        return table
+
+    @classmethod
+    def load(cls, path):
+        """Load a PackedLexicon from a file written by save(), by memory-mapping it"""
+
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if data[: len(_MAGIC)] != _MAGIC or data[len(_MAGIC) : len(_MAGIC) + 1] != _BYTEORDER:
+            raise ValueError(f"{path} is not a packed lexicon for this platform")
+
+        num_words = int.from_bytes(data[12:16], sys.byteorder)
+        table_size = int.from_bytes(data[16:20], sys.byteorder)
+
+        offsets_start = _HEADER_SIZE
+        table_start = offsets_start + 4 * (num_words + 1)
+        blob_start = table_start + 4 * table_size
+
+        lexicon = cls.__new__(cls)
+        lexicon._blob = data
+        lexicon._base = blob_start
+        lexicon._offsets = memoryview(data)[offsets_start:table_start].cast("I")
+        lexicon._table = memoryview(data)[table_start:blob_start].cast("I")
+        lexicon._added = set()
+        lexicon._removed = set()
+
+        return lexicon
+
+    def save(self, path):
+        """Write the PackedLexicon to a file, atomically replacing any existing file"""
+
+        # Pack the strings that were added or removed at runtime as well
+        if self._added or self._removed:
+            PackedLexicon(self).save(path)
+            return
+
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=directory)
+
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(_MAGIC + _BYTEORDER + bytes(3))
+            file.write(len(self).to_bytes(4, sys.byteorder))
+            file.write(len(self._table).to_bytes(4, sys.byteorder))
+            file.write(bytes(self._offsets))
+            file.write(bytes(self._table))
+            file.write(self._word_bytes(0, len(self._blob) - self._base))
+
+        # The file is meant to be shared, while mkstemp only gives access to the owner
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    def _word_bytes(self, start, end):
+        """The bytes between two offsets"""
+        return self._blob[self._base + start : self._base + end]
+
+    def _word(self, index):
+        """The encoded string at an index"""
+        return self._word_bytes(self._offsets[index], self._offsets[index + 1])
+
+    def add(self, word):
+        """Add a string to the PackedLexicon"""
+
+        self._removed.discard(word)
+
+        if not self._packed_contains(word):
+            self._added.add(word)
+
+    def discard(self, word):
+        """Remove a string from the PackedLexicon, if it is in the PackedLexicon"""
+
+        self._added.discard(word)
+
+        if self._packed_contains(word):
+            self._removed.add(word)
+
+    def __contains__(self, word):
+        """Check if a string is in the PackedLexicon"""
+
+        if word in self._added:
+            return True
+
+        if word in self._removed:
+            return False
+
+        return self._packed_contains(word)
+
+    def _packed_contains(self, word):
+        """Check if a string is in the packed strings"""
+
+        try:
+            encoded = word.encode("utf-8")
+        except (AttributeError, UnicodeEncodeError):
+            return False
+
+        mask = len(self._table) - 1
+        slot = zlib.crc32(encoded) & mask
+
+        # Probe the hash table until the string or an empty slot is found
+        while True:
+            index = self._table[slot]
+
+            if index == 0:
+                return False
+
+            if self._word(index - 1) == encoded:
+                return True
+
+            slot = (slot + 1) & mask
+
+    def _lower_bound(self, encoded):
+        """The index of the first string that is not smaller than the encoded string"""
+
+        low, high = 0, self._num_packed()
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self._word(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def iter_prefix(self, prefix):
+        """Iterate over all strings that start with the prefix, in sorted order"""
+
+        added = sorted(word for word in self._added if word.startswith(prefix))
+
+        for word in heapq.merge(self._iter_packed_prefix(prefix), added):
+            if word not in self._removed:
+                yield word
+
+    def _iter_packed_prefix(self, prefix):
+        """Iterate over all packed strings that start with the prefix, in sorted order"""
+
+        encoded = prefix.encode("utf-8")
+        index = self._lower_bound(encoded)
+
+        while index < self._num_packed():
+            word = self._word(index)
+
+            if not word.startswith(encoded):
+                break
+
+            yield word.decode("utf-8")
+            index += 1
+
+    def has_prefix(self, prefix):
+        """Check if any string starts with the prefix"""
+        return next(self.iter_prefix(prefix), None) is not None
+
+    def _build_fuzzy_index(self):
+        """
+        Build a symmetric-delete index, which maps the crc32 of each string and of each
+        string with one character deleted to the index of the string. It is stored as two
+        arrays sorted by hash, so a lookup is a binary search in C instead of a dict entry
+        per variant.
+        """
+
+        # Pack each pair of hash and index in one int, which sorts much faster than tuples
+        pairs = []
+
+        for index in range(self._num_packed()):
+            word = self._word(index).decode("utf-8")
+
+            for variant in {word, *deletions(word)}:
+                pairs.append(zlib.crc32(variant.encode("utf-8")) << 32 | index)
+
+        pairs.sort()
+
+        hashes = array("I", (pair >> 32 for pair in pairs))
+        indices = array("I", (pair & 0xFFFFFFFF for pair in pairs))
+
+        return hashes, indices
+
+    def iter_near(self, word):
+        """
+        Iterate over all strings within one insertion, deletion, substitution or
+        transposition of adjacent characters from the word, in no particular order
+        """
+
+        if self._fuzzy_index is None:
+            with _FUZZY_INDEX_LOCK:
+                if self._fuzzy_index is None:
+                    self._fuzzy_index = self._build_fuzzy_index()
+
+        hashes, indices = self._fuzzy_index
+        seen = set()
+
+        # Two strings are within distance one only if they share the string itself or
+        # a deletion of one character
+        for variant in {word, *deletions(word)}:
+            variant_hash = zlib.crc32(variant.encode("utf-8", "surrogatepass"))
+            position = bisect.bisect_left(hashes, variant_hash)
+
+            while position < len(hashes) and hashes[position] == variant_hash:
+                index = indices[position]
+                position += 1
+
+                if index in seen:
+                    continue
+
+                seen.add(index)
+                candidate = self._word(index).decode("utf-8")
+
+                # Filter hash collisions and deletions that do not correspond to an edit
+                if within_one_edit(candidate, word) and candidate not in self._removed:
+                    yield candidate
+
+        # The strings that were added at runtime are few, so these are simply all compared
+        for candidate in self._added:
+            if within_one_edit(candidate, word):
+                yield candidate
+
+    def has_near(self, word):
+        """Check if any string is within one edit (see iter_near()) from the word"""
+        return next(self.iter_near(word), None) is not None
+
+    def __iter__(self):
+        for index in range(self._num_packed()):
+            word = self._word(index).decode("utf-8")
+
+            if word not in self._removed:
+                yield word
+
+        yield from self._added
+
+    def __len__(self):
+        return self._num_packed() - len(self._removed) + len(self._added)
+
+    def _num_packed(self):
+        """The number of packed strings, including the ones removed at runtime"""
+        return len(self._offsets) - 1
+
+    def __repr__(self):
+        return f"PackedLexicon({len(self)} strings)"
+
+
+def deletions(word):
+    """All strings obtained by deleting one character from the word"""
+    return [word[:i] + word[i + 1 :] for i in range(len(word))]
+
+
+def within_one_edit(first, second):
+    """
+    Check if two strings are equal or differ by one insertion, deletion, substitution or
+    transposition of adjacent characters, which is the same as an edit_distance() of at
+    most 1 with transpositions
+    """
+
+    if first == second:
+        return True
+
+    if len(first) < len(second):
+        first, second = second, first
+
+    if len(first) - len(second) > 1:
+        return False
+
+    # Skip the common prefix
+    i = 0
+    while i < len(second) and first[i] == second[i]:
+        i += 1
+
+    # Deletion
+    if len(first) > len(second):
+        return first[i + 1 :] == second[i:]
+
+    # Substitution or transposition
+    return first[i + 1 :] == second[i + 1 :] or (
+        first[i] == second[i + 1] and first[i + 1] == second[i] and first[i + 2 :] == second[i + 2 :]
+    )
@@ -16,6 +16,10 @@ class ListTrie:
         """Add a list to the ListTrie"""
         self.root.add(item_list, 0)
 
+    def remove(self, item_list):
+        """Remove a list from the ListTrie, if it is in the ListTrie"""
+        self.root.remove(item_list, 0)
+
     def print_all(self):
         """Print all lists in the ListTrie"""
         self.root.print_all([])
@@ -26,10 +30,13 @@ class ListTrie:
         self.root.find_all([], result)
         return result
 
-    def find_all_prefixes(self, prefix):
-        """Find all lists in the ListTrie that are a prefix of the prefix argument"""
+    def find_all_prefixes(self, prefix, start=0):
+        """
+        Find all lists in the ListTrie that are a prefix of the prefix argument, from the start
+        index on, so that callers scanning a list of tokens do not have to copy its remainder
+        """
         result = []
-        self.root.find_all_prefixes([], prefix, 0, result)
+        self.root.find_all_prefixes([], prefix, start, result)
         return result
 
 
@@ -62,6 +69,25 @@ class _ListTrieNode:
             # Recurse on the ListTrieNode corresponding to the current_item
             self.nodes[current_item].add(item_list, position + 1)
 
+    def remove(self, item_list, position):
+        """Remove a list from the ListTrie, and return whether this ListTrieNode has become
+        empty, so that the parent can remove it as well"""
+
+        # Last position of the list, make the node non terminal
+        if position == len(item_list):
+            self.is_terminal = False
+
+        # Else recurse, if the current item is in this node
+        elif item_list[position] in self.nodes:
+
+            current_item = item_list[position]
+
+            # Remove the ListTrieNode of the current item if it is empty after removing
+            if self.nodes[current_item].remove(item_list, position + 1):
+                del self.nodes[current_item]
+
+        return not self.is_terminal and not self.nodes
+
     def print_all(self, item_list):
         """Print all lists in the ListTrie"""
 
@@ -1,36 +1,113 @@
 """ This module contains all list reading functionality """
+import collections
+import functools
+import hashlib
+import os
 import re
 
+from .language import ALL_LANGUAGES
+from .language import LANGUAGES
+from .lexicon import PackedLexicon
 from .listtrie import ListTrie
+from .postcodes import PostcodeIndex
+from .utility import ReadWriteLock
+from .utility import fold
+from .utility import get_data
+from .utility import get_data_version
 from .utility import read_list
 from .tokenizer import tokenize_split
 
-#  Read first names
-FIRST_NAMES = read_list("firstname_nl.lst", min_len=2)
-FIRST_NAMES += read_list("firstname_be.lst", min_len=2)
-FIRST_NAMES += read_list("firstname_fr.lst", min_len=2)
+# Identifies the content of the lookup lists and the form in which they are stored (folded),
+# for example in cache keys
+LEXICON_VERSION = get_data_version() + "-folded"
 
-# Read last names
-SURNAMES = read_list("surname_nl.lst", encoding="utf-8", min_len=2, normalize=True)
-SURNAMES += read_list("surname_be.lst", encoding="utf-8", min_len=2, normalize=True)
-SURNAMES = [surname.lower() for surname in SURNAMES]
+if LANGUAGES != ALL_LANGUAGES:
+    LEXICON_VERSION += "-" + "-".join(LANGUAGES)
+
+# The lookup lists that only apply to one language, the other lists apply to both
+LIST_LANGUAGES = {
+    "firstname_nl.lst": "nl",
+    "firstname_fr.lst": "fr",
+    "surname_nl.lst": "nl",
+    "medischeterm.lst": "nl",
+    "medical_terms_fr.lst": "fr",
+    "top1000_du.lst": "nl",
+    "top1000_fr.lst": "fr",
+    "stopwoord.lst": "nl",
+    "stopwords_fr.lst": "fr",
+    "instellingen.lst": "nl",
+    "woonplaats.lst": "nl",
+}
+
+
+def read_language_list(list_name, **kwargs):
+    """Read a list like read_list, or nothing if it is for a language that is not loaded"""
+
+    if LIST_LANGUAGES.get(list_name, LANGUAGES[0]) not in LANGUAGES:
+        return []
+
+    return read_list(list_name, **kwargs)
+
+
+def load_lexicon(name, read_words):
+    """
+    Load a PackedLexicon from the directory in the DEDUCE_LEXICON_DIR environment variable,
+    building the file first if it does not exist yet. Without that variable, the lexicon is
+    built in memory. Files are named after the lexicon version, so stale files are never used.
+    """
+
+    directory = os.environ.get("DEDUCE_LEXICON_DIR")
+
+    if not directory:
+        return PackedLexicon(read_words())
+
+    path = os.path.join(directory, f"{name}-{LEXICON_VERSION}.lex")
+
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        PackedLexicon(read_words()).save(path)
+
+    return PackedLexicon.load(path)
+
+
+def read_first_names():
+    """Read first names, folded"""
+    return (
+        read_language_list("firstname_nl.lst", min_len=2, normalize="fold")
+        + read_list("firstname_be.lst", min_len=2, normalize="fold")
+        + read_language_list("firstname_fr.lst", min_len=2, normalize="fold")
+    )
+
+
+def read_surnames():
+    """Read last names, folded"""
+    surnames = read_language_list("surname_nl.lst", encoding="utf-8", min_len=2, normalize="fold")
+    surnames += read_list("surname_be.lst", encoding="utf-8", min_len=2, normalize="fold")
+    return surnames
+
+
+# The name lists are large, so they are stored as packed lexicons instead of lists. Like the
+# other lexicons, they only contain folded entries (see utility.fold()), which are matched
+# against the folded tokens of a text, so that matching ignores accents and case.
+FIRST_NAMES = load_lexicon("first_names", read_first_names)
+SURNAMES = load_lexicon("surnames", read_surnames)
 
 # Read interfixes (such as 'van der', etc)
-INTERFIXES = read_list("voorvoegsel.lst")
+INTERFIXES = set(read_list("voorvoegsel.lst"))
 
 # Read all surnames that frequently occur with an
 # interfix ('Jong', 'Vries' for 'de Jong', 'de Vries', etc)
-INTERFIX_SURNAMES = list(
+INTERFIX_SURNAMES = set(
     set(line.strip().split(" ")[-1] for line in read_list("achternaammetvv.lst"))
 )
 
 # Read prefixes (such as mw, dhr, pt)
-PREFIXES = read_list("prefix.lst")
+PREFIXES = set(read_list("prefix.lst"))
 
 # Read a list of medical terms
 MEDTERM = read_list("cbip.lst", encoding="latin-1")
-MEDTERM += read_list("medischeterm.lst", encoding="latin-1")
-MEDTERM += read_list("medical_terms_fr.lst", encoding="latin-1", min_len=2)
+MEDTERM += read_language_list("medischeterm.lst", encoding="latin-1")
+MEDTERM += read_language_list("medical_terms_fr.lst", encoding="latin-1", min_len=2)
 
 EPONYMS = read_list("medical_eponyms.lst", encoding="latin-1", min_len=2)
 
@@ -42,48 +119,73 @@ for eponym in read_list("medical_eponyms.lst", encoding="latin-1", min_len=2):
 MEDTERM += list(set(EPONYMS))
 
 # Read the top 1000 of most used words in Dutch, and then filter all surnames from it
-TOP1000 = read_list("top1000_fr.lst", encoding="latin-1")
-TOP1000 += read_list("top1000_du.lst", encoding="latin-1")
-TOP1000 = list(set(TOP1000).difference(read_list("firstname_nl.lst", lower=True)))
+TOP1000 = read_language_list("top1000_fr.lst", encoding="latin-1")
+TOP1000 += read_language_list("top1000_du.lst", encoding="latin-1")
+TOP1000 = list(set(TOP1000).difference(read_language_list("firstname_nl.lst", lower=True)))
 TOP1000 = list(set(TOP1000).difference(read_list("firstname_be.lst", lower=True)))
-TOP1000 = list(set(TOP1000).difference(read_list("firstname_fr.lst", lower=True)))
+TOP1000 = list(set(TOP1000).difference(read_language_list("firstname_fr.lst", lower=True)))
 
 
 # A list of stop words
 # french stopwords from https://github.com/stopwords-iso/stopwords-fr/blob/master/stopwords-fr.json
-STOPWORDS = read_list("stopwords_fr.lst")
-STOPWORDS += read_list("stopwoord.lst")
+STOPWORDS = read_language_list("stopwords_fr.lst")
+STOPWORDS += read_language_list("stopwoord.lst")
 
 # The whitelist of words that are never annotated as names consists of
 # the medical terms, the top1000 words and the stopwords
-WHITELIST = list(
-    set(line.lower() for line in MEDTERM + TOP1000 + STOPWORDS if len(line) >= 2)
-)
+WHITELIST = set(fold(line) for line in MEDTERM + TOP1000 + STOPWORDS if len(line) >= 2)
 
 ### Institutions
 
 # Read the list
 INSTITUTIONS_PREFIX = read_list("institutions_prefix.lst", min_len=2)
 
-INSTITUTIONS = read_list("instellingen.lst", min_len=3)
-INSTITUTIONS += read_list("hospitals_be.lst", min_len=3)
-INSTITUTIONS += INSTITUTIONS_PREFIX
+# The institutions on the lists, which can be updated at runtime
+INSTITUTION_ENTRIES = set(read_language_list("instellingen.lst", min_len=3))
+INSTITUTION_ENTRIES.update(read_list("hospitals_be.lst", min_len=3))
+INSTITUTION_ENTRIES.update(INSTITUTIONS_PREFIX)
+
+# Words and separators that have common variants in the names of institutions. These are
+# normalized both in the list of institutions and in the text, so that the saint, hospital and
+# separator variants of a name do not need to be stored. The variants without filler words,
+# periods or the word for hospital, and the acronyms, are still stored as separate entries
+# (see get_institution_variants()).
+SAINT_VARIANTS = {"st", "sint", "saint", "sainte"}
+HOSPITAL_VARIANTS = re.compile("ziekenhuis|zkh|hopital|kliniek|clinique")
+SEPARATOR_VARIANTS = re.compile("[ .\\-–]+")
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_institution_token(token):
+    """Normalize a folded token to the form in which institutions are stored"""
+
+    if token in SAINT_VARIANTS:
+        return "st"
+
+    if SEPARATOR_VARIANTS.fullmatch(token):
+        return " "
+
+    return HOSPITAL_VARIANTS.sub("ziekenhuis", token)
+
 
 # These words sometimes occur as the first or final word of the official names of institutions,
 # but are not usually referred to as such in the colloquial version
 FILTER_VALUES = ["dr.", "der", "van", "de", "het", "'t", "in", "d'", "les"]
 
-# New list of institutions
-FILTERED_INSTITUTIONS = []
+def get_institution_variants(institution):
+    """
+    Get the name of an institution and the variants of it that are also matched: without
+    filler words, without periods, without the word for hospital, and its acronym. Each
+    variant is stored in the trie after normalize_institution_token().
+    """
 
-# Iterate over all institutions
-for institution in INSTITUTIONS:
+    variants = []
 
-    # Convert to lower case (case matching does not work well for institutions)
-    institution = institution.lower()
+    # Fold (case and accent matching does not work well for institutions)
+    institution = fold(institution)
 
     # Add stripped version to institutions
-    FILTERED_INSTITUTIONS.append(institution.strip())
+    variants.append(institution.strip())
 
     # Filter values at start or end of words
     for filter_value in FILTER_VALUES:
@@ -100,94 +202,219 @@ for institution in INSTITUTIONS:
         )
 
     # Again, also add the stripped versions and versions with full stops removed
-    FILTERED_INSTITUTIONS.append(institution.strip())
+    variants.append(institution.strip())
     institution = institution.replace(".", "")
-    FILTERED_INSTITUTIONS.append(institution.strip())
-
-    # "st", "st." and "ziekenhuis" have common abbreviations
-    if "st" in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "sint "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "saint "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "sainte "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "sint-"))
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "saint-"))
-        FILTERED_INSTITUTIONS.append(institution.replace("st ", "sainte-"))
-
-    if "st." in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "sint "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "saint "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "sainte "))
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "sint-"))
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "saint-"))
-        FILTERED_INSTITUTIONS.append(institution.replace("st. ", "sainte-"))
-
-    if "ziekenhuis" in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("ziekenhuis", "zkh"))
-        FILTERED_INSTITUTIONS.append(institution.replace("ziekenhuis", ""))
-        FILTERED_INSTITUTIONS.append(institution.replace("ziekenhuis", "hopital"))
-        FILTERED_INSTITUTIONS.append(institution.replace("ziekenhuis", "kliniek"))
-        FILTERED_INSTITUTIONS.append(institution.replace("ziekenhuis", "clinique"))
-
-    if "hopital" in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("hopital", ""))
-        FILTERED_INSTITUTIONS.append(institution.replace("hopital", "clinique"))
-        FILTERED_INSTITUTIONS.append(institution.replace("hopital", "kliniek"))
-
-    if "clinique" in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("clinique", ""))
-        FILTERED_INSTITUTIONS.append(institution.replace("clinique", "hopital"))
-        FILTERED_INSTITUTIONS.append(institution.replace("clinique", "kliniek"))
-
-    if "kliniek" in institution:
-        FILTERED_INSTITUTIONS.append(institution.replace("kliniek", ""))
-        FILTERED_INSTITUTIONS.append(institution.replace("kliniek", "Clinique"))
+    variants.append(institution.strip())
+
+    # Also add the versions without the word for hospital, the other variants
+    # of "st" and "ziekenhuis" are covered by normalize_institution_token()
+    for hospital_variant in HOSPITAL_VARIANTS.findall(institution):
+        variants.append(" ".join(institution.replace(hospital_variant, "").split()))
 
     # If the institution name contains 3 or more words, also add the acronym
     if len(institution.split(" ")) >= 3:
         institution = institution.replace("-", " ").replace("   ", " ").replace("  ", " ")
-        FILTERED_INSTITUTIONS.append("".join(x[0] for x in institution.replace("-", " ").split(" ")))
+        variants.append("".join(x[0] for x in institution.replace("-", " ").split(" ") if x))
+
+    # Remove doubles, occurrences on whitelist and empty values (that would match whitespace)
+    return set(variants).difference(WHITELIST, {""})
 
-# Remove doubles, occurrences on whitelist, and convert back to list
-INSTITUTIONS = list(set(FILTERED_INSTITUTIONS).difference(WHITELIST))
+
+def get_normalized_institutions(institution):
+    """Get the normalized token tuples under which an institution is stored in the trie"""
+    return {
+        tuple(normalize_institution_token(token) for token in tokenize_split(variant))
+        for variant in get_institution_variants(institution)
+    }
+
+
+# Count how many institutions on the list have each normalized version, so that a version
+# is only removed at runtime when no other institution has it
+INSTITUTION_COUNTS = collections.Counter(
+    normalized
+    for institution in INSTITUTION_ENTRIES
+    for normalized in get_normalized_institutions(institution)
+)
+
+# Only keep one version of institutions that are the same after normalization
+INSTITUTIONS_NORMALIZED = set(INSTITUTION_COUNTS)
 
 ### Residences
 
 # Read the list
-RESIDENCES = read_list("woonplaats.lst", encoding="utf-8", normalize=True)
-RESIDENCES += read_list("cities_be.lst", encoding="utf-8", normalize=True)
+# The residences on the lists, which can be updated at runtime
+RESIDENCE_ENTRIES = set(read_language_list("woonplaats.lst", encoding="utf-8"))
+RESIDENCE_ENTRIES.update(read_list("cities_be.lst", encoding="utf-8"))
 
-# Remove parentheses from the names
-RESIDENCES = [re.sub("\(.+\)", "", residence) for residence in RESIDENCES]
+def get_residence_variants(residence):
+    """Get the folded name of a residence and the variants of it that are also matched"""
 
-# Strip values and remove doubles again
-RESIDENCES_SET = set(residence.strip() for residence in RESIDENCES)
+    # Remove parentheses from the name, strip it and fold it
+    residence = fold(re.sub("\(.+\)", "", residence).strip())
 
-# New copy
-FILTERED_RESIDENCES = set(RESIDENCES_SET)
+    # Also add the version with hyphen (-) replaced by whitespace
+    variants = {residence}
 
-# Also add the version with hyphen (-) replaced by whitespace
-for residence in RESIDENCES_SET:
-    FILTERED_RESIDENCES.add(residence.upper())
     if "-" in residence:
-        FILTERED_RESIDENCES.add(re.sub("\-", " ", residence))
+        variants.add(re.sub("\-", " ", residence))
 
-# Reinitialize set of RESIDENCES
-RESIDENCES_SET = set()
+    # Remove all variants that are on the whitelist
+    return set(variant for variant in variants if variant not in WHITELIST)
 
-# Remove all RESIDENCES that are on the whitelist
-for residence in FILTERED_RESIDENCES:
-    if residence.lower() not in WHITELIST:
-        RESIDENCES_SET.add(residence)
 
-RESIDENCES = list(RESIDENCES_SET)
+def get_tokenized_residences(residence):
+    """Get the folded token tuples under which a residence is stored in the trie"""
+    return {tuple(tokenize_split(variant)) for variant in get_residence_variants(residence)}
+
+
+# Count how many residences on the list have each tokenized version (see INSTITUTION_COUNTS)
+RESIDENCE_COUNTS = collections.Counter(
+    tokenized
+    for residence in RESIDENCE_ENTRIES
+    for tokenized in get_tokenized_residences(residence)
+)
+
+### Postal codes
+
+# The postal codes that exist and their municipalities, from an optional list with a code and
+# a municipality on each line. The list does not ship with deduce, so by default the index is
+# empty and every code with the structure of a Belgian or Dutch postal code is accepted.
+POSTCODES = (
+    PostcodeIndex.read(get_data("postcodes.lst"))
+    if os.path.exists(get_data("postcodes.lst"))
+    else PostcodeIndex()
+)
 
 ### Define some tries, to make lookup faster
 
 INSTITUTION_TRIE = ListTrie()
 RESIDENCES_TRIE = ListTrie()
 
-for institution in INSTITUTIONS:
-    INSTITUTION_TRIE.add(tokenize_split(institution))
+for institution in INSTITUTIONS_NORMALIZED:
+    INSTITUTION_TRIE.add(institution)
+
+for residence in RESIDENCE_COUNTS:
+    RESIDENCES_TRIE.add(residence)
+
+### Runtime updates
+
+# Annotating holds this lock as a reader, and updating the lexicons as the writer, so that
+# an annotation never sees a partial update. annotate_text(), iter_annotations() and the batch
+# functions hold it for a whole text or chunk, the annotators in annotate do not take it.
+LEXICON_LOCK = ReadWriteLock()
+
+
+def reads_lexicons(function):
+    """Decorate a function, so that the lexicons are not updated while it runs"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with LEXICON_LOCK.reading():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def _update_first_names(add, remove):
+    for name in remove:
+        FIRST_NAMES.discard(fold(name))
+
+    for name in add:
+        FIRST_NAMES.add(fold(name))
+
+
+def _update_surnames(add, remove):
+    for surname in remove:
+        SURNAMES.discard(fold(surname))
+
+    for surname in add:
+        SURNAMES.add(fold(surname))
+
+
+def _update_whitelist(add, remove):
+    WHITELIST.difference_update(fold(line) for line in remove)
+    WHITELIST.update(fold(line) for line in add if len(line) >= 2)
+
+
+def _update_trie(entries, counts, trie, get_keys, add, remove):
+    """Update the entries of a trie with variants, of which counts keeps the number of entries"""
+
+    for entry in remove:
+        if entry in entries:
+            entries.remove(entry)
+
+            for key in get_keys(entry):
+                counts[key] -= 1
+
+                if counts[key] == 0:
+                    del counts[key]
+                    trie.remove(key)
+
+    for entry in add:
+        if entry not in entries:
+            entries.add(entry)
+
+            for key in get_keys(entry):
+                counts[key] += 1
+                trie.add(key)
+
+
+def _update_institutions(add, remove):
+    _update_trie(
+        INSTITUTION_ENTRIES,
+        INSTITUTION_COUNTS,
+        INSTITUTION_TRIE,
+        get_normalized_institutions,
+        add,
+        remove,
+    )
+    INSTITUTIONS_NORMALIZED.clear()
+    INSTITUTIONS_NORMALIZED.update(INSTITUTION_COUNTS)
+
+
+def _update_residences(add, remove):
+    _update_trie(
+        RESIDENCE_ENTRIES,
+        RESIDENCE_COUNTS,
+        RESIDENCES_TRIE,
+        get_tokenized_residences,
+        add,
+        remove,
+    )
+
+
+LEXICON_UPDATERS = {
+    "first_names": _update_first_names,
+    "surnames": _update_surnames,
+    "whitelist": _update_whitelist,
+    "institutions": _update_institutions,
+    "residences": _update_residences,
+}
+
+
+def update_lexicon(lexicon, add=(), remove=()):
+    """
+    Add entries to and remove entries from a lexicon at runtime, with the same result as
+    editing its lookup lists and restarting. The lexicon is one of "first_names", "surnames",
+    "whitelist", "institutions" or "residences". An update waits for running annotations, and
+    an annotation sees the lexicons either before or after the update. Annotators that are
+    called directly, rather than through annotate_text(), should be called within
+    LEXICON_LOCK.reading() for the same guarantee. Changes to the
+    whitelist are not applied to the institutions and residences on the lists.
+    """
+
+    global LEXICON_VERSION
+
+    if lexicon not in LEXICON_UPDATERS:
+        raise ValueError(f"Unknown lexicon {lexicon}, choose from {', '.join(LEXICON_UPDATERS)}")
+
+    add = [entry.strip() for entry in add]
+    remove = [entry.strip() for entry in remove]
+
+    with LEXICON_LOCK.writing():
+        LEXICON_UPDATERS[lexicon](add, remove)
 
-for residence in RESIDENCES:
-    RESIDENCES_TRIE.add(tokenize_split(residence))
+        # Invalidate cached results
+        LEXICON_VERSION = hashlib.sha1(
+            "\x1f".join([LEXICON_VERSION, lexicon, *add, "\x1e", *remove]).encode("utf-8")
+        ).hexdigest()[:12]
@@ -0,0 +1,337 @@
+"""
+The metrics module contains a registry of counters and histograms for a service that embeds
+deduce. It follows the number of texts and characters annotated, the latency of annotate_text
+and of each stage, the number of annotations per category and the hit rates of the caches.
+The metrics render to the Prometheus text format, or to a dict.
+"""
+
+import bisect
+import re
+import threading
+from collections import Counter as _TallyCounter
+
+# The upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The opening of a tag in an annotated text
+TAG_OPENING = re.compile(r"<([A-Z]+) ")
+
+
+def _format_labels(label_names, labels, extra=()):
+    """Format label names and values as {name="value",...}, or nothing without labels"""
+
+    pairs = list(zip(label_names, labels)) + list(extra)
+
+    if not pairs:
+        return ""
+
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    """Format a value, with integers without a decimal point"""
+
+    if value == float("inf"):
+        return "+Inf"
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+
+def _snapshot_key(labels):
+    """The key of a labeled value in a snapshot, which is the label values joined by commas"""
+    return ",".join(str(label) for label in labels)
+
+
+class Counter:
+    """
+    This class contains a counter, with a value per combination of label values. The values
+    only increase, until reset() is called.
+    """
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        """Increase the value for a tuple of label values"""
+
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def inc_all(self, amounts):
+        """Increase the values for a dict of label values and amounts, at once"""
+
+        with self._lock:
+            for labels, amount in amounts.items():
+                self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        """The value for a tuple of label values"""
+
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def to_prometheus(self):
+        """The lines of the counter in the Prometheus text format"""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+
+        with self._lock:
+            values = sorted(self._values.items())
+
+        for labels, value in values:
+            lines.append(
+                f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            )
+
+        return lines
+
+    def snapshot(self):
+        """The value of the counter, or a dict of values by label values if it has labels"""
+
+        with self._lock:
+            if not self.label_names:
+                return self._values.get((), 0)
+
+            return {_snapshot_key(labels): value for labels, value in sorted(self._values.items())}
+
+
+class Histogram:
+    """
+    This class contains a histogram with fixed buckets, with counts per combination of label
+    values. An observation only increases the count of its bucket and the sum, the cumulative
+    counts are computed when the histogram is rendered.
+    """
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+
+        # For each tuple of label values, a list of the counts per bucket (with a last bucket
+        # for the values above all bounds) and the sum of the values
+        self._counts = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        """Add a value, for a tuple of label values"""
+
+        # The first bucket with an upper bound of at least the value
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts = self._counts.get(labels)
+
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0
+
+            counts[index] += 1
+            self._sums[labels] += value
+
+    def count(self, labels=()):
+        """The number of values for a tuple of label values"""
+
+        with self._lock:
+            return sum(self._counts.get(labels, ()))
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+    def _cumulative(self):
+        """The cumulative counts per upper bound, the sum and the count, per label values"""
+
+        with self._lock:
+            items = sorted(
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in self._counts.items()
+            )
+
+        for labels, counts, total in items:
+            cumulative = []
+            running_count = 0
+
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                running_count += bucket_count
+                cumulative.append((bound, running_count))
+
+            yield labels, cumulative, total, running_count
+
+    def to_prometheus(self):
+        """The lines of the histogram in the Prometheus text format"""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        for labels, cumulative, total, count in self._cumulative():
+            for bound, bucket_count in cumulative:
+                bucket_labels = _format_labels(
+                    self.label_names, labels, [("le", _format_value(bound))]
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+
+            formatted_labels = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{formatted_labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{formatted_labels} {count}")
+
+        return lines
+
+    def snapshot(self):
+        """
+        A dict with the count, the sum and the cumulative counts per upper bound, or a dict of
+        these by label values if the histogram has labels
+        """
+
+        snapshots = {}
+
+        for labels, cumulative, total, count in self._cumulative():
+            snapshots[_snapshot_key(labels)] = {
+                "count": count,
+                "sum": total,
+                "buckets": {
+                    _format_value(bound): bucket_count for bound, bucket_count in cumulative
+                },
+            }
+
+        if not self.label_names:
+            return snapshots.get("", {"count": 0, "sum": 0, "buckets": {}})
+
+        return snapshots
+
+
+class MetricsRegistry:
+    """
+    This class contains the metrics of annotate_text, which updates them when it is passed
+    the registry as its metrics argument. The updates are cheap: a few counter increments and
+    one histogram observation per text and per stage. The hits and misses of the caches that
+    are passed to annotate_text are read from the caches when the metrics are rendered. A
+    registry is shared by the threads of a process, each process of a pool has its own.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS):
+        self.documents = Counter("deduce_documents_total", "The number of texts annotated")
+        self.characters = Counter(
+            "deduce_characters_total", "The number of characters in the texts annotated"
+        )
+        self.document_seconds = Histogram(
+            "deduce_document_seconds",
+            "The time to annotate a text, in seconds",
+            buckets=latency_buckets,
+        )
+        self.stage_seconds = Histogram(
+            "deduce_stage_seconds",
+            "The time to run a stage on a text, in seconds",
+            label_names=["stage"],
+            buckets=latency_buckets,
+        )
+        self.annotations = Counter(
+            "deduce_annotations_total",
+            "The number of annotations, by category",
+            label_names=["category"],
+        )
+
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def track_cache(self, name, cache):
+        """Report the hits and misses of a cache with hits and misses attributes"""
+
+        if self._caches.get(name) is not cache:
+            with self._lock:
+                self._caches[name] = cache
+
+    def observe_stage(self, name, seconds):
+        """Record the time that a stage took"""
+        self.stage_seconds.observe(seconds, (name,))
+
+    def observe_document(self, num_characters, annotated_text, seconds):
+        """Record an annotated text, the number of its annotations per category and its latency"""
+
+        self.documents.inc()
+        self.characters.inc(num_characters)
+        self.document_seconds.observe(seconds)
+
+        categories = _TallyCounter(TAG_OPENING.findall(annotated_text))
+
+        if categories:
+            self.annotations.inc_all({(category,): count for category, count in categories.items()})
+
+    def _metrics(self):
+        return [
+            self.documents,
+            self.characters,
+            self.document_seconds,
+            self.stage_seconds,
+            self.annotations,
+        ]
+
+    def _cache_counts(self):
+        """The hits and misses per cache name"""
+
+        with self._lock:
+            caches = sorted(self._caches.items())
+
+        return [(name, cache.hits, cache.misses) for name, cache in caches]
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+
+        lines = []
+
+        for metric in self._metrics():
+            lines.extend(metric.to_prometheus())
+
+        cache_counts = self._cache_counts()
+
+        for suffix, description, index in [
+            ("hits", "The number of cache hits, by cache", 1),
+            ("misses", "The number of cache misses, by cache", 2),
+        ]:
+            name = f"deduce_cache_{suffix}_total"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+
+            for counts in cache_counts:
+                lines.append(f"{name}{_format_labels(['cache'], [counts[0]])} {counts[index]}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """The metrics as a dict, with the hit rate of each cache"""
+
+        snapshot = {metric.name: metric.snapshot() for metric in self._metrics()}
+        snapshot["deduce_caches"] = {
+            name: {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            }
+            for name, hits, misses in self._cache_counts()
+        }
+
+        return snapshot
+
+    def reset(self):
+        """Reset the counters and histograms. The counts of the caches belong to the caches."""
+
+        for metric in self._metrics():
+            metric.reset()
@@ -0,0 +1,50 @@
+"""
+The pipeline module runs annotators that are described as stages with declared inputs and
+outputs, one after the other, recording the time of each stage.
+"""
+
+import time
+
+
+class Stage:
+    """
+    A stage of the pipeline, which annotates a text with annotate(text, options). It is enabled
+    when options[flag] is true. Its inputs are the tag categories that must be annotated before
+    it runs, its outputs are the tag categories that it annotates.
+    """
+
+    def __init__(self, name, annotate, flag, inputs=(), outputs=()):
+        self.name = name
+        self.annotate = annotate
+        self.flag = flag
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+
+def run_stage(stage, text, options, metrics=None):
+    """Run a stage on a text, recording the time it took in a MetricsRegistry, if any"""
+
+    if metrics is None:
+        return stage.annotate(text, options)
+
+    start_time = time.perf_counter()
+    text = stage.annotate(text, options)
+    metrics.observe_stage(stage.name, time.perf_counter() - start_time)
+
+    return text
+
+
+def run_stages(text, stages, options, metrics=None):
+    """
+    Run the enabled stages on a text, one after the other, in order. The time of each stage is
+    recorded in the deduce.metrics.MetricsRegistry metrics, if any.
+    """
+
+    for stage in stages:
+        if options[stage.flag]:
+            text = run_stage(stage, text, options, metrics)
+
+    return text
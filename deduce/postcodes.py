@@ -0,0 +1,114 @@
+"""
+The postcodes module checks Belgian and Dutch postal codes. By default, a code is only checked
+for the structure of a postal code: four digits that do not start with a 0 for Belgium,
+followed by two capitals other than SA, SD and SS for the Netherlands. Whether the code exists
+is only checked against a PostcodeIndex that lists the codes and the municipalities they
+belong to, which is read from the optional postcodes.lst (see lookup_lists.POSTCODES). No such
+list ships with deduce.
+"""
+
+import codecs
+import re
+
+# The structure of a Belgian (1000) or Dutch (1000 AB) postal code
+POSTCODE_PATTERN = re.compile(r"([1-9]\d{3}) ?([A-Z]{2})?")
+
+# Letters that are not used in Dutch postal codes
+EXCLUDED_LETTERS = {"SA", "SD", "SS"}
+
+
+def split_postcode(code):
+    """
+    Split a postal code into its digits and its letters (None for a Belgian code)
+    :return: the (digits, letters) tuple, or None if the code does not have the structure of a
+    postal code
+    """
+
+    match = POSTCODE_PATTERN.fullmatch(code.strip())
+
+    if match is None or match.group(2) in EXCLUDED_LETTERS:
+        return None
+
+    return match.group(1), match.group(2)
+
+
+class PostcodeIndex:
+    """
+    An index of the postal codes that exist, by their digits, with the municipalities of each
+    code. An empty index accepts every code with the structure of a postal code.
+    """
+
+    def __init__(self, entries=()):
+        """
+        :param entries: the (code, municipality) tuples of the postal codes, where the
+        municipality may be None
+        """
+
+        self.municipalities = {}
+
+        for code, municipality in entries:
+            self.add(code, municipality)
+
+    def add(self, code, municipality=None):
+        """Add a postal code, and the municipality it belongs to"""
+
+        parts = split_postcode(code)
+
+        if parts is None:
+            raise ValueError(f"{code} is not a Belgian or Dutch postal code")
+
+        municipalities = self.municipalities.setdefault(parts[0], set())
+
+        if municipality:
+            municipalities.add(municipality.strip().lower())
+
+    def is_valid(self, code):
+        """Check whether a code is a postal code, and in the index if it is not empty"""
+
+        parts = split_postcode(code)
+
+        if parts is None:
+            return False
+
+        return not self.municipalities or parts[0] in self.municipalities
+
+    def matches_municipality(self, code, municipality):
+        """
+        Check whether a municipality belongs to a postal code. Without municipalities for the
+        code in the index, any municipality matches.
+        """
+
+        parts = split_postcode(code)
+
+        if parts is None:
+            return False
+
+        municipalities = self.municipalities.get(parts[0])
+
+        return not municipalities or municipality.strip().lower() in municipalities
+
+    def __contains__(self, code):
+        parts = split_postcode(code)
+        return parts is not None and parts[0] in self.municipalities
+
+    def __len__(self):
+        return len(self.municipalities)
+
+    @classmethod
+    def read(cls, path, encoding="utf-8"):
+        """
+        Read an index from a file with a postal code and its municipality on each line,
+        separated by a tab
+        """
+
+        entries = []
+
+        with codecs.open(path, encoding=encoding) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+
+                code, _, municipality = line.rstrip("\r\n").partition("\t")
+                entries.append((code, municipality or None))
+
+        return cls(entries)
@@ -0,0 +1,192 @@
+"""
+The pseudonyms module contains the PseudonymStore, which maps the values in tags to stable
+surrogate ids across documents, so that the same person gets the same id in every note
+"""
+
+import os
+import sqlite3
+import threading
+
+from .lexicon import deletions, within_one_edit
+
+
+def normalize_value(value):
+    """Normalize a value in a tag, by collapsing and stripping its whitespace"""
+    return " ".join(value.split())
+
+
+def assign_ids(values, first_id=1):
+    """
+    Assign an id to each value, in order. Like deidentify_annotations() always did, a value
+    gets the id of the first earlier value within one edit (see within_one_edit()) that got a
+    new id itself, or a new id if there is none. The values that got a new id are indexed by
+    their deletions, so this takes about linear time instead of comparing all pairs.
+    :return: a dict from each value to its id
+    """
+
+    ids = {}
+    leaders = []
+    index = {}
+
+    for value in values:
+
+        if value in ids:
+            continue
+
+        candidates = set()
+
+        for variant in {value, *deletions(value)}:
+            candidates.update(index.get(variant, ()))
+
+        matches = [leader for leader in sorted(candidates) if within_one_edit(leaders[leader], value)]
+
+        if matches:
+            ids[value] = first_id + matches[0]
+            continue
+
+        ids[value] = first_id + len(leaders)
+
+        for variant in {value, *deletions(value)}:
+            index.setdefault(variant, []).append(len(leaders))
+
+        leaders.append(value)
+
+    return ids
+
+
+class PseudonymStore:
+    """
+    This class contains a persistent store of surrogate ids, in a sqlite database. Ids are
+    numbered per scope (for instance a dataset or a patient) and per tag, and the values
+    within one edit of each other get the same id, as within a single document. Each value
+    that gets a new id is indexed by its deletions, so a lookup is a few index queries
+    instead of a scan of all values seen before. The store can be shared by threads, and by
+    processes that use the same path.
+    """
+
+    def __init__(self, path=":memory:", timeout=60):
+        """
+        Initiate the store
+        :param path: the path of the sqlite database, by default an in-memory database
+        :param timeout: the number of seconds to wait for other processes that use the database
+        """
+        self.path = path
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        """Open (or create) the database"""
+
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS pseudonyms "
+            "(scope TEXT, tag TEXT, value TEXT, id INTEGER, PRIMARY KEY (scope, tag, value));"
+            "CREATE TABLE IF NOT EXISTS variants "
+            "(scope TEXT, tag TEXT, variant TEXT, id INTEGER, value TEXT);"
+            "CREATE INDEX IF NOT EXISTS variants_lookup ON variants (scope, tag, variant);"
+            "CREATE TABLE IF NOT EXISTS counters "
+            "(scope TEXT, tag TEXT, last_id INTEGER, PRIMARY KEY (scope, tag));"
+        )
+
+    def __getstate__(self):
+        # A connection cannot be pickled, so worker processes open their own
+        if self.path == ":memory:":
+            raise TypeError("an in-memory PseudonymStore cannot be shared between processes")
+
+        return {"path": self.path, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get_ids(self, scope, tag, values):
+        """
+        Get the ids of values in a tag, in one transaction, assigning new ids to values that
+        are not within one edit of a value seen before in the same scope and tag
+        :return: a dict from each value to its id
+        """
+
+        with self._lock:
+
+            # A connection must not be used across a fork
+            if self._pid != os.getpid():
+                self._connect()
+
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                ids = {value: self._get_id(scope, tag, value) for value in values}
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+        return ids
+
+    def get_id(self, scope, tag, value):
+        """Get the id of a value in a tag, see get_ids()"""
+        return self.get_ids(scope, tag, [value])[value]
+
+    def _get_id(self, scope, tag, value):
+        """Get or assign the id of a value, within a transaction"""
+
+        connection = self._connection
+        normalized = normalize_value(value)
+
+        row = connection.execute(
+            "SELECT id FROM pseudonyms WHERE scope = ? AND tag = ? AND value = ?",
+            (scope, tag, normalized),
+        ).fetchone()
+
+        if row is not None:
+            return row[0]
+
+        variants = list({normalized, *deletions(normalized)})
+        placeholders = ", ".join("?" * len(variants))
+
+        candidates = connection.execute(
+            "SELECT DISTINCT id, value FROM variants "
+            f"WHERE scope = ? AND tag = ? AND variant IN ({placeholders}) ORDER BY id",
+            (scope, tag, *variants),
+        ).fetchall()
+
+        # The first value that got a new id and is within one edit
+        for candidate_id, candidate in candidates:
+            if within_one_edit(candidate, normalized):
+                self._insert(scope, tag, normalized, candidate_id)
+                return candidate_id
+
+        row = connection.execute(
+            "SELECT last_id FROM counters WHERE scope = ? AND tag = ?", (scope, tag)
+        ).fetchone()
+        new_id = 1 if row is None else row[0] + 1
+
+        connection.execute(
+            "INSERT OR REPLACE INTO counters VALUES (?, ?, ?)", (scope, tag, new_id)
+        )
+        connection.executemany(
+            "INSERT INTO variants VALUES (?, ?, ?, ?, ?)",
+            [(scope, tag, variant, new_id, normalized) for variant in variants],
+        )
+        self._insert(scope, tag, normalized, new_id)
+
+        return new_id
+
+    def _insert(self, scope, tag, value, value_id):
+        self._connection.execute(
+            "INSERT INTO pseudonyms VALUES (?, ?, ?, ?)", (scope, tag, value, value_id)
+        )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pseudonyms").fetchone()[0]
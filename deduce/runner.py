@@ -0,0 +1,434 @@
+"""
+The runner module annotates and deidentifies a large JSON lines file in shards, which can be
+processed by local worker processes as well as by several machines that share the output
+directory. Each shard is written atomically, followed by its checkpoint, so that a run that
+is restarted after a crash only processes the shards that were not completed yet.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .batch import PATIENT_COLUMNS, annotate_rows
+
+# The name of the manifest in the output directory
+MANIFEST_NAME = "manifest.json"
+
+# The seconds after which a lock without a host and pid is stale: its worker died between
+# creating the lock and writing it
+LOCK_GRACE_SECONDS = 60
+
+
+def _write_atomically(path, write):
+    """Write a file through write(file), so that it either exists completely or not at all"""
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory
+    )
+
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _write_json_atomically(path, value):
+    _write_atomically(path, lambda file: json.dump(value, file, indent=1))
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_shard_bounds(path, shard_size):
+    """
+    Split a file into shards of shard_size lines
+    :return: a list of the (start, end) byte offsets of the shards
+    """
+
+    starts = []
+    position = 0
+
+    with open(path, "rb") as file:
+        for index, line in enumerate(file):
+            if index % shard_size == 0:
+                starts.append(position)
+
+            position += len(line)
+
+    return list(zip(starts, starts[1:] + [position]))
+
+
+def get_shard_hashes(path, bounds):
+    """The SHA-1 hashes of the bytes of the shards of a file, as hex strings"""
+
+    hashes = []
+
+    with open(path, "rb") as file:
+        for start, end in bounds:
+            file.seek(start)
+            hashes.append(hashlib.sha1(file.read(end - start)).hexdigest())
+
+    return hashes
+
+
+def _json_options(options):
+    """The options of annotate_text() that can be stored in the manifest"""
+    return {
+        key: value
+        for key, value in sorted(options.items())
+        if value is None or isinstance(value, (bool, int, float, str))
+    }
+
+
+def get_manifest(input_path, output_dir, shard_size, options):
+    """
+    Read the manifest of a run from the output directory, or create it. The manifest contains
+    the input, the options and the byte offsets and hashes of the shards, so that all workers
+    and later runs use the same shards. When the modification time of the input changed, the
+    shards are hashed again to check that their content did not.
+    :raise ValueError: if the existing manifest is for another input, shard size or options, or
+    if the input changed
+    """
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    input_mtime = os.path.getmtime(input_path)
+    settings = {
+        "input": os.path.abspath(input_path),
+        "input_size": os.path.getsize(input_path),
+        "shard_size": shard_size,
+        "options": _json_options(options),
+    }
+
+    if os.path.exists(manifest_path):
+        manifest = _read_json(manifest_path)
+
+        for key, value in settings.items():
+            if manifest[key] != value:
+                raise ValueError(
+                    f"The {key} of the run ({value}) does not match the manifest in {output_dir} "
+                    f"({manifest[key]}), use another output directory"
+                )
+
+        # An input that is edited in place may keep its size
+        if manifest["input_mtime"] != input_mtime:
+            hashes = get_shard_hashes(input_path, manifest["shards"])
+
+            for shard, (hash_, manifest_hash) in enumerate(zip(hashes, manifest["shard_hashes"])):
+                if hash_ != manifest_hash:
+                    raise ValueError(
+                        f"Shard {shard} of the input changed since the manifest in {output_dir} "
+                        f"was written, use another output directory"
+                    )
+
+        return manifest
+
+    bounds = get_shard_bounds(input_path, shard_size)
+    manifest = dict(
+        settings,
+        input_mtime=input_mtime,
+        shards=bounds,
+        shard_hashes=get_shard_hashes(input_path, bounds),
+    )
+
+    # Other machines may write the same manifest at the same time, which is harmless
+    os.makedirs(output_dir, exist_ok=True)
+    _write_json_atomically(manifest_path, manifest)
+
+    return manifest
+
+
+def shard_path(output_dir, shard, suffix):
+    """The path of a file of a shard, such as the output (.jsonl) or checkpoint (.json)"""
+    return os.path.join(output_dir, f"shard-{shard:05d}{suffix}")
+
+
+def read_checkpoints(output_dir):
+    """Read the checkpoints of the completed shards, as a dict from shard number to report"""
+
+    checkpoints = {}
+
+    for path in sorted(glob.glob(os.path.join(output_dir, "shard-*.json"))):
+        report = _read_json(path)
+        checkpoints[report["shard"]] = report
+
+    return checkpoints
+
+
+def _is_stale(lock_path, lock_timeout):
+    """
+    Check whether a lock was left behind by a worker that died: a worker on this machine that
+    no longer runs, or any worker if the lock is older than lock_timeout seconds. A lock
+    without a host and pid is stale after LOCK_GRACE_SECONDS.
+    """
+
+    try:
+        age = time.time() - os.path.getmtime(lock_path)
+
+        with open(lock_path, encoding="utf-8") as file:
+            content = file.read().split()
+    except OSError:
+        # The lock was just removed
+        return False
+
+    if lock_timeout is not None and age > lock_timeout:
+        return True
+
+    if len(content) != 2 or not content[1].isdigit():
+        # The lock is being written, or its worker died before writing it
+        return age > LOCK_GRACE_SECONDS
+
+    host, pid = content
+
+    if host != socket.gethostname():
+        return False
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+
+    return False
+
+
+def _claim(output_dir, shard, lock_timeout):
+    """
+    Lock a shard for this worker. Creating the lock file fails if it exists, also on a shared
+    filesystem, so only one worker gets the lock.
+    :return: whether the shard was locked
+    """
+
+    lock_path = shard_path(output_dir, shard, ".lock")
+
+    for _ in range(2):
+        try:
+            file_descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not _is_stale(lock_path, lock_timeout):
+                return False
+
+            # Two workers may both break a stale lock, in which case both process the shard,
+            # with the same output
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+            continue
+
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            file.write(f"{socket.gethostname()} {os.getpid()}")
+
+        return True
+
+    return False
+
+
+def _parse_record(line, line_number):
+    """
+    A record of the input, where an empty line is a record without text
+    :raise ValueError: if the line is not a JSON object
+    """
+
+    if not line.strip():
+        return {}
+
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"Line {line_number} of the input is not valid JSON: {error}") from None
+
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {line_number} of the input is not a JSON object")
+
+    return record
+
+
+def run_shard(
+    manifest, output_dir, shard, pseudonym_store=None, scope_field=None, lock_timeout=None, **kwargs
+):
+    """
+    Annotate and deidentify the records of a shard, unless it is completed or locked by another
+    worker. The output is a JSON lines file with for each record its line number in the input,
+    its id (if any), the annotated and deidentified text and the spans.
+    :return: the report of the shard (see run_shards()), or None if it was skipped
+    """
+
+    checkpoint_path = shard_path(output_dir, shard, ".json")
+
+    if os.path.exists(checkpoint_path) or not _claim(output_dir, shard, lock_timeout):
+        return None
+
+    try:
+        # A shard may have been completed between the check and the lock
+        if os.path.exists(checkpoint_path):
+            return None
+
+        # Remove the partial output of a worker that died
+        for tmp_path in glob.glob(shard_path(output_dir, shard, ".jsonl.*.tmp")):
+            os.remove(tmp_path)
+
+        start_time = time.perf_counter()
+        start, end = manifest["shards"][shard]
+
+        with open(manifest["input"], "rb") as file:
+            file.seek(start)
+            data = file.read(end - start)
+
+        # The input may have changed since the manifest was checked
+        if hashlib.sha1(data).hexdigest() != manifest["shard_hashes"][shard]:
+            raise ValueError(f"Shard {shard} of the input changed since the manifest was written")
+
+        lines = data.decode("utf-8").split("\n")
+
+        # The last line of a shard ends with a newline, except at the end of the file
+        if lines[-1] == "":
+            lines.pop()
+
+        first_line = shard * manifest["shard_size"]
+        records = [_parse_record(line, first_line + index) for index, line in enumerate(lines)]
+        texts = [record.get("text") for record in records]
+        patients = {key: [record.get(key) for record in records] for key in PATIENT_COLUMNS}
+        scopes = [record.get(scope_field) for record in records] if scope_field else None
+
+        annotated_texts, deidentified_texts, spans = annotate_rows(
+            texts, patients, first_line, pseudonym_store, scopes, **kwargs
+        )
+
+        spans_per_line = {}
+
+        for row, tag, span_start, span_end, span_text in zip(*spans.values()):
+            spans_per_line.setdefault(row, []).append([tag, span_start, span_end, span_text])
+
+        def write_output(file):
+            for index, record in enumerate(records):
+                output = {"line": first_line + index}
+
+                if "id" in record:
+                    output["id"] = record["id"]
+
+                output["annotated"] = annotated_texts[index]
+                output["deidentified"] = deidentified_texts[index]
+                output["spans"] = spans_per_line.get(first_line + index, [])
+                file.write(json.dumps(output, ensure_ascii=False) + "\n")
+
+        _write_atomically(shard_path(output_dir, shard, ".jsonl"), write_output)
+
+        seconds = time.perf_counter() - start_time
+        num_characters = sum(len(text) for text in texts if isinstance(text, str))
+        report = {
+            "shard": shard,
+            "documents": len(records),
+            "characters": num_characters,
+            "annotations": len(spans["row"]),
+            "seconds": seconds,
+            "documents_per_second": len(records) / seconds if seconds else 0.0,
+            "characters_per_second": num_characters / seconds if seconds else 0.0,
+            "worker": f"{socket.gethostname()}:{os.getpid()}",
+        }
+
+        # The checkpoint is written after the output, so a completed shard always has both
+        _write_json_atomically(checkpoint_path, report)
+
+        return report
+
+    finally:
+        try:
+            os.remove(shard_path(output_dir, shard, ".lock"))
+        except FileNotFoundError:
+            pass
+
+
+def _run_shard(arguments):
+    """Unpack the arguments of a shard, for use with Executor.submit()"""
+    manifest, output_dir, shard, pseudonym_store, scope_field, lock_timeout, kwargs = arguments
+    return run_shard(
+        manifest, output_dir, shard, pseudonym_store, scope_field, lock_timeout, **kwargs
+    )
+
+
+def run_shards(
+    input_path,
+    output_dir,
+    shard_size=10000,
+    processes=None,
+    pseudonym_store=None,
+    scope_field=None,
+    lock_timeout=None,
+    on_shard=None,
+    **kwargs,
+):
+    """
+    Annotate and deidentify a JSON lines file in shards. Each line is an object with a text
+    and optionally the patient metadata (under the names of the annotate_text() arguments,
+    such as patient_surname) and an id. Shards that were completed earlier are skipped, so
+    a run that died can be restarted with the same arguments. Several machines can run the
+    same call on a shared output directory, they divide the shards between them.
+
+    :param input_path: the path of the JSON lines file
+    :param output_dir: the directory of the manifest, the outputs and the checkpoints
+    :param shard_size: the number of lines per shard
+    :param processes: the number of worker processes, by default the number of CPUs. With 1,
+    the shards are processed in the current process
+    :param pseudonym_store: a PseudonymStore with a path, to give the values in tags the same
+    ids across records, or None to number them per text
+    :param scope_field: the field of the records with the scope of the ids in the pseudonym
+    store, such as a patient id. By default, all records share one scope
+    :param lock_timeout: the number of seconds after which the lock of a shard by a worker on
+    another machine is broken. Locks by workers on this machine are broken when the worker no
+    longer runs
+    :param on_shard: a function that is called with the report of each completed shard
+    :param kwargs: other arguments for annotate_text(), such as dates=False
+    :return: the reports of the shards that were processed in this run, with the shard
+    number, the number of documents, characters and annotations, the seconds it took, the
+    throughput in documents and characters per second and the worker
+    """
+
+    manifest = get_manifest(input_path, output_dir, shard_size, kwargs)
+    completed = read_checkpoints(output_dir)
+
+    arguments = [
+        (manifest, output_dir, shard, pseudonym_store, scope_field, lock_timeout, kwargs)
+        for shard in range(len(manifest["shards"]))
+        if shard not in completed
+    ]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    reports = []
+
+    def add_report(report):
+        if report is not None:
+            reports.append(report)
+
+            if on_shard is not None:
+                on_shard(report)
+
+    if processes == 1 or len(arguments) <= 1:
+        for shard_arguments in arguments:
+            add_report(_run_shard(shard_arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_run_shard, shard_arguments) for shard_arguments in arguments]
+
+            for future in as_completed(futures):
+                add_report(future.result())
+
+    return sorted(reports, key=lambda report: report["shard"])
@@ -1,6 +1,8 @@
 import unittest
+from unittest.mock import patch
 
 from deduce import annotate
+from deduce.postcodes import PostcodeIndex
 
 
 class TestAnnotateMethods(unittest.TestCase):
@@ -25,6 +27,55 @@ class TestAnnotateMethods(unittest.TestCase):
         )
         self.assertEqual(expected_text, annotated_names)
 
+    def test_annotate_names_fuzzy(self):
+        text = "Vandaag kwam Pieterr langs, de Paracetamoll werd gestopt."
+        kwargs = dict(
+            patient_first_names="", patient_initial="", patient_surname="", patient_given_name=""
+        )
+        self.assertEqual(text, annotate.annotate_names(text, **kwargs))
+        self.assertEqual(
+            "Vandaag kwam <FORNAMEUNKNOWN Pieterr> langs, de Paracetamoll werd gestopt.",
+            annotate.annotate_names(text, fuzzy_names=True, **kwargs),
+        )
+
+    def test_annotate_names_fuzzy_common_words(self):
+        kwargs = dict(
+            patient_first_names="", patient_initial="", patient_surname="", patient_given_name=""
+        )
+
+        # Misspelled common words, and capitalized words that start a sentence
+        self.assertEqual(
+            "Gezien door <FORNAMEUNKNOWN Pieterr> en <FORNAMEUNKNOWN Marei>. Opname Keuken, "
+            "Tabel en Patiente.",
+            annotate.annotate_names(
+                "Gezien door Pieterr en Marei. Opname Keuken, Tabel en Patiente.",
+                fuzzy_names=True,
+                **kwargs,
+            ),
+        )
+        self.assertEqual(
+            "Vue par Mme <SURNAMEUNKNOWN Duboiss>. Traitement de la Maisonn, Examen et Patiente.",
+            annotate.annotate_names(
+                "Vue par Mme Duboiss. Traitement de la Maisonn, Examen et Patiente.",
+                fuzzy_names=True,
+                **kwargs,
+            ),
+        )
+
+    def test_is_near_whitelisted(self):
+        self.assertTrue(annotate.is_near_whitelisted("tafel"))
+        self.assertTrue(annotate.is_near_whitelisted("tabel"))
+        self.assertTrue(annotate.is_near_whitelisted("patiente"))
+        self.assertTrue(annotate.is_near_whitelisted("maisonn"))
+        self.assertFalse(annotate.is_near_whitelisted("pieterr"))
+
+    def test_annotate_names_long_token(self):
+        text = "Peeters " + "1" * 5000 + " Jan"
+        self.assertEqual(
+            "<SURNAMEPAT Peeters> " + "1" * 5000 + " <FORNAMEPAT Jan>",
+            annotate.annotate_names(text, "Jan", "J", "Peeters", "Jan"),
+        )
+
     def test_duplicated_names(self):
         text = (
             "Dank je <FORNAMEUNKNOWN Peter> van Gonzalez. Met vriendelijke groet, "
@@ -124,6 +175,22 @@ class TestAnnotateMethods(unittest.TestCase):
             "I live in <LOCATION Havikstraat 4324598> since my childhood", address
         )
 
+    def test_find_dutch_addresses(self):
+        for text in ["hetKerkstraat 5", "Xstraat 5", "Xdamarkt 12abc", "Kerkstraat 12abDorpstraat 5"]:
+            with self.subTest(text):
+                self.assertEqual(
+                    [match.group() for match in annotate.DUTCH_ADDRESS_PATTERN.finditer(text)],
+                    [match.group() for match in annotate.find_dutch_addresses(text)],
+                )
+
+    def test_find_french_addresses(self):
+        for text in ["12abc rue X", "quaimpasse Dupont", "1 2 RUE des Champs, 3", "rue rue Loi 5"]:
+            with self.subTest(text):
+                self.assertEqual(
+                    [match.group() for match in annotate.FRENCH_ADDRESS_PATTERN.finditer(text)],
+                    [match.group() for match in annotate.find_french_addresses(text)],
+                )
+
     def test_coordinating_nexus_with_preceding_name(self):
         text = "Adalberto <SURNAMEUNKNOWN Koning> en Mariangela"
         annotated = annotate.annotate_names_context(text)
@@ -136,6 +203,17 @@ class TestAnnotateMethods(unittest.TestCase):
         expected_text = 'Ik ben in <INSTITUTION Altrecht> geweest'
         self.assertEqual(expected_text, annotated_institutions_text)
 
+    def test_annotate_names_without_accents(self):
+        text = "Gezien door Helene en dokter Gabriels"
+        annotated = annotate.annotate_names(text, "Hélène", "", "", "")
+        expected_text = "Gezien door <FORNAMEPAT Helene> en dokter <SURNAMEUNKNOWN Gabriels>"
+        self.assertEqual(expected_text, annotated)
+
+    def test_annotate_residence_without_accents(self):
+        text = "Woont in Liege, LIEGE of liège"
+        expected_text = "Woont in <LOCATION Liege>, <LOCATION LIEGE> of liège"
+        self.assertEqual(expected_text, annotate.annotate_residence(text))
+
     def test_skip_mg(self):
         text = '<LOCATION Hoofdstraat> is mooi. (br)Lithiumcarbonaat 1600mg. Nog een zin'
         annotated_postcodes_text = annotate.annotate_postalcode(text)
@@ -147,6 +225,54 @@ class TestAnnotateMethods(unittest.TestCase):
         expected_text = text.replace('3500LX', '<LOCATION 3500LX>')
         self.assertEqual(expected_text, annotated_postcodes_text)
 
+    def test_annotate_postcode_near_residence(self):
+        text = "<LOCATION Brussel> 1000, 1000 <LOCATION Gent>, 2500 patiënten, 1600 mg"
+        expected_text = (
+            "<LOCATION Brussel> <LOCATION 1000>, <LOCATION 1000> <LOCATION Gent>, 2500 patiënten, "
+            "1600 mg"
+        )
+
+        # Without an index, only the structure of a code is checked, so 1000 Gent is accepted
+        with patch.object(annotate, "POSTCODES", PostcodeIndex()):
+            self.assertEqual(
+                expected_text, annotate.annotate_postalcode(text, require_residence=True)
+            )
+            self.assertEqual(
+                "<LOCATION 9999> <LOCATION Gent>",
+                annotate.annotate_postalcode("9999 <LOCATION Gent>", require_residence=True),
+            )
+
+    def test_annotate_postcode_with_index(self):
+        index = PostcodeIndex([("1000", "Brussel")])
+        text = "1000 <LOCATION Brussel>, 1000 <LOCATION Gent> en 9999"
+
+        with patch.object(annotate, "POSTCODES", index):
+            self.assertEqual(
+                "<LOCATION 1000> <LOCATION Brussel>, <LOCATION 1000> <LOCATION Gent> en 9999",
+                annotate.annotate_postalcode(text),
+            )
+            self.assertEqual(
+                "<LOCATION 1000> <LOCATION Brussel>, 1000 <LOCATION Gent> en 9999",
+                annotate.annotate_postalcode(text, require_residence=True),
+            )
+
+    def test_annotate_institution_variants(self):
+        examples = ["AZ Sint-Jan", "AZ St. Jan", "AZ Saint Jan", "AZ st-jan"]
+        for example in examples:
+            annotated = annotate.annotate_institution(f"Opname in {example} gisteren")
+            self.assertEqual(f"Opname in <INSTITUTION {example}> gisteren", annotated)
+
+    def test_annotate_institution_hospital_variants(self):
+        examples = ["Ziekenhuis Amstelland", "Hopital Amstelland", "zkh Amstelland", "Amstelland"]
+        for example in examples:
+            annotated = annotate.annotate_institution(f"Opname in het {example}")
+            self.assertEqual(f"Opname in het <INSTITUTION {example}>", annotated)
+
+    def test_normalize_institution_token(self):
+        self.assertEqual("st", annotate.normalize_institution_token("sainte"))
+        self.assertEqual(" ", annotate.normalize_institution_token(". "))
+        self.assertEqual("ziekenhuisgroep", annotate.normalize_institution_token("zkhgroep"))
+
     def test_annotate_altrecht(self):
         text = 'Opname bij xxx afgerond'
         examples = [('altrecht lunetten', '<INSTITUTION altrecht> lunetten'),
@@ -177,6 +303,23 @@ class TestAnnotateMethods(unittest.TestCase):
         annotated_dates = annotate.annotate_date(text)
         expected = '<DATE 24 april>, <DATE 1 mei>: pt gaat geen constructief contact aan'
         self.assertEqual(expected, annotated_dates)
+    def test_scan_features(self):
+        features = annotate.scan_features("pt is 64 jaar, zie www.umcu.nl")
+        self.assertTrue(features["digits"])
+        self.assertFalse(features["capitals"])
+        self.assertFalse(features["email"])
+        self.assertTrue(features["url"])
+        self.assertTrue(features["date"])
+        self.assertTrue(features["age"])
+        self.assertFalse(features["address"])
+
+    def test_scan_features_month_and_street(self):
+        features = annotate.scan_features("Vu en Août, rue de la Loi")
+        self.assertFalse(features["digits"])
+        self.assertTrue(features["capitals"])
+        self.assertTrue(features["date"])
+        self.assertFalse(features["age"])
+        self.assertTrue(features["address"])
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+import deduce
+from deduce.batch import annotate_rows, annotate_table, as_patient_value
+from deduce.pseudonyms import PseudonymStore
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+TEXTS = [
+    "Vandaag is Jan Peeters gekomen op 10 oktober.",
+    None,
+    "Tel 016 33 22 11 bij Piet",
+]
+
+
+class TestBatchMethods(unittest.TestCase):
+    def test_annotate_rows(self):
+        annotated, deidentified, spans = annotate_rows(
+            TEXTS, {"patient_first_names": ["Jan", None, "Piet"]}, row_offset=5
+        )
+        self.assertEqual(
+            "Vandaag is <PATIENT Jan Peeters> gekomen op <DATE 10 oktober>.", annotated[0]
+        )
+        self.assertIsNone(annotated[1])
+        self.assertEqual("Tel <PHONENUMBER-1> bij <PATIENT>", deidentified[2])
+        self.assertEqual([5, 5, 7, 7], spans["row"])
+        self.assertEqual(["PATIENT", "DATE", "PHONENUMBER", "PATIENT"], spans["tag"])
+
+        for row, start, end, text in zip(spans["row"], spans["start"], spans["end"], spans["text"]):
+            self.assertEqual(text, TEXTS[row - 5][start:end])
+
+    def test_annotate_rows_pseudonym_store(self):
+        texts = ["Tel 016 33 22 11", "Tel 016 44 55 66", "Tel 016 33 22 11"]
+        _, deidentified, _ = annotate_rows(
+            texts, {}, pseudonym_store=PseudonymStore(), scopes=["a", "a", "b"]
+        )
+        self.assertEqual(
+            ["Tel <PHONENUMBER-1>", "Tel <PHONENUMBER-2>", "Tel <PHONENUMBER-1>"], deidentified
+        )
+
+    def test_as_patient_value(self):
+        self.assertEqual("Jan", as_patient_value("Jan"))
+        self.assertEqual("123456", as_patient_value(123456))
+        self.assertEqual("123456", as_patient_value(123456.0))
+        self.assertEqual("", as_patient_value(None))
+        self.assertEqual("", as_patient_value(float("nan")))
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_annotate_dataframe_numeric_patient_id(self):
+        texts = ["Patient 123456 werd gezien.", "Patient 654321 werd gezien.", None]
+        table = pandas.DataFrame({"text": texts, "patient_id": [123456, None, pandas.NA]})
+        table["patient_id"] = table["patient_id"].astype("Int64")
+
+        annotated, _ = annotate_table(table, processes=1)
+
+        self.assertEqual(
+            deduce.annotate_text(texts[0], patient_id="123456"), annotated["annotated"][0]
+        )
+        self.assertIn("PATIENTNUMBER", annotated["annotated"][0])
+        self.assertEqual(deduce.annotate_text(texts[1]), annotated["annotated"][1])
+
+        # A float column, as pandas stores an int column with missing values
+        annotated, _ = annotate_table(table.astype({"patient_id": "float"}), processes=1)
+        self.assertIn("PATIENTNUMBER", annotated["annotated"][0])
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_annotate_dataframe(self):
+        table = pandas.DataFrame(
+            {"text": TEXTS, "first_name": ["Jan", None, "Piet"]}, index=[10, 11, 12]
+        )
+        texts, spans = annotate_table(
+            table, patient_columns={"patient_first_names": "first_name"}, processes=1
+        )
+        self.assertEqual([10, 11, 12], list(texts.index))
+        self.assertEqual("Vandaag is <PATIENT> gekomen op <DATE-1>.", texts["deidentified"][10])
+        self.assertEqual([10, 10, 12, 12], list(spans["row"]))
+        self.assertEqual(["row", "tag", "start", "end", "text"], list(spans.columns))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_annotate_arrow_table_in_parallel(self):
+        table = pyarrow.table({"text": TEXTS, "patient_first_names": ["Jan", None, "Piet"]})
+        texts, spans = annotate_table(table, processes=2, chunk_size=1)
+        self.assertEqual(
+            annotate_rows(TEXTS, {"patient_first_names": ["Jan", None, "Piet"]})[0],
+            texts.column("annotated").to_pylist(),
+        )
+        self.assertEqual([0, 0, 2, 2], spans.column("row").to_pylist())
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_annotate_dataframe_in_threads(self):
+        table = pandas.DataFrame({"text": TEXTS * 4, "patient_first_names": ["Jan", "Piet"] * 6})
+        texts, spans = annotate_table(table, threads=3, chunk_size=2)
+        sequential_texts, sequential_spans = annotate_table(table, processes=1)
+
+        self.assertTrue(sequential_texts.equals(texts))
+        self.assertTrue(sequential_spans.equals(spans))
+
+
+if __name__ == "__main__":
+    unittest.main()
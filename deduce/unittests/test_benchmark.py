@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from deduce.benchmark import MemorySampler, make_notes, run_configuration
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+class TestBenchmarkMethods(unittest.TestCase):
+    def test_make_notes(self):
+        texts, first_names = make_notes(10, paragraphs=2)
+
+        self.assertEqual((texts, first_names), make_notes(10, paragraphs=2))
+        self.assertEqual(10, len(first_names))
+        self.assertTrue(all(text.count("\n\n") == 1 for text in texts))
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_run_configuration(self):
+        result = run_configuration("threads", 2, 4, chunk_size=2)
+
+        self.assertEqual(("threads", 2), (result["mode"], result["workers"]))
+        self.assertGreater(result["texts_per_second"], 0)
+        self.assertIn("worker_peak_rss_mb", result)
+        self.assertRaises(ValueError, run_configuration, "fibers", 2, 4, 2)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/smaps_rollup"), "PSS is only known on Linux")
+    def test_memory_sampler_counts_children(self):
+        with MemorySampler() as parent_sampler:
+            pass
+
+        # A child that allocates 100 MB of its own
+        code = "import time; data = bytearray(100 * 2**20); time.sleep(0.5)"
+
+        with MemorySampler(interval=0.02) as sampler:
+            subprocess.run([sys.executable, "-c", code], check=True)
+
+        self.assertGreater(sampler.peak_pss_mb, parent_sampler.peak_pss_mb + 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
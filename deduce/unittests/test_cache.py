@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import deduce
+from deduce.cache import ResultCache, SegmentCache, make_key
+
+
+class TestCacheMethods(unittest.TestCase):
+    def test_make_key_separates_parts(self):
+        self.assertNotEqual(make_key("ab", "c"), make_key("a", "bc"))
+        self.assertEqual(make_key("ab", "c"), make_key("ab", "c"))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertEqual("1", cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual("3", cache.get("c"))
+        self.assertEqual(2, len(cache))
+
+    def test_disk_tier_persists(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.sqlite")
+            cache = ResultCache(path=path)
+            cache.put("a", "<PERSON Jan>")
+            cache.close()
+
+            cache = ResultCache(path=path)
+            self.assertEqual("<PERSON Jan>", cache.get("a"))
+            cache.close()
+
+    def test_disk_tier_size_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.sqlite")
+            cache = ResultCache(max_entries=0, path=path, max_disk_bytes=10)
+            cache.put("a", "12345")
+            cache.put("b", "12345")
+            cache.put("c", "12345")
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual("12345", cache.get("c"))
+            cache.close()
+
+    def test_annotate_text_uses_cache(self):
+        text = "Vandaag is Jan gekomen"
+        cache = ResultCache()
+        first = deduce.annotate_text(text, patient_first_names="Jan", cache=cache)
+
+        with patch.object(deduce.deduce, "annotate_names") as annotate_names:
+            second = deduce.annotate_text(text, patient_first_names="Jan", cache=cache)
+
+        annotate_names.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(1, cache.hits)
+
+    def test_annotate_text_cache_hit_skips_language_detection(self):
+        text = "Vandaag is Jan gekomen bij de huisarts"
+        cache = ResultCache()
+        first = deduce.annotate_text(text, language="auto", cache=cache)
+
+        with patch.object(deduce.deduce, "resolve_language") as resolve_language:
+            second = deduce.annotate_text(text, language="auto", cache=cache)
+
+        resolve_language.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(1, cache.hits)
+
+    def test_annotate_text_cache_key_includes_patient(self):
+        text = "Vandaag is Jan gekomen"
+        cache = ResultCache()
+        deduce.annotate_text(text, patient_first_names="Jan", cache=cache)
+        annotated = deduce.annotate_text(text, patient_first_names="Piet", cache=cache)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(deduce.annotate_text(text, patient_first_names="Piet"), annotated)
+
+    def test_segment_cache_reuses_paragraphs(self):
+        calls = []
+
+        def annotator(text):
+            calls.append(text)
+            return text.upper()
+
+        cache = SegmentCache()
+        first = cache.annotate(annotator, "header\n\nbody one")
+        second = cache.annotate(annotator, "header\n\nbody two")
+        self.assertEqual("HEADER\n\nBODY ONE", first)
+        self.assertEqual("HEADER\n\nBODY TWO", second)
+        self.assertEqual(["header", "\n\nbody one", "\n\nbody two"], calls)
+        self.assertEqual(1, cache.hits)
+
+    def test_annotate_text_with_segment_cache(self):
+        header = "UZ Leuven, Herestraat 49, Leuven. Tel 016 33 22 11"
+        texts = [
+            header + "\n\nVandaag is Jan gekomen",
+            header + "\n\nPeter de Visser is 64 jaar oud",
+        ]
+        cache = SegmentCache()
+        for text in texts:
+            self.assertEqual(
+                deduce.annotate_text(text, patient_first_names="Jan"),
+                deduce.annotate_text(text, patient_first_names="Jan", segment_cache=cache),
+            )
+        self.assertGreater(cache.hits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+
+from deduce.corpus import CorpusReader
+
+DOCUMENTS = [
+    "Patiënt Jan Peeters werd gezien op 10/10/2020.",
+    "",
+    "Tél 016 33 22 11, e-mail: jan@voorbeeld.be\n\nÉvalué à Namur.",
+]
+
+
+class TestCorpusMethods(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "corpus.txt")
+
+        with open(self.path, "w", encoding="utf-8", newline="") as file:
+            file.write("\x1e".join(DOCUMENTS) + "\x1e")
+
+        self.reader = CorpusReader(self.path, separator="\x1e")
+
+    def tearDown(self):
+        self.reader.close()
+        self.directory.cleanup()
+
+    def test_documents(self):
+        self.assertEqual(3, len(self.reader))
+        self.assertEqual(DOCUMENTS, list(self.reader))
+        self.assertEqual(DOCUMENTS[2], self.reader[-1])
+
+    def test_char_offset(self):
+        self.assertEqual(len(DOCUMENTS[0]) + 2, self.reader.char_offset(2))
+
+    def test_iter_annotations(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        decoded = data.decode("utf-8")
+        annotations = list(self.reader.iter_annotations(patient_first_names="Jan"))
+
+        self.assertEqual(
+            [0, 0, 2, 2, 2],
+            [annotation.document for annotation in annotations],
+        )
+
+        for annotation in annotations:
+            document = DOCUMENTS[annotation.document]
+
+            self.assertEqual(annotation.text_, document[annotation.start_ix : annotation.end_ix])
+            self.assertEqual(
+                annotation.text_,
+                decoded[annotation.global_start_ix : annotation.global_end_ix],
+            )
+            self.assertEqual(
+                annotation.text_,
+                data[annotation.start_byte : annotation.end_byte].decode("utf-8"),
+            )
+
+    def test_write_standoff(self):
+        file = StringIO()
+        self.reader.write_standoff(file, patient_first_names="Jan")
+        lines = file.getvalue().splitlines()
+
+        self.assertEqual("document\ttag\tstart_byte\tend_byte\tstart\tend", lines[0])
+        self.assertEqual(6, len(lines))
+
+    def test_empty_file(self):
+        path = os.path.join(self.directory.name, "empty.txt")
+        open(path, "w").close()
+
+        with CorpusReader(path) as reader:
+            self.assertEqual(0, len(reader))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+import deduce
+from deduce.dates import DateAnnotation, date_shift_days, parse_dates, shift_dates
+
+
+class TestDatesMethods(unittest.TestCase):
+    def assertParsed(self, expected, value):
+        dates = parse_dates(value)
+        self.assertEqual(expected, [(date.year, date.month, date.day) for date in dates])
+
+    def test_parse_numeric_dates(self):
+        self.assertParsed([(2020, 10, 10)], "10/10/2020")
+        self.assertParsed([(2020, 4, 3)], "3.04.2020")
+        self.assertParsed([(1985, 4, 3)], "03/04/85")
+        self.assertParsed([(None, 10, 10)], "10/10")
+
+    def test_parse_month_names(self):
+        self.assertParsed([(2020, 3, 3)], "3 maart 2020")
+        self.assertParsed([(2021, 3, 4)], "lundi 4 mars 2021")
+        self.assertParsed([(2020, 3, None)], "Mars 2020")
+        self.assertParsed([(None, 5, 12)], "12 MEI")
+        self.assertParsed([(2020, None, None)], "2020")
+
+    def test_parse_ranges(self):
+        self.assertParsed([(2020, 10, 10), (2020, 10, 12)], "10/10/2020 - 12/10/2020")
+
+    def test_parse_invalid(self):
+        self.assertIsNone(parse_dates("31/02/2020"))
+        self.assertIsNone(parse_dates("14/13/2020"))
+        self.assertIsNone(parse_dates("3 maart <PERSON Jan>"))
+        self.assertIsNone(parse_dates("3 maart 2020 tot"))
+
+    def test_shift_dates(self):
+        self.assertEqual("9/11/2020", shift_dates("10/10/2020", 30))
+        self.assertEqual("28/02/19", shift_dates("03/04/20", -400))
+        self.assertEqual("2 april 2020", shift_dates("3 maart 2020", 30))
+        self.assertEqual("Samedi 3 avril 2021", shift_dates("Lundi 4 mars 2021", 30))
+        self.assertEqual("JANVIER 2020", shift_dates("MARS 2020", -60))
+        self.assertEqual("9/11/2020 - 11/11/2020", shift_dates("10/10/2020 - 12/10/2020", 30))
+        self.assertIsNone(shift_dates("31/02/2020", 30))
+        self.assertEqual("31 januari 0001", shift_dates("1 januari 0001", 30))
+        self.assertEqual("1/1/0100", shift_dates("31/12/0099", 1))
+        self.assertIsNone(shift_dates("31 december 9999", 30))
+        self.assertIsNone(shift_dates("1/1/0001 - 5/1/0001", -30))
+
+    def test_shift_dates_limits(self):
+        # A year is shifted from 1 July
+        self.assertEqual("2020", shift_dates("2020", 30))
+        self.assertEqual("2020", shift_dates("2020", -180))
+        self.assertEqual("2019", shift_dates("2020", -200))
+
+        # A range within one date is not parsed
+        self.assertIsNone(shift_dates("10-12 oktober", 30))
+
+    def test_date_shift_days(self):
+        keys = [f"patient {index}" for index in range(50)]
+        days = [date_shift_days(key, "secret", max_days=10) for key in keys]
+
+        self.assertEqual(days, [date_shift_days(key, b"secret", 10) for key in keys])
+        self.assertTrue(all(-10 <= day <= 10 and day != 0 for day in days))
+        self.assertNotEqual(days, [date_shift_days(key, "other", 10) for key in keys])
+
+    def test_iter_dates(self):
+        text = "Opgenomen op 10/10/2020 en gezien op 31/02/2020."
+
+        self.assertEqual(
+            [
+                DateAnnotation(13, 23, "10/10/2020", 2020, 10, 10),
+                DateAnnotation(37, 47, "31/02/2020"),
+            ],
+            list(deduce.iter_dates(text)),
+        )
+
+    def test_deidentify_date_shift(self):
+        annotated = (
+            "Opgenomen op <DATE 10/10/2020>, ontslagen op <DATE 3 maart 2021> en <DATE 31/02/2020>."
+        )
+
+        self.assertEqual(
+            "Opgenomen op 10/9/2020, ontslagen op 1 februari 2021 en <DATE-1>.",
+            deduce.deidentify_annotations(annotated, date_shift=-30),
+        )
+
+    def test_deidentify_date_shift_outside_tag(self):
+        # The text outside of the tag is not shifted
+        self.assertEqual(
+            "maandag 4 maart 2021",
+            deduce.deidentify_annotations("maandag <DATE 3 maart 2021>", date_shift=1),
+        )
+        self.assertEqual(
+            "10-11 november 2020",
+            deduce.deidentify_annotations("10-<DATE 12 oktober 2020>", date_shift=30),
+        )
+        self.assertEqual(
+            "<DATE-1>", deduce.deidentify_annotations("<DATE 10-12 oktober>", date_shift=30)
+        )
+
+    def test_deidentify_date_shift_out_of_range(self):
+        annotated = "Opname op <DATE 31 december 9999> en <DATE 10/10/2020>."
+
+        self.assertEqual(
+            "Opname op <DATE-1> en 9/11/2020.",
+            deduce.deidentify_annotations(annotated, date_shift=30),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import patch
 
 import deduce
+from deduce.pseudonyms import PseudonymStore
 from deduce.utility import Annotation
 
 
@@ -120,6 +121,83 @@ class TestDeduceMethods(unittest.TestCase):
         self.assertEqual(1, len(annotations))
         self.assertEqual(Annotation(13, 16, "PATIENT", "Jan"), annotations[0])
 
+    def test_skip_annotators_without_features(self):
+        text = " pt heeft geen klachten "
+        with patch.object(deduce.deduce, "annotate_names") as annotate_names:
+            with patch.object(deduce.deduce, "annotate_date") as annotate_date:
+                annotated = deduce.annotate_text(text)
+        annotate_names.assert_not_called()
+        annotate_date.assert_not_called()
+        self.assertEqual("pt heeft geen klachten", annotated)
+
+    def test_do_not_skip_names_with_patient_names(self):
+        text = "jan heeft geen klachten"
+        annotated = deduce.annotate_text(text, patient_first_names="Jan")
+        self.assertEqual("<PATIENT jan> heeft geen klachten", annotated)
+
+    def test_iter_annotations(self):
+        text = "Jan Peeters woont in Leuven.\n\n Tel 016 33 22 11 op 10/10/2020\n\n"
+        annotations = list(deduce.iter_annotations(text, patient_first_names="Jan"))
+        self.assertEqual(
+            [
+                Annotation(0, 11, "PATIENT", "Jan Peeters"),
+                Annotation(21, 27, "LOCATION", "Leuven"),
+                Annotation(35, 47, "PHONENUMBER", "016 33 22 11"),
+                Annotation(51, 61, "DATE", "10/10/2020"),
+            ],
+            annotations,
+        )
+
+    def test_iter_annotations_stops_early(self):
+        text = "Jan Peeters\n\nPiet Janssens"
+        with patch.object(
+            deduce.deduce, "annotate_text", wraps=deduce.deduce.annotate_text
+        ) as annotate_text:
+            first = next(deduce.iter_annotations(text, patient_first_names="Jan"))
+        self.assertEqual(Annotation(0, 11, "PATIENT", "Jan Peeters"), first)
+        self.assertEqual(1, annotate_text.call_count)
+
+    def test_reannotate(self):
+        old_text = "Jan Peeters woont in Leuven.\n\nBrief van Piet\n\nTel 016 33 22 11"
+        new_text = "Jan Peeters woont in Leuven.\n\nBrief van Piet Janssens\n\nTel 016 33 22 11"
+        old_annotations = list(deduce.iter_annotations(old_text, patient_first_names="Jan"))
+        with patch.object(
+            deduce.deduce, "annotate_text", wraps=deduce.deduce.annotate_text
+        ) as annotate_text:
+            annotations = deduce.reannotate(
+                old_text, old_annotations, new_text, patient_first_names="Jan"
+            )
+        annotate_text.assert_called_once_with("\n\nBrief van Piet Janssens", patient_first_names="Jan")
+        self.assertEqual(
+            list(deduce.iter_annotations(new_text, patient_first_names="Jan")), annotations
+        )
+        self.assertEqual(Annotation(59, 71, "PHONENUMBER", "016 33 22 11"), annotations[-1])
+
+    def test_reannotate_joined_paragraphs(self):
+        old_text = "Jan Peeters\n\nPiet Janssens"
+        new_text = "Jan Peeters\nPiet Janssens"
+        old_annotations = list(deduce.iter_annotations(old_text))
+        self.assertEqual(
+            list(deduce.iter_annotations(new_text)),
+            deduce.reannotate(old_text, old_annotations, new_text),
+        )
+
+    def test_annotate_text_postal_codes(self):
+        text = "Woont in 1000 Brussel, dosis 2500 mg, 4000 stappen"
+
+        self.assertEqual(
+            "Woont in 1000 <LOCATION Brussel>, dosis 2500 mg, 4000 stappen",
+            deduce.annotate_text(text),
+        )
+        self.assertEqual(
+            "Woont in <LOCATION 1000 Brussel>, dosis 2500 mg, 4000 stappen",
+            deduce.annotate_text(text, postal_codes=True),
+        )
+        self.assertEqual(
+            "Woont in <LOCATION 1000 Brussel>, dosis 2500 mg, <LOCATION 4000> stappen",
+            deduce.annotate_text(text, postal_codes=True, postal_codes_near_residences=False),
+        )
+
     def test_has_nested_tags_true(self):
         text = "<PERSON Peter <INSTITUTION Altrecht>>"
         self.assertTrue(deduce.deduce.has_nested_tags(text))
@@ -149,5 +227,31 @@ class TestDeduceMethods(unittest.TestCase):
         )
 
 
+    def test_deidentify_annotations(self):
+        text = (
+            "<PATIENT Jan> zag <PERSON Piet> en <PERSON Peit> in <LOCATION Gent>, "
+            "<PERSON Marie> en <PERSON Piet>"
+        )
+        self.assertEqual(
+            "<PATIENT> zag <PERSON-1> en <PERSON-1> in <LOCATION-1>, <PERSON-2> en <PERSON-1>",
+            deduce.deidentify_annotations(text),
+        )
+
+    def test_deidentify_annotations_pseudonym_store(self):
+        store = PseudonymStore()
+
+        self.assertEqual(
+            "<PERSON-1> en <PERSON-2>",
+            deduce.deidentify_annotations("<PERSON Piet> en <PERSON Marie>", store),
+        )
+        self.assertEqual(
+            "<PERSON-3> en <PERSON-2>",
+            deduce.deidentify_annotations("<PERSON Anna> en <PERSON Mari>", store),
+        )
+        self.assertEqual(
+            "<PERSON-1>", deduce.deidentify_annotations("<PERSON Anna>", store, "other")
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
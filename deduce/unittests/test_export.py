@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from deduce.export import (
+    deidentify_spans,
+    export_brat,
+    export_documents,
+    write_brat,
+    write_conll,
+)
+from deduce.utility import Annotation
+
+TEXT = "Jan Peeters woont in\nBrussel, zoals Jan."
+ANNOTATIONS = [
+    Annotation(0, 11, "PATIENT", "Jan Peeters"),
+    Annotation(21, 28, "LOCATION", "Brussel"),
+    Annotation(36, 39, "PERSON", "Jan"),
+]
+
+
+class TestExportMethods(unittest.TestCase):
+    def test_deidentify_spans(self):
+        self.assertEqual(
+            "<PATIENT> woont in\n<LOCATION-1>, zoals <PERSON-1>.",
+            deidentify_spans(TEXT, ANNOTATIONS),
+        )
+
+    def test_write_brat(self):
+        file = io.StringIO()
+        text = "Dr. Jan\nPeeters"
+
+        annotations = [Annotation(4, 15, "PERSON", "Jan\nPeeters")]
+
+        self.assertEqual(3, write_brat(file, text, annotations, first_id=2))
+        self.assertEqual("T2\tPERSON 4 7;8 15\tJan Peeters\n", file.getvalue())
+
+    def test_write_conll(self):
+        file = io.StringIO()
+        write_conll(file, TEXT, iter(ANNOTATIONS))
+
+        self.assertEqual(
+            "Jan\tB-PATIENT\nPeeters\tI-PATIENT\nwoont\tO\nin\tO\nBrussel\tB-LOCATION\n,\tO\n"
+            "zoals\tO\nJan\tB-PERSON\n.\tO\n\n",
+            file.getvalue(),
+        )
+
+    def test_export_documents(self):
+        records = [
+            {"id": "a", "text": "Tel 016 33 22 11 bij Piet"},
+            {"text": None},
+            {"text": "Vandaag is Jan gekomen.", "patient_first_names": "Jan"},
+        ]
+        file = io.StringIO()
+        export_documents(records, file, deidentified=True)
+
+        self.assertEqual(
+            '{"id": "a", "spans": [{"tag": "PHONENUMBER", "start": 4, "end": 16, '
+            '"text": "016 33 22 11"}, {"tag": "PERSON", "start": 21, "end": 25, "text": "Piet"}], '
+            '"deidentified": "Tel <PHONENUMBER-1> bij <PERSON-1>"}\n'
+            '{"id": 2, "spans": [{"tag": "PATIENT", "start": 11, "end": 14, "text": "Jan"}], '
+            '"deidentified": "Vandaag is <PATIENT> gekomen."}\n',
+            file.getvalue(),
+        )
+        self.assertRaises(ValueError, export_documents, records, file, format="xml")
+
+    def test_export_documents_numeric_patient_id(self):
+        file = io.StringIO()
+        export_documents(
+            [{"id": 1, "text": "Patient 123456 werd gezien.", "patient_id": 123456}], file
+        )
+
+        self.assertEqual(
+            [{"tag": "PATIENTNUMBER", "start": 8, "end": 14, "text": "123456"}],
+            json.loads(file.getvalue())["spans"],
+        )
+
+    def test_export_brat(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_brat([{"id": "note", "text": "Gezien door Piet."}], directory)
+
+            with open(os.path.join(directory, "note.txt"), encoding="utf-8") as file:
+                self.assertEqual("Gezien door Piet.", file.read())
+
+            with open(os.path.join(directory, "note.ann"), encoding="utf-8") as file:
+                self.assertEqual("T1\tPERSON 12 16\tPiet\n", file.read())
+
+    def test_export_brat_invalid_id(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_dir = os.path.join(directory, "output")
+
+            for document_id in ["sub/x", "../x", "..\\x", ".."]:
+                self.assertRaises(
+                    ValueError,
+                    export_brat,
+                    [{"id": document_id, "text": "Gezien door Piet."}],
+                    output_dir,
+                )
+
+            self.assertEqual(["output"], os.listdir(directory))
+            self.assertEqual([], os.listdir(output_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
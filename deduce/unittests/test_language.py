@@ -0,0 +1,101 @@
+import os
+import unittest
+from unittest.mock import patch
+
+import deduce
+from deduce import annotate
+from deduce.language import count_markers, detect_language, get_languages, resolve_language
+
+DUTCH_TEXT = "De patiënt werd opgenomen in het ziekenhuis omdat hij niet meer kon stappen."
+FRENCH_TEXT = "Le patient a été hospitalisé parce qu'il ne pouvait plus marcher."
+
+
+class TestLanguageMethods(unittest.TestCase):
+    def test_count_markers(self):
+        self.assertEqual({"nl": 0, "fr": 0}, count_markers("de en"))
+        self.assertEqual(
+            {"nl": 1, "fr": 1}, count_markers("het patient est", max_characters=15)
+        )
+
+    def test_detect_language(self):
+        self.assertEqual("nl", detect_language(DUTCH_TEXT))
+        self.assertEqual("fr", detect_language(FRENCH_TEXT))
+
+    def test_detect_language_fallback(self):
+        self.assertIsNone(detect_language(""))
+        self.assertIsNone(detect_language("Dr. Jan Peeters, 016 33 22 11"))
+        self.assertIsNone(detect_language(DUTCH_TEXT + " " + FRENCH_TEXT))
+
+    def test_resolve_language(self):
+        self.assertIsNone(resolve_language(DUTCH_TEXT))
+        self.assertEqual("fr", resolve_language(DUTCH_TEXT, "fr"))
+        self.assertEqual("nl", resolve_language(DUTCH_TEXT, "auto"))
+        self.assertRaises(ValueError, resolve_language, DUTCH_TEXT, "en")
+
+    def test_get_languages(self):
+        with patch.dict(os.environ, {"DEDUCE_LANGUAGES": ""}):
+            self.assertEqual(("nl", "fr"), get_languages())
+
+        with patch.dict(os.environ, {"DEDUCE_LANGUAGES": "fr, nl"}):
+            self.assertEqual(("nl", "fr"), get_languages())
+
+        with patch.dict(os.environ, {"DEDUCE_LANGUAGES": "fr"}):
+            self.assertEqual(("fr",), get_languages())
+
+        with patch.dict(os.environ, {"DEDUCE_LANGUAGES": "de"}):
+            self.assertRaises(ValueError, get_languages)
+
+    def test_annotate_date(self):
+        text = "gezien op 3 maart 2020 en le 4 mars 2021"
+
+        self.assertEqual(
+            "gezien op <DATE 3 maart 2020> en le <DATE 4 mars 2021>",
+            deduce.annotate_text(text),
+        )
+        self.assertEqual(
+            "gezien op <DATE 3 maart 2020> en le 4 mars <DATE 2021>",
+            deduce.annotate_text(text, language="nl"),
+        )
+        self.assertEqual(
+            "gezien op 3 maart <DATE 2020> en le <DATE 4 mars 2021>",
+            deduce.annotate_text(text, language="fr"),
+        )
+
+    def test_annotate_age(self):
+        text = "45 jaar, 46 ans"
+
+        self.assertEqual("<AGE 45> jaar, <AGE 46> ans", annotate.annotate_age(text))
+        self.assertEqual("<AGE 45> jaar, 46 ans", annotate.annotate_age(text, "nl"))
+        self.assertEqual("45 jaar, <AGE 46> ans", annotate.annotate_age(text, "fr"))
+
+    def test_annotate_address(self):
+        text = "Kerkstraat 5 en rue de la Loi 16"
+
+        self.assertEqual(
+            "<LOCATION Kerkstraat 5> en<LOCATION rue de la Loi 16> ",
+            annotate.annotate_address(text),
+        )
+        self.assertEqual(
+            "<LOCATION Kerkstraat 5> en rue de la Loi 16", annotate.annotate_address(text, "nl")
+        )
+        self.assertEqual(
+            "Kerkstraat 5 en<LOCATION rue de la Loi 16> ", annotate.annotate_address(text, "fr")
+        )
+
+    def test_annotate_text(self):
+        text = "Patiënt is 45 jaar en woont in de Kerkstraat 5. Hij is niet meer zo mobiel."
+        expected = (
+            "Patiënt is <AGE 45> jaar en woont in de <LOCATION Kerkstraat 5>. "
+            "Hij is niet meer zo mobiel."
+        )
+
+        self.assertEqual(expected, deduce.annotate_text(text))
+        self.assertEqual(expected, deduce.annotate_text(text, language="auto"))
+        self.assertEqual(
+            "Patiënt is 45 jaar en woont in de Kerkstraat 5. Hij is niet meer zo mobiel.",
+            deduce.annotate_text(text, language="fr"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from deduce.lexicon import PackedLexicon, within_one_edit
+
+
+class TestLexiconMethods(unittest.TestCase):
+    def test_contains(self):
+        lexicon = PackedLexicon(["Jan", "Johan", "Élise", "Jan"])
+        self.assertIn("Jan", lexicon)
+        self.assertIn("Élise", lexicon)
+        self.assertNotIn("Ja", lexicon)
+        self.assertNotIn("jan", lexicon)
+        self.assertNotIn("", lexicon)
+        self.assertNotIn(None, lexicon)
+        self.assertEqual(3, len(lexicon))
+
+    def test_iter_sorted(self):
+        lexicon = PackedLexicon(["Piet", "Jan", "Johan"])
+        self.assertEqual(["Jan", "Johan", "Piet"], list(lexicon))
+
+    def test_prefix(self):
+        lexicon = PackedLexicon(["Jan", "Janneke", "Johan", "Piet"])
+        self.assertEqual(["Jan", "Janneke"], list(lexicon.iter_prefix("Jan")))
+        self.assertTrue(lexicon.has_prefix("Jo"))
+        self.assertFalse(lexicon.has_prefix("Ka"))
+        self.assertFalse(lexicon.has_prefix("Pieter"))
+
+    def test_iter_near(self):
+        lexicon = PackedLexicon(["Jan", "Johan", "Pieter", "Piet", "Élise"])
+        self.assertEqual(["Pieter"], sorted(lexicon.iter_near("Pieterr")))
+        self.assertEqual(["Jan"], sorted(lexicon.iter_near("Jna")))
+        self.assertEqual(["Jan"], sorted(lexicon.iter_near("Jan")))
+        self.assertEqual(["Élise"], sorted(lexicon.iter_near("Elise")))
+        self.assertEqual(["Piet", "Pieter"], sorted(lexicon.iter_near("Piete")))
+        self.assertFalse(lexicon.has_near("Kees"))
+
+    def test_iter_near_in_threads(self):
+        lexicon = PackedLexicon(["Jan", "Johan", "Pieter", "Piet"])
+        build = lexicon._build_fuzzy_index
+        results = []
+
+        with patch.object(lexicon, "_build_fuzzy_index", side_effect=build) as mock_build:
+            threads = [
+                threading.Thread(target=lambda: results.append(sorted(lexicon.iter_near("Piete"))))
+                for _ in range(8)
+            ]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, mock_build.call_count)
+        self.assertEqual([["Piet", "Pieter"]] * 8, results)
+
+    def test_within_one_edit(self):
+        self.assertTrue(within_one_edit("Jan", "Jan"))
+        self.assertTrue(within_one_edit("Jan", "Jaan"))
+        self.assertTrue(within_one_edit("Jan", "Ja"))
+        self.assertTrue(within_one_edit("Jan", "Jen"))
+        self.assertTrue(within_one_edit("Jan", "Jna"))
+        self.assertFalse(within_one_edit("Jan", "naJ"))
+        self.assertFalse(within_one_edit("Jan", "J"))
+        self.assertFalse(within_one_edit("Jan", "Jnaa"))
+
+    def test_add_discard(self):
+        lexicon = PackedLexicon(["Jan", "Johan", "Piet"])
+        lexicon.add("Jana")
+        lexicon.discard("Johan")
+        lexicon.discard("Kees")
+        self.assertIn("Jana", lexicon)
+        self.assertNotIn("Johan", lexicon)
+        self.assertEqual(3, len(lexicon))
+        self.assertEqual(["Jan", "Jana"], list(lexicon.iter_prefix("J")))
+        self.assertEqual(["Jan", "Jana"], sorted(lexicon.iter_near("Jan")))
+        lexicon.add("Johan")
+        self.assertIn("Johan", lexicon)
+        self.assertEqual(["Jan", "Jana", "Johan", "Piet"], sorted(lexicon))
+
+    def test_save_after_add(self):
+        lexicon = PackedLexicon(["Jan", "Piet"])
+        lexicon.add("Kees")
+        lexicon.discard("Piet")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "names.lex")
+            lexicon.save(path)
+            self.assertEqual(["Jan", "Kees"], list(PackedLexicon.load(path)))
+
+    def test_empty(self):
+        lexicon = PackedLexicon()
+        self.assertNotIn("Jan", lexicon)
+        self.assertEqual([], list(lexicon))
+
+    def test_save_load(self):
+        words = ["Jan", "Johan", "Élise", "Piet"] + [f"Name{i}" for i in range(1000)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "names.lex")
+            PackedLexicon(words).save(path)
+            lexicon = PackedLexicon.load(path)
+            self.assertEqual(sorted(words), list(lexicon))
+            self.assertTrue(all(word in lexicon for word in words))
+            self.assertNotIn("Name1000", lexicon)
+            self.assertEqual(["Name999"], list(lexicon.iter_prefix("Name999")))
+
+    def test_load_invalid_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "names.lex")
+            with open(path, "wb") as file:
+                file.write(b"Jan\nPiet\n" * 10)
+            self.assertRaises(ValueError, PackedLexicon.load, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
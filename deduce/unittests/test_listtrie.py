@@ -0,0 +1,38 @@
+import unittest
+
+from deduce.listtrie import ListTrie
+
+
+class TestListTrieMethods(unittest.TestCase):
+    def test_find_all_prefixes(self):
+        trie = ListTrie()
+        trie.add(["a"])
+        trie.add(["a", "b", "c"])
+        self.assertEqual([["a"], ["a", "b", "c"]], trie.find_all_prefixes(["a", "b", "c", "d"]))
+        self.assertEqual([["a"]], trie.find_all_prefixes(["a", "b"]))
+
+    def test_find_all_prefixes_start(self):
+        trie = ListTrie()
+        trie.add(["a", "b"])
+        self.assertEqual([["a", "b"]], trie.find_all_prefixes(["x", "a", "b"], 1))
+        self.assertEqual([], trie.find_all_prefixes(["x", "a", "b"], 2))
+
+    def test_remove(self):
+        trie = ListTrie()
+        trie.add(["a"])
+        trie.add(["a", "b", "c"])
+        trie.remove(["a", "b", "c"])
+        self.assertEqual([["a"]], trie.find_all_prefixes(["a", "b", "c"]))
+        self.assertEqual({}, trie.root.nodes["a"].nodes)
+
+    def test_remove_keeps_longer_lists(self):
+        trie = ListTrie()
+        trie.add(["a"])
+        trie.add(["a", "b"])
+        trie.remove(["a"])
+        trie.remove(["x", "y"])
+        self.assertEqual([["a", "b"]], trie.find_all_prefixes(["a", "b"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import threading
+import time
+import unittest
+
+import deduce
+from deduce import lookup_lists
+
+
+class TestLookupListsMethods(unittest.TestCase):
+    def test_update_names(self):
+        text = "Verpleegster Zorglub en collega Peeters"
+        try:
+            lookup_lists.update_lexicon("first_names", add=["Zorglub"])
+            lookup_lists.update_lexicon("surnames", remove=["Peeters"])
+            self.assertEqual(
+                "Verpleegster <PERSON Zorglub> en collega Peeters", deduce.annotate_text(text)
+            )
+        finally:
+            lookup_lists.update_lexicon("first_names", remove=["Zorglub"])
+            lookup_lists.update_lexicon("surnames", add=["Peeters"])
+
+        self.assertEqual(
+            "Verpleegster Zorglub en collega <PERSON Peeters>", deduce.annotate_text(text)
+        )
+
+    def test_folded_lexicons(self):
+        self.assertIn("helene", lookup_lists.FIRST_NAMES)
+        self.assertNotIn("Hélène", lookup_lists.FIRST_NAMES)
+        self.assertIn("gabriels", lookup_lists.SURNAMES)
+        self.assertIn(("liege",), lookup_lists.RESIDENCE_COUNTS)
+
+    def test_update_folded_names(self):
+        text = "Verpleegster Zorglüb en ZORGLÜB"
+        try:
+            lookup_lists.update_lexicon("first_names", add=["Zorglub"])
+            self.assertEqual("Verpleegster <PERSON Zorglüb> en ZORGLÜB", deduce.annotate_text(text))
+        finally:
+            lookup_lists.update_lexicon("first_names", remove=["ZORGLUB"])
+
+        self.assertEqual(text, deduce.annotate_text(text))
+
+    def test_update_institutions_and_residences(self):
+        text = "Opname in het Wardziekenhuis Oost in Blablastad"
+        try:
+            lookup_lists.update_lexicon("institutions", add=["Wardziekenhuis Oost"])
+            lookup_lists.update_lexicon("residences", add=["Blablastad"])
+            self.assertEqual(
+                "Opname in het <INSTITUTION Wardziekenhuis Oost> in <LOCATION Blablastad>",
+                deduce.annotate_text(text),
+            )
+            self.assertEqual(
+                "Opname in het <INSTITUTION Wardkliniek Oost> in <LOCATION BLABLASTAD>",
+                deduce.annotate_text("Opname in het Wardkliniek Oost in BLABLASTAD"),
+            )
+        finally:
+            lookup_lists.update_lexicon("institutions", remove=["Wardziekenhuis Oost"])
+            lookup_lists.update_lexicon("residences", remove=["Blablastad"])
+
+        self.assertEqual(text, deduce.annotate_text(text))
+
+    def test_remove_shared_variant(self):
+        counts = dict(lookup_lists.RESIDENCE_COUNTS)
+        try:
+            lookup_lists.update_lexicon("residences", add=["Leuven (Vlaams-Brabant)"])
+            lookup_lists.update_lexicon("residences", remove=["Leuven (Vlaams-Brabant)"])
+        finally:
+            self.assertEqual(counts, dict(lookup_lists.RESIDENCE_COUNTS))
+        self.assertEqual("<LOCATION Leuven>", deduce.annotate_text("Leuven"))
+
+    def test_update_changes_version(self):
+        version = lookup_lists.LEXICON_VERSION
+        try:
+            lookup_lists.update_lexicon("whitelist", add=["Zorglub"])
+            self.assertIn("zorglub", lookup_lists.WHITELIST)
+            self.assertNotEqual(version, lookup_lists.LEXICON_VERSION)
+        finally:
+            lookup_lists.update_lexicon("whitelist", remove=["Zorglub"])
+
+    def test_unknown_lexicon(self):
+        self.assertRaises(ValueError, lookup_lists.update_lexicon, "streets", add=["Kerkstraat"])
+
+    def test_update_waits_for_annotation(self):
+        updated = threading.Event()
+
+        def update():
+            lookup_lists.update_lexicon("whitelist", add=["Zorglub"])
+            updated.set()
+
+        try:
+            with lookup_lists.LEXICON_LOCK.reading():
+                thread = threading.Thread(target=update)
+                thread.start()
+                time.sleep(0.05)
+                self.assertFalse(updated.is_set())
+            thread.join()
+            self.assertTrue(updated.is_set())
+        finally:
+            lookup_lists.update_lexicon("whitelist", remove=["Zorglub"])
+
+    def test_update_does_not_wait_for_iter_annotations(self):
+        try:
+            annotations = deduce.iter_annotations("Jan Peeters\n\nGezien door Zorglub")
+            self.assertEqual("PERSON", next(annotations).tag)
+
+            # A half-consumed generator does not hold the lexicon lock
+            thread = threading.Thread(
+                target=lookup_lists.update_lexicon, args=("surnames",), kwargs={"add": ["Zorglub"]}
+            )
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+
+            # The next paragraph is annotated with the updated lexicons
+            self.assertEqual(["PERSON"], [annotation.tag for annotation in annotations])
+        finally:
+            lookup_lists.update_lexicon("surnames", remove=["Zorglub"])
+
+    def test_update_while_reading_raises(self):
+        with lookup_lists.LEXICON_LOCK.reading():
+            self.assertRaises(
+                RuntimeError, lookup_lists.update_lexicon, "whitelist", add=["Zorglub"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
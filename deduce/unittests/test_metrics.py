@@ -0,0 +1,104 @@
+import unittest
+
+import deduce
+from deduce.cache import ResultCache
+from deduce.metrics import Counter, Histogram, MetricsRegistry
+
+TEXT = "Dhr. Jan Peeters werd op 10/10/2020 gezien in Leuven, tel 016 33 22 11."
+
+
+class TestMetricsMethods(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter("requests_total", "Requests", label_names=["path"])
+        counter.inc(labels=("/a",))
+        counter.inc(2, labels=("/a",))
+        counter.inc_all({("/b",): 5})
+
+        self.assertEqual(3, counter.value(("/a",)))
+        self.assertEqual({"/a": 3, "/b": 5}, counter.snapshot())
+        self.assertEqual(
+            [
+                "# HELP requests_total Requests",
+                "# TYPE requests_total counter",
+                'requests_total{path="/a"} 3',
+                'requests_total{path="/b"} 5',
+            ],
+            counter.to_prometheus(),
+        )
+
+    def test_histogram(self):
+        histogram = Histogram("latency_seconds", "Latency", buckets=[0.1, 1])
+
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(4, histogram.count())
+        self.assertEqual(
+            {"count": 4, "sum": 3.65, "buckets": {"0.1": 2, "1": 3, "+Inf": 4}},
+            histogram.snapshot(),
+        )
+        self.assertEqual(
+            [
+                "# HELP latency_seconds Latency",
+                "# TYPE latency_seconds histogram",
+                'latency_seconds_bucket{le="0.1"} 2',
+                'latency_seconds_bucket{le="1"} 3',
+                'latency_seconds_bucket{le="+Inf"} 4',
+                "latency_seconds_sum 3.65",
+                "latency_seconds_count 4",
+            ],
+            histogram.to_prometheus(),
+        )
+
+    def test_escape_label_values(self):
+        counter = Counter("names_total", "Names", label_names=["name"])
+        counter.inc(labels=('a "b"\\\n',))
+        self.assertEqual('names_total{name="a \\"b\\"\\\\\\n"} 1', counter.to_prometheus()[-1])
+
+    def test_annotate_text(self):
+        metrics = MetricsRegistry()
+        annotated_text = deduce.annotate_text(
+            TEXT, patient_first_names="Jan", patient_surname="Peeters", metrics=metrics
+        )
+
+        self.assertEqual(1, metrics.documents.value())
+        self.assertEqual(len(TEXT), metrics.characters.value())
+        self.assertEqual(1, metrics.document_seconds.count())
+        self.assertEqual(1, metrics.stage_seconds.count(("names",)))
+        self.assertEqual(annotated_text.count("<PATIENT "), metrics.annotations.value(("PATIENT",)))
+        self.assertEqual(1, metrics.annotations.value(("DATE",)))
+
+    def test_disabled_stages(self):
+        metrics = MetricsRegistry()
+        deduce.annotate_text(TEXT, dates=False, metrics=metrics)
+
+        self.assertEqual(0, metrics.stage_seconds.count(("dates",)))
+        self.assertEqual(0, metrics.annotations.value(("DATE",)))
+
+    def test_cache_hit_rate(self):
+        metrics = MetricsRegistry()
+        cache = ResultCache()
+
+        for _ in range(4):
+            deduce.annotate_text(TEXT, cache=cache, metrics=metrics)
+
+        self.assertEqual(4, metrics.documents.value())
+        self.assertEqual(1, metrics.stage_seconds.count(("names",)))
+        self.assertEqual(
+            {"result": {"hits": 3, "misses": 1, "hit_rate": 0.75}},
+            metrics.snapshot()["deduce_caches"],
+        )
+        self.assertIn('deduce_cache_hits_total{cache="result"} 3', metrics.to_prometheus())
+
+    def test_reset(self):
+        metrics = MetricsRegistry()
+        deduce.annotate_text(TEXT, metrics=metrics)
+        metrics.reset()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(0, snapshot["deduce_documents_total"])
+        self.assertEqual({}, snapshot["deduce_stage_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
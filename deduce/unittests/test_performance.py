@@ -0,0 +1,120 @@
+"""
+Scaling tests, which check that the main functions take about linear time in the length of
+the text, so that a quadratic regression does not go unnoticed. Timings depend on the machine
+and its load, so these only run when the DEDUCE_PERF_TESTS environment variable is set (see
+make perftest).
+"""
+
+import os
+import time
+import unittest
+
+import deduce
+from deduce.annotate import annotate_institution, annotate_names, annotate_names_context
+from deduce.deduce import merge_adjacent_tags
+from deduce.tokenizer import tokenize_split
+from deduce.utility import flatten_text_all_phi
+
+# A letter with names, institutions, dates, addresses and tags, which is repeated to scale
+PARAGRAPH = (
+    "Dhr. Jan Peeters (geb. 10/10/1950) werd op 3 maart gezien door dr. Van der Berg in het "
+    "UZA, Wilrijkstraat 10, 2650 Edegem. Tel 03 821 30 00, e-mail j.peeters@uza.be. "
+    "Mme Dubois et Marie Dupont, à la Clinique Saint-Jean de Bruxelles, âgée de 64 ans. "
+    "Patient 123456 wordt verder opgevolgd door huisarts P. de Vries en Anna Claes.\n\n"
+)
+
+# The size of the smallest input, and the maximum ratio of the time for an input four times
+# as large. Linear scaling gives a ratio of about 4, quadratic scaling a ratio of 16.
+NUM_PARAGRAPHS = 40
+MAX_RATIO = 8
+
+# Worst-case inputs, with long runs of the characters that the patterns repeat and backtrack
+# over. These scale with the same n as the paragraphs, to a few thousand characters.
+ADVERSARIAL_INPUTS = {
+    "digits": lambda n: "1" * 25 * n,
+    "brackets": lambda n: "<" * 25 * n + ">" * 25 * n,
+    "capitals": lambda n: "Jan Piet Marie Anna Peeters Dupont " * 25 * n,
+    "url_host": lambda n: "http://" + "a" * 25 * n + "!",
+    "url_colon": lambda n: "http://" + ":" * 25 * n,
+    "email": lambda n: "a." * 25 * n + "@",
+    "email_words": lambda n: "x" * 25 * n + "@" + "y." * 25 * n,
+    "street": lambda n: "Kerkstraat " + "1" * 25 * n,
+    "street_capitals": lambda n: "AB" * 25 * n,
+    "rue": lambda n: "12 rue" + " de" * 25 * n + " x",
+    "institution_tag": lambda n: "<INSTITUTION " + "ab " * 25 * n + "x> <PERSON y>",
+}
+
+
+def min_time(function, argument, repeat=5):
+    """The minimum time of a number of calls, which is the least sensitive to noise"""
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+@unittest.skipUnless(os.environ.get("DEDUCE_PERF_TESTS"), "DEDUCE_PERF_TESTS is not set")
+class TestPerformance(unittest.TestCase):
+    def assert_linear(self, function, make_input):
+        small = make_input(NUM_PARAGRAPHS)
+        large = make_input(4 * NUM_PARAGRAPHS)
+
+        # Warm up caches, such as compiled regular expressions and the fuzzy name index
+        function(small)
+
+        ratio = min_time(function, large) / min_time(function, small)
+        self.assertLess(ratio, MAX_RATIO, f"{function.__name__} scales with a ratio of {ratio:.1f}")
+
+    def test_tokenize_split(self):
+        self.assert_linear(tokenize_split, lambda n: PARAGRAPH * n)
+
+    def test_annotate_names(self):
+        def annotate(text):
+            return annotate_names(text, "Jan", "J", "Peeters", "Jan")
+
+        self.assert_linear(annotate, lambda n: PARAGRAPH * n)
+
+    def test_annotate_names_context(self):
+        names_text = annotate_names(PARAGRAPH, "Jan", "J", "Peeters", "Jan") + "\n\n"
+        self.assert_linear(annotate_names_context, lambda n: names_text * n)
+
+    def test_annotate_institution(self):
+        self.assert_linear(annotate_institution, lambda n: PARAGRAPH * n)
+
+    def test_merge_adjacent_tags(self):
+        annotated_text = deduce.annotate_text(PARAGRAPH, flatten=False) + "\n\n"
+        self.assert_linear(merge_adjacent_tags, lambda n: annotated_text * 10 * n)
+
+    def test_flatten_text_all_phi(self):
+        annotated_text = deduce.annotate_text(PARAGRAPH, flatten=False) + "\n\n"
+        self.assert_linear(flatten_text_all_phi, lambda n: annotated_text * 10 * n)
+
+    def test_deidentify_annotations(self):
+        # Distinct values, so that the grouping of similar values is exercised as well
+        def make_input(n):
+            return "".join(
+                f"<PERSON Naam{i}> en <LOCATION Plaats{i % 50}> op <DATE {i} maart>. "
+                for i in range(20 * n)
+            )
+
+        self.assert_linear(deduce.deidentify_annotations, make_input)
+
+    def test_annotate_text(self):
+        self.assert_linear(deduce.annotate_text, lambda n: PARAGRAPH * n)
+
+    def test_annotate_text_adversarial(self):
+        def annotate(text):
+            return deduce.annotate_text(text, patient_first_names="Jan", patient_surname="Peeters")
+
+        for name, make_input in ADVERSARIAL_INPUTS.items():
+            with self.subTest(name):
+                self.assert_linear(annotate, make_input)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from deduce.metrics import MetricsRegistry
+from deduce.pipeline import Stage, run_stages
+
+
+def annotate_upper(text, options):
+    return text.replace("JAN", "<PERSON JAN>")
+
+
+def annotate_digits(text, options):
+    return text.replace("123", "<PHONENUMBER 123>")
+
+
+def strip_text(text, options):
+    return text.strip()
+
+
+class TestPipelineMethods(unittest.TestCase):
+    def test_run_stages(self):
+        stages = [
+            Stage("upper", annotate_upper, "flag", outputs=["PERSON"]),
+            Stage("digits", annotate_digits, "flag", outputs=["PHONENUMBER"]),
+            Stage("strip", strip_text, "other_flag", inputs=["PERSON"]),
+        ]
+        options = {"flag": True, "other_flag": False}
+        metrics = MetricsRegistry()
+
+        self.assertEqual(
+            " <PERSON JAN> belt <PHONENUMBER 123> ",
+            run_stages(" JAN belt 123 ", stages, options, metrics),
+        )
+        self.assertEqual(1, metrics.stage_seconds.count(("upper",)))
+        self.assertEqual(0, metrics.stage_seconds.count(("strip",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
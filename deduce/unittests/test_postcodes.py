@@ -0,0 +1,37 @@
+import unittest
+
+from deduce.postcodes import PostcodeIndex, split_postcode
+
+
+class TestPostcodesMethods(unittest.TestCase):
+    def test_split_postcode(self):
+        self.assertEqual(("1000", None), split_postcode("1000"))
+        self.assertEqual(("3500", "LX"), split_postcode("3500 LX"))
+        self.assertEqual(("3500", "LX"), split_postcode("3500LX"))
+        self.assertIsNone(split_postcode("0123"))
+        self.assertIsNone(split_postcode("12345"))
+        self.assertIsNone(split_postcode("3500 lx"))
+        self.assertIsNone(split_postcode("3500 SS"))
+
+    def test_empty_index(self):
+        index = PostcodeIndex()
+
+        self.assertTrue(index.is_valid("9999"))
+        self.assertFalse(index.is_valid("0999"))
+        self.assertTrue(index.matches_municipality("1000", "Gent"))
+
+    def test_index(self):
+        index = PostcodeIndex([("1000", "Brussel"), ("1000", "Bruxelles"), ("3500 LX", None)])
+
+        self.assertEqual(2, len(index))
+        self.assertIn("1000", index)
+        self.assertTrue(index.is_valid("3500 AB"))
+        self.assertFalse(index.is_valid("9999"))
+        self.assertTrue(index.matches_municipality("1000", "BRUXELLES"))
+        self.assertFalse(index.matches_municipality("1000", "Gent"))
+        self.assertTrue(index.matches_municipality("3500LX", "Utrecht"))
+        self.assertRaises(ValueError, index.add, "100", "Brussel")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from deduce.pseudonyms import PseudonymStore, assign_ids, normalize_value
+
+
+class TestPseudonymsMethods(unittest.TestCase):
+    def test_normalize_value(self):
+        self.assertEqual("Jan Peeters", normalize_value(" Jan \n Peeters"))
+
+    def test_assign_ids(self):
+        # abcd is within one edit of abc, but not of ab, which gave abc its id
+        self.assertEqual(
+            {"ab": 1, "xyz": 2, "abc": 1, "abcd": 3, "xy": 2},
+            assign_ids(["ab", "xyz", "abc", "abcd", "ab", "xy"]),
+        )
+
+    def test_get_ids(self):
+        store = PseudonymStore()
+
+        self.assertEqual({"Jan": 1, "Piet": 2}, store.get_ids("", "PERSON", ["Jan", "Piet"]))
+        self.assertEqual({"Jna": 1, "Marie": 3}, store.get_ids("", "PERSON", ["Jna", "Marie"]))
+        self.assertEqual(1, store.get_id("", "PERSON", " Jan "))
+        self.assertEqual(4, len(store))
+
+    def test_get_ids_scopes(self):
+        store = PseudonymStore()
+
+        self.assertEqual(1, store.get_id("patient 1", "PERSON", "Jan"))
+        self.assertEqual(1, store.get_id("patient 2", "PERSON", "Piet"))
+        self.assertEqual(1, store.get_id("patient 1", "LOCATION", "Gent"))
+        self.assertEqual(2, store.get_id("patient 1", "PERSON", "Piet"))
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pseudonyms.sqlite")
+
+            store = PseudonymStore(path)
+            store.get_ids("", "PERSON", ["Jan", "Piet"])
+            store.close()
+
+            store = pickle.loads(pickle.dumps(PseudonymStore(path)))
+            self.assertEqual({"Piet": 2, "Marie": 3}, store.get_ids("", "PERSON", ["Piet", "Marie"]))
+            store.close()
+
+    def test_pickle_in_memory(self):
+        with self.assertRaises(TypeError):
+            pickle.dumps(PseudonymStore())
+
+
+if __name__ == "__main__":
+    unittest.main()
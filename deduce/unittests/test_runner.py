@@ -0,0 +1,187 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from deduce.runner import (
+    LOCK_GRACE_SECONDS,
+    get_shard_bounds,
+    read_checkpoints,
+    run_shards,
+    shard_path,
+)
+
+RECORDS = [
+    {
+        "id": "a",
+        "text": "Vandaag is Jan Peeters gekomen op 10 oktober.",
+        "patient_first_names": "Jan",
+    },
+    {"id": "b", "text": "Tel 016 33 22 11 bij Piet"},
+    {},
+    {"id": "d", "text": "Le patient Jean Dubois a 45 ans."},
+    {"id": "e", "text": "Geen PHI hier."},
+]
+
+
+def read_output(output_dir):
+    outputs = []
+
+    for shard in sorted(read_checkpoints(output_dir)):
+        with open(shard_path(output_dir, shard, ".jsonl"), encoding="utf-8") as file:
+            outputs.extend(json.loads(line) for line in file)
+
+    return outputs
+
+
+class TestRunnerMethods(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, "notes.jsonl")
+        self.output_dir = os.path.join(self.directory.name, "output")
+
+        with open(self.input_path, "w", encoding="utf-8") as file:
+            for record in RECORDS:
+                file.write((json.dumps(record) if record else "") + "\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_shard_bounds(self):
+        with open(self.input_path, "rb") as file:
+            lines = file.read().split(b"\n")
+
+        bounds = get_shard_bounds(self.input_path, 2)
+
+        self.assertEqual(3, len(bounds))
+        self.assertEqual((0, len(lines[0]) + len(lines[1]) + 2), bounds[0])
+        self.assertEqual(os.path.getsize(self.input_path), bounds[-1][1])
+
+    def test_run_shards(self):
+        reports = run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        outputs = read_output(self.output_dir)
+
+        self.assertEqual([0, 1, 2], [report["shard"] for report in reports])
+        self.assertEqual([2, 2, 1], [report["documents"] for report in reports])
+        self.assertEqual([0, 1, 2, 3, 4], [output["line"] for output in outputs])
+        self.assertEqual("a", outputs[0]["id"])
+        self.assertEqual("Vandaag is <PATIENT> gekomen op <DATE-1>.", outputs[0]["deidentified"])
+        self.assertEqual(
+            [["PHONENUMBER", 4, 16, "016 33 22 11"], ["PERSON", 21, 25, "Piet"]],
+            outputs[1]["spans"],
+        )
+        self.assertEqual(
+            {"line": 2, "annotated": None, "deidentified": None, "spans": []}, outputs[2]
+        )
+
+    def test_resume(self):
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+        # A worker died while processing the second shard
+        os.remove(shard_path(self.output_dir, 1, ".json"))
+
+        with open(shard_path(self.output_dir, 1, ".lock"), "w", encoding="utf-8") as file:
+            file.write(f"{socket.gethostname()} {2 ** 22 + 1}")
+
+        reports = run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+        self.assertEqual([1], [report["shard"] for report in reports])
+        self.assertEqual(5, len(read_output(self.output_dir)))
+        self.assertFalse(os.path.exists(shard_path(self.output_dir, 1, ".lock")))
+
+    def test_locked_shard(self):
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        os.remove(shard_path(self.output_dir, 0, ".json"))
+
+        # Another machine is processing the first shard
+        with open(shard_path(self.output_dir, 0, ".lock"), "w", encoding="utf-8") as file:
+            file.write("other-host 1")
+
+        self.assertEqual([], run_shards(self.input_path, self.output_dir, shard_size=2, processes=1))
+
+        # Until its lock times out
+        reports = run_shards(
+            self.input_path, self.output_dir, shard_size=2, processes=1, lock_timeout=-1
+        )
+        self.assertEqual([0], [report["shard"] for report in reports])
+
+    def test_empty_lock(self):
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        os.remove(shard_path(self.output_dir, 0, ".json"))
+
+        # A worker is writing its lock
+        lock_path = shard_path(self.output_dir, 0, ".lock")
+        open(lock_path, "w", encoding="utf-8").close()
+
+        self.assertEqual([], run_shards(self.input_path, self.output_dir, shard_size=2, processes=1))
+
+        # Or it died before writing it
+        past = time.time() - LOCK_GRACE_SECONDS - 1
+        os.utime(lock_path, (past, past))
+
+        reports = run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        self.assertEqual([0], [report["shard"] for report in reports])
+
+    def test_manifest_mismatch(self):
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+        self.assertRaises(
+            ValueError, run_shards, self.input_path, self.output_dir, shard_size=3, processes=1
+        )
+        self.assertRaises(
+            ValueError, run_shards, self.input_path, self.output_dir, shard_size=2, dates=False
+        )
+
+    def test_input_changed(self):
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        os.remove(shard_path(self.output_dir, 2, ".json"))
+
+        # Touching the input without changing it is fine
+        os.utime(self.input_path, (time.time() + 10, time.time() + 10))
+        reports = run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+        self.assertEqual([2], [report["shard"] for report in reports])
+
+        # Editing it in place, with the same size, is not
+        with open(self.input_path, "r+", encoding="utf-8") as file:
+            file.seek(len('{"id": "'))
+            file.write("z")
+
+        os.utime(self.input_path, (time.time() + 20, time.time() + 20))
+
+        with self.assertRaisesRegex(ValueError, "Shard 0 of the input changed"):
+            run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+    def test_record_not_an_object(self):
+        with open(self.input_path, "a", encoding="utf-8") as file:
+            file.write('["Jan Peeters"]\n')
+
+        with self.assertRaisesRegex(ValueError, "Line 5 of the input is not a JSON object"):
+            run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+    def test_numeric_patient_id(self):
+        with open(self.input_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"text": "Patient 123456 werd gezien.", "patient_id": 123456}))
+
+        run_shards(self.input_path, self.output_dir, shard_size=2, processes=1)
+
+        self.assertEqual(
+            [["PATIENTNUMBER", 8, 14, "123456"]], read_output(self.output_dir)[0]["spans"]
+        )
+
+    def test_run_shards_in_parallel(self):
+        reports = []
+        run_shards(
+            self.input_path, self.output_dir, shard_size=1, processes=2, on_shard=reports.append
+        )
+
+        sequential_dir = os.path.join(self.directory.name, "sequential")
+        run_shards(self.input_path, sequential_dir, shard_size=1, processes=1)
+
+        self.assertEqual(5, len(reports))
+        self.assertEqual(read_output(sequential_dir), read_output(self.output_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,12 @@
 import codecs
+import re
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
 from deduce import utility
+from deduce.tokenizer import tokenize_split
 from deduce.utility import Annotation
 
 
@@ -31,6 +35,19 @@ class TestUtilityMethods(unittest.TestCase):
         ]
         self.assertEqual(expected_tags, found_tags)
 
+    def test_bracket_depths(self):
+        self.assertEqual(([0, 3, 7, 8, 10], [1, 2, 1, 0, -1]), utility.bracket_depths("<A <B c>> >"))
+
+    def test_tag_spans(self):
+        self.assertEqual([(2, 7), (8, 11)], utility.tag_spans("a <B c> <D> e>"))
+        self.assertEqual([(0, 13), (14, None)], utility.tag_spans("<A <B c> <D>> <E"))
+        self.assertEqual([(6, 11), (12, None)], utility.tag_spans("a > < <B c> <"))
+
+    def test_split_tags(self):
+        self.assertEqual(
+            ["a ", "<B <C d>>", " e ", "<F g"], utility.split_tags("a <B <C d>> e <F g")
+        )
+
     def test_get_annotations(self):
         text = (
             "Dit is stukje tekst met daarin de naam <FORNAMEPAT Jan> <SURNAMEPAT Jansen>. De "
@@ -91,11 +108,73 @@ class TestUtilityMethods(unittest.TestCase):
     def test_get_first_non_whitespace(self):
         self.assertEqual(1, utility.get_first_non_whitespace(" Overleg"))
 
+    def test_split_paragraphs(self):
+        text = "Header\n\nBody <LOCATION a\n\nb>\n \nFooter"
+        segments = utility.split_paragraphs(text)
+        self.assertEqual(
+            ["Header", "\n\nBody <LOCATION a\n\nb>", "\n \nFooter"], segments
+        )
+        self.assertEqual(text, "".join(segments))
+
+    def test_common_prefix_length(self):
+        self.assertEqual(3, utility.common_prefix_length("abcd", "abce"))
+        self.assertEqual(2, utility.common_prefix_length("ab", "abc"))
+        self.assertEqual(0, utility.common_prefix_length("", "abc"))
+        self.assertEqual(5, utility.common_prefix_length("aaaaab", "aaaaac", block_size=2))
+
+    def test_common_suffix_length(self):
+        self.assertEqual(3, utility.common_suffix_length("xbcd", "ybcd"))
+        self.assertEqual(2, utility.common_suffix_length("bc", "abc"))
+        self.assertEqual(0, utility.common_suffix_length("abc", ""))
+        self.assertEqual(5, utility.common_suffix_length("baaaaa", "caaaaa", block_size=2))
+
+    def test_read_write_lock(self):
+        lock = utility.ReadWriteLock()
+        with lock.reading():
+            with lock.reading():
+                pass
+        with lock.writing():
+            pass
+        with lock.reading():
+            pass
+
+    def test_read_write_lock_reentrant_read(self):
+        lock = utility.ReadWriteLock()
+        written = threading.Event()
+
+        def write():
+            with lock.writing():
+                written.set()
+
+        with lock.reading():
+            thread = threading.Thread(target=write)
+            thread.start()
+            time.sleep(0.05)
+
+            # A waiting writer blocks new readers, but not a nested read
+            with lock.reading():
+                self.assertFalse(written.is_set())
+
+            self.assertRaises(RuntimeError, lock.writing().__enter__)
+
+        thread.join()
+        self.assertTrue(written.is_set())
+
     def test_normalize_value(self):
         ascii_str = "Something about Vincent Menger!"
         value = utility._normalize_value("¡" + ascii_str)
         self.assertEqual(ascii_str, value)
 
+    def test_fold(self):
+        self.assertEqual("helene", utility.fold("Hélène"))
+        self.assertEqual("helene", utility.fold("HÉLÈNE"))
+        self.assertEqual("gabriels strasse", utility.fold("Gabriëls Straße"))
+
+    def test_read_list_fold(self):
+        with patch.object(codecs, "open", return_value=["Hélène", "Helene", "HELENE"]) as _:
+            read_list = utility.read_list("input_file_name", normalize="fold")
+        self.assertEqual(["helene"], read_list)
+
     def test_read_list_unique(self):
         list_name = "input_file_name"
         with patch.object(codecs, "open", return_value=["item", "item"]) as _:
@@ -134,6 +213,54 @@ class TestUtilityMethods(unittest.TestCase):
             flattened,
         )
 
+    def test_flatten_text_repeated_tags(self):
+        text = "<INITIAL J <NAME Peeters>> en <NAME Peeters> en <INITIAL J <NAME Peeters>>"
+        flattened = utility.flatten_text(text)
+        self.assertEqual("<PERSON J Peeters> en <PERSON Peeters> en <PERSON J Peeters>", flattened)
+
+    def test_replace_tags(self):
+        text = "<A x <B y>> <B y> < <B y>"
+        replacements = {"<A x <B y>>": "<A x y>", "<B y>": "<B z>"}
+        self.assertEqual("<A x y> <B z> < <B z>", utility.replace_tags(text, replacements))
+
+    def test_sub_outside_tags(self):
+        texts = ["12 <DATE 12> 1234 <LOCATION a 34> 56", "<PERSON 12", "12> 34 <", "1<2>3"]
+
+        for text in texts:
+            self.assertEqual(
+                re.sub(r"(\d+)(?![^<]*>)", "<N \\1>", text),
+                utility.sub_outside_tags(r"(\d+)", "<N \\1>", text),
+            )
+
+    def test_sub_outside_tags_word_start(self):
+        pattern = r"([\w-]+(?:\.[\w-]+)*)@x\.be"
+        texts = ["a.b@x.be c-d@x.be", "a@x.bea.b@x.be", "a..b@x.be", "<URL a.b@x.be> e@x.be"]
+
+        for text in texts:
+            self.assertEqual(
+                re.sub(pattern + r"(?![^<]*>)", "<URL \\1>", text),
+                utility.sub_outside_tags(
+                    pattern, "<URL \\1>", text, word_start=r"(?<![\w-])(?<![\w-]\.)"
+                ),
+            )
+
+    def test_sub_at_word_starts(self):
+        pattern = r"(\d+)\s?rue"
+        texts = ["12 rue 34rue", "12rue34 rue", "1 2 rue", "rue 1rue"]
+
+        for text in texts:
+            self.assertEqual(
+                re.sub(pattern, "<A \\1>", text),
+                utility.sub_at_word_starts(pattern, "<A \\1>", text, word_start=r"(?<!\d)"),
+            )
+
+    def test_token_context(self):
+        tokens = tokenize_split("Jan , <PERSON Peeters> en 12 \n dr. <INITIAL J> Claes")
+        token_context = utility.TokenContext(tokens)
+
+        for index in range(len(tokens)):
+            self.assertEqual(utility.context(tokens, index), token_context(index))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,16 @@
 """ This module contains all kinds of utility functionality """
 
+import bisect
 import codecs
+import contextlib
+import functools
+import hashlib
 import os
 import re
+import threading
 import unicodedata
 from functools import reduce
+from itertools import accumulate
 
 
 class Annotation:
@@ -27,6 +33,79 @@ class Annotation:
         return self.tag + "[" + str(self.start_ix) + ":" + str(self.end_ix) + "]"
 
 
+class ReadWriteLock:
+    """
+    A lock that is held by any number of readers at once, or by a single writer. A waiting
+    writer blocks new readers, so that writers are not starved by a steady flow of readers.
+    Reading is reentrant: a thread that already holds the lock as a reader does not wait, and
+    only the outermost read synchronizes with the other threads.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writing = False
+        self._local = threading.local()
+
+    def _get_depth(self):
+        """The number of nested reads of the current thread, as a one-item list"""
+
+        depth = getattr(self._local, "depth", None)
+
+        if depth is None:
+            depth = self._local.depth = [0]
+
+        return depth
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Hold the lock as a reader"""
+
+        depth = self._get_depth()
+
+        if depth[0] == 0:
+            with self._condition:
+                while self._writing or self._writers_waiting:
+                    self._condition.wait()
+                self._readers += 1
+
+        depth[0] += 1
+
+        try:
+            yield
+        finally:
+            depth[0] -= 1
+
+            if depth[0] == 0:
+                with self._condition:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def writing(self):
+        """Hold the lock as the writer"""
+
+        # The writer would wait for its own read forever
+        if self._get_depth()[0]:
+            raise RuntimeError("Cannot hold the lock as the writer while holding it as a reader")
+
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
 def merge_triebased(tokens, trie):
     """
     This function merges all sublists of tokens that occur in the trie to one element
@@ -44,7 +123,7 @@ def merge_triebased(tokens, trie):
     while i < len(tokens):
 
         # Check for each item until the end if there are prefixes of the list in the Trie
-        prefix_matches = trie.find_all_prefixes(tokens[i:])
+        prefix_matches = trie.find_all_prefixes(tokens, i)
 
         # If no prefixes are in the Trie, append the first token and move to the next one
         if len(prefix_matches) == 0:
@@ -128,6 +207,150 @@ def context(tokens, i):
     return previous_token, previous_token_index, next_token, next_token_index
 
 
+def _ends_next_scan(token):
+    """Whether context() stops at this token when looking for the next token"""
+    return token[:1] in (")", "<") or token[:1].isalpha() or any_in_text(["\n", "\r", "\t"], token)
+
+
+def _ends_previous_scan(token):
+    """Whether context() stops at this token when looking for the previous token"""
+    return token[:1] in ("(", "<") or token[:1].isalpha() or any_in_text(["\n", "\r", "\t"], token)
+
+
+class TokenContext:
+    """
+    The context() of the positions in a list of tokens, in linear time. Calling context() for
+    every position takes quadratic time when few tokens start with an alpha character, as in
+    a table of numbers. The next tokens are indexed up front, and the previous tokens on
+    demand, in order, so a token can still be changed once all earlier positions are looked up.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+        # The position at which the scan for a next token from each position ends
+        self._next_ends = [len(tokens)] * (len(tokens) + 1)
+
+        for k in range(len(tokens) - 1, -1, -1):
+            self._next_ends[k] = k if _ends_next_scan(tokens[k]) else self._next_ends[k + 1]
+
+        # The position at which the scan for a previous token from each position ends
+        self._previous_ends = []
+
+    def __call__(self, i):
+        """The same 4-tuple as context(tokens, i)"""
+
+        tokens = self.tokens
+
+        k = self._next_ends[i + 1] if i + 1 < len(tokens) else i + 1
+        next_token = ""
+
+        if k < len(tokens) and tokens[k][0] != ")" and not any_in_text(["\n", "\r", "\t"], tokens[k]):
+            next_token = tokens[k]
+
+        while len(self._previous_ends) < i:
+            j = len(self._previous_ends)
+            self._previous_ends.append(
+                j if _ends_previous_scan(tokens[j]) else (self._previous_ends[j - 1] if j else -1)
+            )
+
+        k = self._previous_ends[i - 1] if i > 0 else i - 1
+        previous_token = ""
+
+        if k >= 0 and tokens[k][0] != "(" and not any_in_text(["\n", "\r", "\t"], tokens[k]):
+            previous_token = tokens[k]
+
+        return previous_token, k, next_token, self._next_ends[i + 1] if i + 1 < len(tokens) else i + 1
+
+
+# The number of positions after a match that are tried without the word_start lookbehind
+_WORD_START_REACH = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_sub(pattern, flags, word_start):
+    return (
+        re.compile(pattern, flags),
+        re.compile(pattern + r"(?![^<]*>)", flags),
+        re.compile(word_start + pattern, flags) if word_start else None,
+    )
+
+
+def _sub(pattern, repl, text, flags, outside_tags, word_start):
+    """See sub_outside_tags() and sub_at_word_starts()"""
+
+    plain, with_lookahead, guarded = _compile_sub(pattern, flags, word_start)
+
+    # The positions of the brackets, a match ends within a tag if the next one is a ">"
+    brackets = [match.start() for match in re.finditer("[<>]", text)] if outside_tags else []
+
+    def within_tag(position):
+        index = bisect.bisect_left(brackets, position)
+        return index < len(brackets) and text[brackets[index]] == ">"
+
+    parts = []
+    last_end = 0
+    position = 0
+
+    while position <= len(text):
+
+        # A match right after the previous match may start within a word, so the first
+        # positions are tried without the lookbehind
+        if guarded is not None and position < last_end + _WORD_START_REACH:
+            match = plain.match(text, position)
+
+            if match is None:
+                position += 1
+                continue
+
+        else:
+            match = (guarded or plain).search(text, position)
+
+            if match is None:
+                break
+
+        # The first match at this start does not pass the lookahead, but another one may
+        if outside_tags and within_tag(match.end()):
+            start = match.start()
+            match = with_lookahead.match(text, start)
+
+            if match is None:
+                position = start + 1
+                continue
+
+        parts.append(text[last_end : match.start()])
+        parts.append(repl(match) if callable(repl) else match.expand(repl))
+        last_end = match.end()
+        position = match.end() + (match.end() == match.start())
+
+    parts.append(text[last_end:])
+
+    return "".join(parts)
+
+
+def sub_outside_tags(pattern, repl, text, flags=0, word_start=None):
+    """
+    The same as re.sub(pattern + r"(?![^<]*>)", repl, text, flags=flags), which does not
+    replace matches that end within a tag, but in linear time. The lookahead scans up to the
+    next tag for every match, which takes quadratic time in a long text with few tags. Here,
+    a match of the pattern is only checked against the lookahead when it ends within a tag.
+    :param word_start: for a pattern that starts with a repeated character class, such as
+    [\\w-]+, a lookbehind that fails within a word, for example (?<![\\w-]). The pattern is
+    then only searched from the start of each word, instead of scanning the rest of the word
+    from every character. This requires that where the lookbehind fails, a match implies a
+    match that starts at most two characters earlier.
+    """
+    return _sub(pattern, repl, text, flags, True, word_start)
+
+
+def sub_at_word_starts(pattern, repl, text, word_start, flags=0):
+    """
+    The same as re.sub(pattern, repl, text, flags=flags), but only searching from the start
+    of each word, see the word_start parameter of sub_outside_tags()
+    """
+    return _sub(pattern, repl, text, flags, False, word_start)
+
+
 def is_initial(token):
     """
     Check if a token is an initial
@@ -138,21 +361,63 @@ def is_initial(token):
     return (len(token) == 1 and token[0].isupper()) or "INITI" in token
 
 
+def replace_tags(text, replacements):
+    """
+    Replace tags in a text by a dict of tags and replacements, in one pass. Where a tag in
+    the dict contains another tag in the dict, only the outer tag is replaced, which gives
+    the same result as replacing the tags one after the other, from longest to shortest.
+    """
+
+    if not replacements:
+        return text
+
+    # The position of the ">" that closes the tag opened by each "<"
+    closing_positions = {}
+    openings = []
+
+    for match in re.finditer("[<>]", text):
+        if match.group() == "<":
+            openings.append(match.start())
+        elif openings:
+            closing_positions[openings.pop()] = match.start()
+
+    tag_lengths = {len(tag) for tag in replacements}
+    parts = []
+    last_end = 0
+
+    for start in sorted(closing_positions):
+
+        end = closing_positions[start] + 1
+
+        if start < last_end or end - start not in tag_lengths:
+            continue
+
+        replacement = replacements.get(text[start:end])
+
+        if replacement is not None:
+            parts.append(text[last_end:start])
+            parts.append(replacement)
+            last_end = end
+
+    parts.append(text[last_end:])
+
+    return "".join(parts)
+
+
 def flatten_text_all_phi(text: str) -> str:
     """
     This is inspired by flatten_text, but works for all PHI categories
     :param text: the text in which you wish to flatten nested annotations
     :return: the text with nested annotations replaced by a single annotation with the outermost category
     """
-    to_flatten = find_tags(text)
-    to_flatten.sort(key=lambda x: -len(x))
+    replacements = {}
 
-    for tag in to_flatten:
+    for tag in find_tags(text):
         _, value = flatten(tag)
         outermost_category = parse_tag(tag)[0]
-        text = text.replace(tag, f"<{outermost_category} {value.strip()}>")
+        replacements[tag] = f"<{outermost_category} {value.strip()}>"
 
-    return text
+    return replace_tags(text, replacements)
 
 
 def flatten_text(text):
@@ -162,14 +427,13 @@ def flatten_text(text):
     has annotated person names, and not for other PHI categories!
     """
 
-    # Find all tags and sort them by length, so that the longest tags are flattened first
-    # This makes sure that the replacing the tag with the flattened equivalent never
-    # accidentally replaces a shorter tag, for example <NAME Surname> in the example.
-    to_flatten = find_tags(text)
-    to_flatten.sort(key=lambda x: -len(x))
+    # Find all tags and their flattened equivalents, which replace_tags() replaces in one
+    # pass. It never replaces a shorter tag within a longer tag, for example <NAME Surname>
+    # in the example.
+    replacements = {}
 
     # For each tag
-    for tag in to_flatten:
+    for tag in find_tags(text):
 
         # Use the flatten method to return a tuple of tagname and value
         tagname, value = flatten(tag)
@@ -182,7 +446,9 @@ def flatten_text(text):
             tagname = "PERSON"
 
         # Replace the found tag with the new, flattened tag
-        text = text.replace(tag, f"<{tagname} {value.strip()}>")
+        replacements[tag] = f"<{tagname} {value.strip()}>"
+
+    text = replace_tags(text, replacements)
 
     # Make sure adjacent tags are joined together (like <INITIAL A><PATIENT Surname>),
     # optionally with a whitespace, period, hyphen or comma between them.
@@ -197,16 +463,33 @@ def flatten_text(text):
     # Find all names of tags, to replace them with either "PATIENT" or "PERSON"
     tagnames = re.findall("<([A-Z]+)", text)
 
+    # The number of replacements that changed the text, and for each tag name the number at
+    # which replacing it last changed nothing, because then it changes nothing until the
+    # text changes. Each replacement scans the whole text, so this keeps the number of scans
+    # from growing with the number of tags.
+    num_changes = 0
+    unchanged_at = {}
+
     # Iterate over all tags
     for tag in tagnames:
 
         # If "PATIENT" is in any of them, they concern a patient
         if "PATIENT" in tag:
-            text = re.sub(tag, "PATIENT", text)
+            replacement = "PATIENT"
 
         # Otherwise, they concern a person
         else:
-            text = re.sub(tag, "PERSON", text)
+            replacement = "PERSON"
+
+        if tag == replacement or unchanged_at.get(tag) == num_changes:
+            continue
+
+        text, count = re.subn(tag, replacement, text)
+
+        if count:
+            num_changes += 1
+        else:
+            unchanged_at[tag] = num_changes
 
     # Return the text with all replacements
     return text
@@ -254,41 +537,64 @@ def flatten(tag):
     return tagname, tagvalue
 
 
-def find_tags(text):
-    """Finds and returns a list of all tags in a piece of text"""
+# The angle brackets that open and close tags
+BRACKET_PATTERN = re.compile("[<>]")
 
-    # Helper variables
-    nest_depth = 0
-    startpos = 0
+# A tag without brackets in its value
+FLAT_TAG_PATTERN = re.compile("<[^<>]*>")
+
+
+def bracket_depths(text):
+    """
+    Find the positions of the angle brackets in a text, and the nesting depth after each of
+    them, as two lists. The brackets are found by a regular expression and the depths by a
+    cumulative sum, so that no loop over the characters of the text runs in Python.
+    """
+
+    positions = [match.start() for match in BRACKET_PATTERN.finditer(text)]
+    depths = list(accumulate(1 if text[position] == "<" else -1 for position in positions))
+
+    return positions, depths
 
-    # Return this list
-    toflatten = []
 
-    # Iterate over all characters
-    for index, _ in enumerate(text):
+def tag_spans(text):
+    """
+    Find the (start, end) of the tags in a text that are not nested in another tag. A tag
+    starts at a "<" at depth 0 and ends after the ">" that brings the depth back to 0. The
+    end is None for a last tag that is never closed.
+    """
+
+    # Most texts have no nested tags, so that all brackets are in tags without brackets in
+    # their value
+    spans = [match.span() for match in FLAT_TAG_PATTERN.finditer(text)]
 
-        # If an opening hook is encountered
-        if text[index] == "<":
+    if 2 * len(spans) == text.count("<") + text.count(">"):
+        return spans
 
-            # If the tag is not nested, new startposition
-            if nest_depth == 0:
-                startpos = index
+    spans = []
+    start = None
+    depth = 0
 
-            # Increase nest_depth
-            nest_depth += 1
+    for position, next_depth in zip(*bracket_depths(text)):
 
-        # If an closing hook is encountered
-        if text[index] == ">":
+        if depth == 0 and next_depth == 1:
+            start = position
 
-            # Always decrease nest_depth
-            nest_depth -= 1
+        elif depth == 1 and next_depth == 0:
+            spans.append((start, position + 1))
+            start = None
 
-            # If the tag was not nested, add the tag to the return list
-            if nest_depth == 0:
-                toflatten.append(text[startpos : index + 1])
+        depth = next_depth
 
-    # Return list
-    return toflatten
+    if start is not None:
+        spans.append((start, None))
+
+    return spans
+
+
+def find_tags(text):
+    """Finds and returns a list of all tags in a piece of text"""
+    return [text[start:end] for start, end in tag_spans(text) if end is not None]
 
 
 def split_tags(text):
@@ -299,43 +605,95 @@ def split_tags(text):
     but is more appropriately used in the value part of nested tags
     """
 
-    # Helper variables
-    nest_depth = 0
-    startpos = 0
-
     # Return this list
     splitbytags = []
+    last_end = 0
 
-    # Iterate over all characters
-    for index, _ in enumerate(text):
+    # Split before and after each tag
+    for start, end in tag_spans(text):
+        splitbytags.append(text[last_end:start])
+        splitbytags.append(text[start:end])
+        last_end = len(text) if end is None else end
 
-        # If an opening hook is encountered
-        if text[index] == "<":
+    # Append the last characters
+    splitbytags.append(text[last_end:])
 
-            # Split if the tag is not nested
-            if nest_depth == 0:
-                splitbytags.append(text[startpos:index])
-                startpos = index
+    # Filter empty elements in the list (happens for example when <tag><tag> occurs)
+    return [x for x in splitbytags if len(x) > 0]
 
-            # Increase the nest_depth
-            nest_depth += 1
 
-        # If a closing hook is encountered
-        if text[index] == ">":
+PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
 
-            # First decrease the nest_depth
-            nest_depth -= 1
 
-            # Split if the tag was not nested
-            if nest_depth == 0:
-                splitbytags.append(text[startpos : index + 1])
-                startpos = index + 1
+def iter_paragraph_bounds(text, skip_tags=True):
+    """
+    Iterate over the (start, end) of the segments of a text, split at blank lines, where each
+    segment starts with the blank lines that precede it. With skip_tags, blank lines inside
+    a tag never split the text.
+    """
 
-    # Append the last characters
-    splitbytags.append(text[startpos:])
+    last_split = 0
+    last_count = 0
+    nest_depth = 0
 
-    # Filter empty elements in the list (happens for example when <tag><tag> occurs)
-    return [x for x in splitbytags if len(x) > 0]
+    for separator in PARAGRAPH_SEPARATOR.finditer(text):
+
+        # Keep track of how deep in tags the separator is
+        if skip_tags:
+            nest_depth += text.count("<", last_count, separator.start())
+            nest_depth -= text.count(">", last_count, separator.start())
+            last_count = separator.start()
+
+        if nest_depth == 0 and separator.start() > last_split:
+            yield last_split, separator.start()
+            last_split = separator.start()
+
+    yield last_split, len(text)
+
+
+def split_paragraphs(text):
+    """
+    Split a text into segments at blank lines (see iter_paragraph_bounds()), so that
+    "".join(split_paragraphs(text)) == text
+    """
+    return [text[start:end] for start, end in iter_paragraph_bounds(text)]
+
+
+def common_prefix_length(first, second, block_size=4096):
+    """The length of the common prefix of two strings, comparing blocks of characters at once"""
+
+    length = min(len(first), len(second))
+    index = 0
+
+    # Skip equal blocks, then find the first difference within the next block
+    while index < length and first[index : index + block_size] == second[index : index + block_size]:
+        index += block_size
+
+    while index < length and first[index] == second[index]:
+        index += 1
+
+    return min(index, length)
+
+
+def common_suffix_length(first, second, block_size=4096):
+    """The length of the common suffix of two strings, comparing blocks of characters at once"""
+
+    length = min(len(first), len(second))
+    first_end = len(first)
+    second_end = len(second)
+    index = 0
+
+    while (
+        index < length
+        and first[max(first_end - index - block_size, 0) : first_end - index]
+        == second[max(second_end - index - block_size, 0) : second_end - index]
+    ):
+        index += block_size
+
+    while index < length and first[first_end - index - 1] == second[second_end - index - 1]:
+        index += 1
+
+    return min(index, length)
 
 
 def get_data(path):
@@ -343,6 +701,57 @@ def get_data(path):
     return os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", path)
 
 
+def get_data_version():
+    """Compute a version string that changes whenever the content of the data files changes"""
+
+    digest = hashlib.sha1()
+    data_dir = get_data("")
+
+    for file_name in sorted(os.listdir(data_dir)):
+        digest.update(file_name.encode("utf-8"))
+
+        with open(os.path.join(data_dir, file_name), "rb") as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()[:12]
+
+
+def _get_fold_table():
+    """
+    The translation table of fold(), which maps the accented Latin letters to the letters
+    without accents, and removes combining accents
+    """
+
+    table = {}
+
+    for code_point in range(0x00C0, 0x0250):
+        character = chr(code_point)
+        stripped = "".join(
+            part
+            for part in unicodedata.normalize("NFKD", character)
+            if not unicodedata.combining(part)
+        )
+
+        if stripped and stripped != character:
+            table[code_point] = stripped
+
+    for code_point in range(0x0300, 0x0370):
+        table[code_point] = None
+
+    return table
+
+
+FOLD_TABLE = _get_fold_table()
+
+
+def fold(text):
+    """
+    Fold a text for matching against the lexicons, which store their entries folded: the
+    casefolded text without accents, so that Hélène, HELENE and helene are the same
+    """
+    return text.casefold().translate(FOLD_TABLE)
+
+
 def _normalize_value(line):
     """Removes all non-ascii characters from a string"""
     line = str(bytes(line, encoding="ascii", errors="ignore"), encoding="ascii")
@@ -358,12 +767,17 @@ def read_list(
     normalize=None,
     unique=True,
 ):
-    """Read a list from file and return the values."""
+    """
+    Read a list from file and return the values. With normalize="ascii", non-ascii characters
+    are removed, and with normalize="fold", the values are folded (see fold()).
+    """
 
     data = codecs.open(get_data(list_name), encoding=encoding)
 
     if normalize == "ascii":
         data = [_normalize_value(line) for line in data]
+    elif normalize == "fold":
+        data = [fold(line) for line in data]
 
     if lower:
         data = [line.lower() for line in data]
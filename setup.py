@@ -46,5 +46,8 @@ setup(
     # What does your project relate to?
     keywords='de-identification',
 
-    install_requires=['nltk'],
+    install_requires=[],
+
+    # Optional dependencies for deduce.batch
+    extras_require={'batch': ['pandas', 'pyarrow']},
 )